@@ -8,25 +8,34 @@ from django.forms.widgets import SelectDateWidget
 from .models import Project, Asset, Category, Task, Skill, Stakeholder, Risk, Assumption, Issue, Dependency, Attachment
 from .widgets import DurationPickerWidget  # Import the custom widget
 from django.db.models.functions import Coalesce, Concat
+from .utils.dependency_helpers import get_task_graph, would_create_cycle
 
 # Helper Functions
 
 def has_circular_dependency(task, prereq_task):
     """
     Checks if adding the given prereq_task would create a circular dependency.
+    The chain is followed through the project's cached prerequisite graph rather than one query per task.
     """
-    visited = set()
-    current = prereq_task
-
-    while current is not None:
-        if current == task:
-            return True
-        if current.id in visited:
-            break  # To avoid being stuck in an infinite loop
-        visited.add(current.id)
-        current = current.prereq_task
-
-    return False
+    if task.pk is None:
+        return False  # A new task cannot be anywhere in an existing chain
+    return would_create_cycle(get_task_graph(prereq_task.project_id), task.pk, prereq_task.pk)
+
+def prereq_task_choices(project, exclude=None):
+    """ Builds the prerequisite task choices for a project, with the dates of each task, from one values query """
+    tasks = Task.objects.filter(project=project)
+    if exclude is not None:
+        tasks = tasks.exclude(pk=exclude)
+    rows = tasks.annotate(
+        annotated_start_date=Coalesce('actual_start_date', 'planned_start_date'),
+        annotated_end_date=Coalesce('actual_end_date', 'planned_end_date')
+    ).values_list('id', 'task_name', 'annotated_start_date', 'annotated_end_date')
+
+    # Show the dates of each prerequisite task with its name
+    return [('', '---------')] + [
+        (task_id, f"{task_name} (Start: {start_date.strftime('%d/%m/%Y') if start_date else 'N/A'}, End: {end_date.strftime('%d/%m/%Y') if end_date else 'N/A'})")
+        for task_id, task_name, start_date, end_date in rows
+    ]
 
 
 # Form for New Project Creation
@@ -219,19 +228,8 @@ class CreateTaskForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if self.project:
-            # Annotate tasks with display_start_date and display_end_date
-            tasks_queryset = Task.objects.filter(project=self.project).annotate(
-                annotated_start_date=Coalesce('actual_start_date', 'planned_start_date'),
-                annotated_end_date=Coalesce('actual_end_date', 'planned_end_date')
-            )
-            
             # Update the display of the prerequisite tasks to include the dates
-            choices = [
-                (task.id, f"{task.task_name} (Start: {task.annotated_start_date.strftime('%d/%m/%Y') if task.annotated_start_date else 'N/A'}, End: {task.annotated_end_date.strftime('%d/%m/%Y') if task.annotated_end_date else 'N/A'})")
-                for task in tasks_queryset
-            ]
-
-            self.fields['prereq_task'].choices = [('', '---------')] + choices
+            self.fields['prereq_task'].choices = prereq_task_choices(self.project)
 
         # Crispy forms configuration
         self.helper = FormHelper()
@@ -318,19 +316,8 @@ class EditTaskForm(forms.ModelForm):
         self.fields['assigned_to'].empty_label = "Unassigned"
 
         if self.project:
-            # Annotate tasks with display_start_date and display_end_date
-            tasks_queryset = Task.objects.filter(project=self.project).exclude(pk=self.instance.pk).annotate(
-                annotated_start_date=Coalesce('actual_start_date', 'planned_start_date'),
-                annotated_end_date=Coalesce('actual_end_date', 'planned_end_date')
-            )
-            
             # Update the display of the prerequisite tasks to include the dates
-            choices = [
-                (task.id, f"{task.task_name} (Start: {task.annotated_start_date.strftime('%d/%m/%Y') if task.annotated_start_date else 'N/A'}, End: {task.annotated_end_date.strftime('%d/%m/%Y') if task.annotated_end_date else 'N/A'})")
-                for task in tasks_queryset
-            ]
-
-            self.fields['prereq_task'].choices = [('', '---------')] + choices
+            self.fields['prereq_task'].choices = prereq_task_choices(self.project, exclude=self.instance.pk)
 
         # Crispy forms configuration
         self.helper = FormHelper()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from application.models import Asset, Project, Task
+from application.utils.assignment_helpers import assign_unassigned_tasks
+
+class Command(BaseCommand):
+    help = (
+        'Assigns unassigned tasks to the best matching assets - on the given projects, or on every open project - '
+        'scoring each asset on skills, free time in the task window and current assigned tasks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects', help='Project ID to assign tasks on (can be repeated).')
+        parser.add_argument('--dry-run', action='store_true', help='Only show the assignments, do not save them.')
+
+    def handle(self, *args, **options):
+        project_ids = options['projects']
+        if project_ids:
+            missing = set(project_ids) - set(Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Project(s) {', '.join(str(pk) for pk in sorted(missing))} do not exist.")
+
+        dry_run = options['dry_run']
+        plan = assign_unassigned_tasks(project_ids, dry_run=dry_run)
+
+        if options['verbosity'] > 1:
+            tasks = dict(Task.objects.filter(pk__in=[task_id for task_id, asset_id in plan]).values_list('pk', 'task_name'))
+            assets = dict(Asset.objects.values_list('pk', 'name'))
+            for task_id, asset_id in plan:
+                self.stdout.write(f"{tasks.get(task_id)} (ID {task_id}): {assets.get(asset_id, 'no suitable asset')}")
+
+        assigned = sum(1 for task_id, asset_id in plan if asset_id is not None)
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"{assigned} of {len(plan)} unassigned task(s) would be assigned (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{assigned} of {len(plan)} unassigned task(s) assigned."))
@@ -0,0 +1,122 @@
+import asyncio
+import random
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from application.models import Skill
+
+class Command(BaseCommand):
+    help = (
+        'Load tests the async calendar and asset filter endpoints through the ASGI application, in this process. '
+        'The same requests are made one at a time and then all at once, to show how well they overlap. '
+        'Every query is held up by --db-latency, as if the database were across a network - against a local '
+        'SQLite file there is nothing to wait on, so nothing to overlap. Needs some skills - see generate_load_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests in each run, half of each kind (default: 500).')
+        parser.add_argument('--db-latency', type=float, default=5.0, help='Milliseconds added to every query (default: 5).')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the calendar windows and skills (default: 1).')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+        skill_ids = list(Skill.objects.values_list('pk', flat=True)[:50])
+        if not skill_ids:
+            raise CommandError('There are no skills to filter on - load some data first.')
+
+        # A throwaway user, logged in with a session like a browser's
+        user = User.objects.create_user(username=f'asgi_benchmark_{random.getrandbits(32):08x}')
+        try:
+            client = Client()
+            client.force_login(user)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+            paths = self.build_paths(options['requests'], skill_ids, options['seed'])
+
+            # Each request's queries run on a thread of its own, with a connection of its own
+            def add_latency(sender, connection, **kwargs):
+                connection.execute_wrappers.append(self.delay(options['db_latency'] / 1000))
+            connection_created.connect(add_latency)
+            try:
+                asyncio.run(self.run(paths, cookie))
+            finally:
+                connection_created.disconnect(add_latency)
+            client.logout()
+        finally:
+            user.delete()
+
+    @staticmethod
+    def delay(seconds):
+        """ A database execute wrapper that waits before each query, as a round trip to a database server would """
+        def wrapper(execute, sql, params, many, context):
+            time.sleep(seconds)
+            return execute(sql, params, many, context)
+        return wrapper
+
+    def build_paths(self, count, skill_ids, seed):
+        """ Calendar windows a month long somewhere in the year, and asset filters on one to three skills """
+        rng = random.Random(seed)
+        paths = []
+        for number in range(count):
+            if number % 2:
+                start = date.today().replace(day=1) + timedelta(days=rng.randint(-180, 180))
+                query = {'start': start.isoformat(), 'end': (start + timedelta(days=42)).isoformat()}
+                paths.append(f"{reverse('project_events')}?{urlencode(query)}")
+            else:
+                skills = rng.sample(skill_ids, min(len(skill_ids), rng.randint(1, 3)))
+                paths.append(f"{reverse('filter_assets_by_skills')}?{urlencode({'skills[]': skills}, doseq=True)}")
+        return paths
+
+    async def run(self, paths, cookie):
+        application = get_asgi_application()
+        await self.request(application, paths[0], cookie)  # Loads the middleware and warms the caches
+
+        start = time.perf_counter()
+        timings = [await self.request(application, path, cookie) for path in paths]
+        sequential = time.perf_counter() - start
+        self.report('one at a time', sequential, timings)
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(self.request(application, path, cookie) for path in paths))
+        concurrent = time.perf_counter() - start
+        self.report(f'{len(paths)} at once', concurrent, timings)
+
+        self.stdout.write(self.style.SUCCESS(f"All at once took {concurrent / sequential:.0%} of the time of one at a time."))
+
+    async def request(self, application, path, cookie):
+        """ Sends one GET through the ASGI application and returns how long it took, raising on an error status """
+        url_path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'https', 'path': url_path, 'raw_path': url_path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'headers': [(b'host', settings.ALLOWED_HOSTS[0].encode()), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': (settings.ALLOWED_HOSTS[0], 443),
+        }
+        start = time.perf_counter()
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({'type': 'http.request', 'body': b'', 'more_body': False})
+        response = await communicator.receive_output(timeout=60)
+        more_body = True
+        while more_body:
+            more_body = (await communicator.receive_output(timeout=60)).get('more_body', False)
+        await communicator.wait()
+        if response['status'] != 200:
+            raise CommandError(f"{path} returned {response['status']}.")
+        return time.perf_counter() - start
+
+    def report(self, label, elapsed, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f"  {label}: {elapsed:.2f}s, {len(timings) / elapsed:.0f} requests/s, "
+            f"median {timings[len(timings) // 2] * 1000:.1f}ms, 95th percentile {timings[int(len(timings) * 0.95)] * 1000:.1f}ms"
+        )
@@ -0,0 +1,60 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from application.models import Project
+from application.utils.schedule_helpers import compute_schedule, critical_path, load_schedule_graph, topological_order
+
+class Command(BaseCommand):
+    help = (
+        'Times the schedule engine (topological sort, forward/backward pass and critical path) on a synthetic '
+        'task graph held in memory, or on a real project with --project.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100000, help='Number of tasks in the synthetic graph (default: 100000).')
+        parser.add_argument('--dependent-ratio', type=float, default=0.8, help='Share of tasks that have a prerequisite (default: 0.8).')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs to time - the best is reported (default: 3).')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic graph (default: 1).')
+        parser.add_argument('--project', type=int, help='Benchmark a project from the database instead, including loading it.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+
+        if options['project'] is not None:
+            if not Project.objects.filter(pk=options['project']).exists():
+                raise CommandError(f"Project {options['project']} does not exist.")
+            self.report('load', options['repeat'], lambda: load_schedule_graph(options['project']))
+            graph = load_schedule_graph(options['project'])
+        else:
+            graph = self.build_graph(options['tasks'], options['dependent_ratio'], options['seed'])
+
+        self.stdout.write(f"{len(graph)} tasks, {sum(1 for task in graph.values() if task['prereq_task_id'] in graph)} with a prerequisite")
+        self.report('topological sort', options['repeat'], lambda: topological_order(graph))
+        schedule = self.report('schedule', options['repeat'], lambda: compute_schedule(graph))
+        path = self.report('critical path', options['repeat'], lambda: critical_path(schedule, graph))
+        self.stdout.write(self.style.SUCCESS(f"{len(schedule)} tasks scheduled, {len(path)} on the critical path."))
+
+    def build_graph(self, size, dependent_ratio, seed):
+        """ A random forest in the same shape load_schedule_graph() returns - each task may depend on any earlier one """
+        rng = random.Random(seed)
+        today = date.today()
+        graph = {}
+        for task_id in range(1, size + 1):
+            start = today + timedelta(days=rng.randint(0, 365))
+            prereq_task_id = rng.randint(1, task_id - 1) if task_id > 1 and rng.random() < dependent_ratio else None
+            graph[task_id] = {'start': start, 'end': start + timedelta(days=rng.randint(0, 20)), 'prereq_task_id': prereq_task_id}
+        return graph
+
+    def report(self, label, repeat, run):
+        """ Runs a step repeat times, writes the best time and returns the last result """
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(f"  {label}: {min(timings) * 1000:.1f}ms")
+        return result
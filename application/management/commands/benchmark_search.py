@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from application.models import SearchDocument
+from application.utils.search_helpers import DOCUMENT_TYPES, search
+
+# Words the synthetic documents are made from, followed by a long tail of made-up ones. Earlier words are
+# used far more often (a Zipf distribution, as in real text), so the first are in almost every document.
+COMMON_WORDS = (
+    'project task risk issue delivery budget schedule supplier contract review design testing release '
+    'migration server network database licence training workshop stakeholder approval milestone vendor '
+    'security audit backlog estimate resource capacity deadline invoice procurement warranty outage '
+    'firewall upgrade rollout pilot handover documentation governance escalation mitigation dependency'
+).split()
+VOCABULARY = COMMON_WORDS + [f'{word}{number}' for number in range(1, 100) for word in COMMON_WORDS]
+
+class Command(BaseCommand):
+    help = (
+        'Times full-text searches against synthetic search documents added to the database. The documents are '
+        'added in a transaction that is rolled back afterwards, so nothing is kept. Only meaningful on SQLite, '
+        'as SQL Server fills its full-text index in the background.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=100000, help='Number of synthetic documents (default: 100000).')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each search to time - the best is reported (default: 5).')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the synthetic documents (default: 1).')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING('Full-text indexes are filled in the background on this database - timings may be misleading.'))
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            self.add_documents(options['documents'], options['seed'])
+            self.stdout.write(f"{options['documents']} documents indexed in {time.perf_counter() - start:.1f}s")
+
+            searches = [
+                ('common word', VOCABULARY[0], None),
+                ('uncommon word', VOCABULARY[500], None),
+                ('rare word', VOCABULARY[-1], None),
+                ('two words', f'{VOCABULARY[1]} {VOCABULARY[5]}', None),
+                ('partly typed word', VOCABULARY[0][:3], None),
+                ('one type', VOCABULARY[0], ['task']),
+                ('later page', VOCABULARY[0], None, 200),
+            ]
+            for label, query, doc_types, *offset in searches:
+                found = self.report(label, options['repeat'], lambda: search(query, doc_types, offset=offset[0] if offset else 0))
+                self.stdout.write(f"    {found['total']} matches")
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark documents rolled back.'))
+
+    def add_documents(self, count, seed, batch_size=5000):
+        rng = random.Random(seed)
+        weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+        documents = []
+        for number in range(count):
+            words = rng.choices(VOCABULARY, weights, k=rng.randint(5, 80))
+            documents.append(SearchDocument(
+                doc_type=rng.choice(DOCUMENT_TYPES), object_id=number + 1_000_000_000,  # Clear of real ids
+                title=' '.join(words[:6]), body=' '.join(words), url='/',
+            ))
+            if len(documents) >= batch_size:
+                SearchDocument.objects.bulk_create(documents)
+                documents = []
+        SearchDocument.objects.bulk_create(documents)
+
+    def report(self, label, repeat, run):
+        """ Runs a search repeat times, writes the best time and returns the last result """
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(f"  {label}: {min(timings) * 1000:.1f}ms")
+        return result
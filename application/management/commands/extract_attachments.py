@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from application.models import Attachment, AttachmentText, Project
+from application.utils.attachment_helpers import queue_extraction, wait_for_extractions
+
+class Command(BaseCommand):
+    help = (
+        'Extracts the preview text of attachments whose current file has not been extracted yet, or whose '
+        'extraction was lost while pending - on the given projects, or on every project - using the extraction worker pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects', help='Project ID to extract attachments on (can be repeated).')
+        parser.add_argument('--force', action='store_true', help='Extract the text again even when the file has not changed.')
+
+    def handle(self, *args, **options):
+        project_ids = options['projects']
+        attachments = Attachment.objects.all()
+        if project_ids:
+            missing = set(project_ids) - set(Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Project(s) {', '.join(str(pk) for pk in sorted(missing))} do not exist.")
+            attachments = attachments.filter(project_id__in=project_ids)
+
+        extractions = [queue_extraction(attachment, force=options['force']) for attachment in attachments.iterator()]
+        wait_for_extractions()
+
+        # Count from the rows, as the workers have saved them since they were queued
+        extracted = AttachmentText.objects.filter(pk__in=[extraction.pk for extraction in extractions], status=2).count()  # Extracted
+        self.stdout.write(self.style.SUCCESS(f"{extracted} of {len(extractions)} attachment(s) have extracted text."))
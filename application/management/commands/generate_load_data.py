@@ -0,0 +1,261 @@
+import random
+from datetime import date, timedelta
+
+import factory.random
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
+
+from application.factories import (
+    AssetFactory, AssumptionFactory, CategoryFactory, CommentFactory, DependencyFactory, IssueFactory,
+    ProjectFactory, RiskFactory, SkillFactory, StakeholderFactory, TaskFactory, TeamFactory, UserFactory
+)
+from application.models import Asset, Assumption, Category, Comment, DayOfWeek, Dependency, Issue, Project, Risk, Skill, Stakeholder, Task, Team
+from application.utils.conflict_helpers import rebuild_task_conflicts
+from application.utils.dashboard_helpers import invalidate_dashboard_stats
+from application.utils.rollup_helpers import rebuild_rollups
+from application.utils.search_helpers import rebuild_search_index
+
+# Dataset sizes everyone can benchmark against - large is 2,000 projects x 500 tasks = 1M tasks
+PRESETS = {
+    'small': {'projects': 10, 'tasks_per_project': 20, 'assets': 20, 'skills': 10, 'teams': 3},
+    'medium': {'projects': 200, 'tasks_per_project': 50, 'assets': 150, 'skills': 40, 'teams': 10},
+    'large': {'projects': 2000, 'tasks_per_project': 500, 'assets': 600, 'skills': 80, 'teams': 25},
+}
+
+PROJECTS_PER_CHUNK = 50  # Projects (and all their tasks and RAID items) written per transaction
+MAX_CHAIN_LENGTH = 5  # Longest prerequisite chain within a project
+LOAD_USERS = 5
+TASK_DETAILS_POOL = 500  # Different task descriptions generated by the factory and reused across all tasks
+
+class Command(BaseCommand):
+    help = (
+        'Generates a reproducible synthetic dataset for benchmarking - projects, tasks with prerequisite chains, '
+        'assets with skills, teams and work days, RAID items, comments and history rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=PRESETS, default='small', help='Dataset size to generate (default: small).')
+        parser.add_argument('--projects', type=int, help='Number of projects, overriding the preset.')
+        parser.add_argument('--tasks-per-project', type=int, help='Number of tasks per project, overriding the preset.')
+        parser.add_argument('--assets', type=int, help='Number of assets, overriding the preset.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed - the same seed always gives the same data (default: 1).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT (default: 1000).')
+
+    def handle(self, *args, **options):
+        sizes = dict(PRESETS[options['preset']])
+        for key in ('projects', 'tasks_per_project', 'assets'):
+            if options[key] is not None:
+                sizes[key] = options[key]
+
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.prefix = f'Load{self.seed}'
+        if Project.all_objects.filter(project_name=f'{self.prefix} Project 0').exists():
+            raise CommandError(f'Load data for seed {self.seed} already exists - use a different --seed.')
+
+        # Seeds factory_boy and Faker, so the generated text is the same on every run
+        factory.random.reseed_random(self.seed)
+        self.rng = random.Random(self.seed)
+        self.today = date.today()
+
+        self.stdout.write(
+            f"Generating {sizes['projects']} projects x {sizes['tasks_per_project']} tasks, "
+            f"{sizes['assets']} assets (seed {self.seed})..."
+        )
+        with transaction.atomic():
+            self.users = self.create_users()
+            self.categories = self.create_lookup(Category, 'category_name', CategoryFactory, 5)
+            self.skills = self.create_lookup(Skill, 'skill_name', SkillFactory, sizes['skills'])
+            self.teams = self.create_lookup(Team, 'team_name', TeamFactory, sizes['teams'])
+            self.assets = self.create_assets(sizes['assets'])
+        self.task_details = [TaskFactory.build(assigned_to=None).task_details for _ in range(TASK_DETAILS_POOL)]
+
+        task_count = 0
+        for start in range(0, sizes['projects'], PROJECTS_PER_CHUNK):
+            end = min(start + PROJECTS_PER_CHUNK, sizes['projects'])
+            with transaction.atomic():
+                task_count += self.create_projects(range(start, end), sizes['tasks_per_project'])
+            self.stdout.write(f'  {end} projects, {task_count} tasks')
+
+        # bulk_create skips the signals, so the derived tables are rebuilt in one pass at the end
+        self.stdout.write('Rebuilding project rollups, task conflicts and the search index...')
+        rebuild_rollups(fix=True)
+        conflicts = rebuild_task_conflicts()
+        rebuild_search_index()
+        invalidate_dashboard_stats()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {sizes['projects']} projects, {task_count} tasks and {len(self.assets)} assets "
+            f"({conflicts} task conflicts)."
+        ))
+
+    def create_users(self):
+        users = []
+        for i in range(LOAD_USERS):
+            username = f'{self.prefix.lower()}_user{i}'
+            user = User.objects.filter(username=username).first() or UserFactory(username=username, password=None)  # No password, so nobody can log in as them
+            users.append(user)
+        return users
+
+    def create_lookup(self, model, name_field, factory_class, count):
+        """ Creates `count` rows of a table with a unique name, returning them with primary keys """
+        names = [f'{self.prefix} {model.__name__} {i}' for i in range(count)]
+        objs = [factory_class.build(**{name_field: name}) for name in names]
+        bulk_create_with_history(objs, model, batch_size=self.batch_size)
+        return list(model.objects.filter(**{f'{name_field}__in': names}))
+
+    def create_assets(self, count):
+        work_days = list(DayOfWeek.objects.filter(day_name__in=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']))
+        names = [f'{self.prefix} Asset {i}' for i in range(count)]
+        objs = [
+            AssetFactory.build(name=name, normal_work_week=self.rng.choice([20, 30, 37, 40]))
+            for name in names
+        ]
+        bulk_create_with_history(objs, Asset, batch_size=self.batch_size)
+        assets = list(Asset.objects.filter(name__in=names).order_by('asset_id'))
+
+        # Many to many rows are written straight into the through tables in batches
+        skill_rows, team_rows, day_rows = [], [], []
+        for asset in assets:
+            for skill in self.rng.sample(self.skills, min(len(self.skills), self.rng.randint(1, 4))):
+                skill_rows.append(Asset.skills.through(asset_id=asset.pk, skill_id=skill.pk))
+            if self.teams:
+                team_rows.append(Asset.teams.through(asset_id=asset.pk, team_id=self.rng.choice(self.teams).pk))
+            days = work_days if self.rng.random() < 0.8 else work_days[:self.rng.randint(1, len(work_days))]
+            for day in days:
+                day_rows.append(Asset.work_days.through(asset_id=asset.pk, dayofweek_id=day.pk))
+        Asset.skills.through.objects.bulk_create(skill_rows, batch_size=self.batch_size)
+        Asset.teams.through.objects.bulk_create(team_rows, batch_size=self.batch_size)
+        Asset.work_days.through.objects.bulk_create(day_rows, batch_size=self.batch_size)
+        return assets
+
+    def create_projects(self, numbers, tasks_per_project):
+        """ Creates one chunk of projects with their tasks, RAID items and comments. Returns the number of tasks. """
+        rng = self.rng
+        names = [f'{self.prefix} Project {n}' for n in numbers]
+        projects = []
+        for name in names:
+            start_date = self.today + timedelta(days=rng.randint(-365, 180))
+            status = rng.choices([1, 3, 4, 5, 6, 7], weights=[2, 6, 1, 1, 1, 3])[0]
+            projects.append(ProjectFactory.build(
+                project_name=name,
+                project_owner=rng.choice(self.assets),
+                category=rng.choice(self.categories),
+                project_status=status,
+                priority=rng.randint(1, 5),
+                planned_start_date=start_date,
+                original_target_end_date=start_date + timedelta(days=rng.randint(30, 365)),
+                actual_start_date=start_date if start_date <= self.today else None,
+            ))
+        bulk_create_with_history(projects, Project, batch_size=self.batch_size)
+        projects = list(Project.objects.filter(project_name__in=names).order_by('id'))
+
+        # Tasks are built in order, each chained to the one before it some of the time, and usually
+        # planned to start after it ends - the rest are the scheduling conflicts real projects have
+        tasks = []
+        chained = []  # Indexes into tasks of the tasks that have the previous task as a prerequisite
+        for project in projects:
+            previous = None
+            chain_length = 0
+            for n in range(tasks_per_project):
+                if previous is not None and chain_length < MAX_CHAIN_LENGTH and rng.random() < 0.6:
+                    chain_length += 1
+                    chained.append(len(tasks))
+                    earliest_start = previous.planned_end_date + timedelta(days=rng.randint(-3, 5) if rng.random() < 0.1 else rng.randint(1, 5))
+                else:
+                    chain_length = 0
+                    earliest_start = None
+                previous = self.build_task(project, n, earliest_start)
+                tasks.append(previous)
+        tasks = bulk_create_with_history(tasks, Task, batch_size=self.batch_size)
+
+        # Link up the prerequisite chains, now the tasks have primary keys
+        for index in chained:
+            tasks[index].prereq_task_id = tasks[index - 1].pk
+        Task.objects.bulk_update([tasks[index] for index in chained], ['prereq_task'], batch_size=self.batch_size)
+
+        skill_rows = [
+            Task.skills_required.through(task_id=task.pk, skill_id=skill.pk)
+            for task in tasks
+            for skill in rng.sample(self.skills, min(len(self.skills), rng.randint(1, 2)))
+        ]
+        Task.skills_required.through.objects.bulk_create(skill_rows, batch_size=self.batch_size)
+
+        self.create_raid_items(projects)
+        self.create_comments(projects, tasks)
+        return len(tasks)
+
+    def build_task(self, project, number, start_date=None):
+        rng = self.rng
+        start_date = start_date or project.planned_start_date + timedelta(days=rng.randint(0, 120))
+        end_date = start_date + timedelta(days=rng.randint(1, 20))
+        assigned_to = rng.choice(self.assets) if rng.random() < 0.8 else None
+        # bulk_create skips Task.save(), so the status is set here to match the assignment
+        if assigned_to is None:
+            status = 1  # Unassigned
+        elif end_date < self.today and rng.random() < 0.8:
+            status = 3  # Completed
+        else:
+            status = 2  # Assigned
+        completed = status == 3
+        # Tasks are by far the biggest table, so they are made directly rather than through the factory,
+        # using task details text the factory generated up front
+        return Task(
+            task_name=f'{project.project_name[-30:]} Task {number}',
+            task_details=rng.choice(self.task_details),
+            project=project,
+            task_status=status,
+            priority=rng.randint(1, 5),
+            planned_start_date=start_date,
+            planned_end_date=end_date,
+            due_date=end_date + timedelta(days=rng.randint(0, 5)),
+            actual_start_date=start_date if completed else None,
+            actual_end_date=end_date + timedelta(days=rng.randint(-1, 3)) if completed else None,
+            estimated_time_to_complete=timedelta(hours=rng.randint(1, 40)),
+            actual_time_to_complete=timedelta(hours=rng.randint(1, 50)) if completed else None,
+            assigned_to=assigned_to,
+            delay_reason='',
+        )
+
+    def create_raid_items(self, projects):
+        rng = self.rng
+        risks, assumptions, issues, dependencies, stakeholders = [], [], [], [], []
+        for project in projects:
+            for _ in range(rng.randint(0, 4)):
+                impact, probability = rng.randint(1, 5), rng.randint(1, 5)
+                # Risk.save() works out the score, but bulk_create does not call it
+                risks.append(RiskFactory.build(
+                    project=project, created_by=rng.choice(self.users),
+                    impact=impact, probability=probability, risk_score=impact * probability, status=rng.randint(1, 3),
+                ))
+            for _ in range(rng.randint(0, 3)):
+                assumptions.append(AssumptionFactory.build(project=project, created_by=rng.choice(self.users), status=rng.randint(1, 3)))
+            for _ in range(rng.randint(0, 3)):
+                issues.append(IssueFactory.build(project=project, created_by=rng.choice(self.users), status=rng.randint(1, 3)))
+            for _ in range(rng.randint(0, 2)):
+                dependencies.append(DependencyFactory.build(project=project, created_by=rng.choice(self.users), status=rng.randint(1, 3)))
+            for _ in range(rng.randint(1, 4)):
+                stakeholders.append(StakeholderFactory.build(project=project, created_by=rng.choice(self.users)))
+
+        for model, objs in ((Risk, risks), (Assumption, assumptions), (Issue, issues), (Dependency, dependencies), (Stakeholder, stakeholders)):
+            bulk_create_with_history(objs, model, batch_size=self.batch_size)
+
+    def create_comments(self, projects, tasks):
+        rng = self.rng
+        project_type = ContentType.objects.get_for_model(Project)
+        task_type = ContentType.objects.get_for_model(Task)
+        targets = [(project_type, project.pk) for project in projects]
+        targets += [(task_type, task.pk) for task in rng.sample(tasks, len(tasks) // 10)]  # Comments on roughly one task in ten
+
+        comments = []
+        for content_type, object_id in targets:
+            for _ in range(rng.randint(1, 3)):
+                comment = CommentFactory.build(user=rng.choice(self.users))
+                # The factory leaves the generic relation empty, so it is pointed at the target here
+                comment.content_type = content_type
+                comment.object_id = object_id
+                comments.append(comment)
+        bulk_create_with_history(comments, Comment, batch_size=self.batch_size)
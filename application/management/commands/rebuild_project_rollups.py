@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from application.utils.rollup_helpers import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the ProjectRollup table from the Task table and reports any drift that was found.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drift, do not correct it.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drift = rebuild_rollups(fix=not dry_run)
+
+        for project, field, stored, expected in drift:
+            if field is None:
+                self.stdout.write(f"{project} (ID {project.pk}): rollup missing")
+            else:
+                self.stdout.write(f"{project} (ID {project.pk}): {field} was {stored}, expected {expected}")
+
+        drifted_projects = len({project.pk for project, *_ in drift})
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All project rollups are up to date.'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{drifted_projects} project rollup(s) have drifted (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {drifted_projects} project rollup(s)."))
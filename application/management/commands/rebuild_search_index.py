@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from application.utils.search_helpers import rebuild_search_index
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the full-text search index from the projects, tasks, RAID items, comments and extracted '
+        'attachment text in the database. Run once after migrating, and after loading data with signals off.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Documents written per insert.')
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} search document(s)."))
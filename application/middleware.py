@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+class QueryRecorder:
+    """ Database execute wrapper that counts queries and adds up the time spent running them """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+class PerformanceStats:
+    """
+    Keeps the most recent samples for each URL name, so a rolling summary can be reported.
+    Shared between request threads, so all access goes through a lock.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, url_name, queries, db_time, total_time):
+        window = getattr(settings, 'PERFORMANCE_SUMMARY_WINDOW', 100)
+        with self._lock:
+            samples = self._samples.setdefault(url_name, deque(maxlen=window))
+            samples.append((queries, db_time, total_time))
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self):
+        """
+        Returns a list of averages and maximums per URL name over the samples in the window.
+        avg_app_ms is the time spent outside the database - view code and template rendering together -
+        which is measured the same way whether the view returns a TemplateResponse or calls render() itself.
+        """
+        with self._lock:
+            samples = {url_name: list(rows) for url_name, rows in self._samples.items()}
+
+        summary = []
+        for url_name, rows in sorted(samples.items()):
+            count = len(rows)
+            budget = query_budget(url_name)
+            summary.append({
+                'view': url_name,
+                'requests': count,
+                'avg_queries': round(sum(row[0] for row in rows) / count, 1),
+                'max_queries': max(row[0] for row in rows),
+                'avg_db_ms': round(sum(row[1] for row in rows) / count * 1000, 2),
+                'avg_app_ms': round(sum(row[2] - row[1] for row in rows) / count * 1000, 2),
+                'avg_total_ms': round(sum(row[2] for row in rows) / count * 1000, 2),
+                'query_budget': budget,
+                'over_budget': sum(1 for row in rows if budget is not None and row[0] > budget),
+            })
+        return summary
+
+performance_stats = PerformanceStats()
+
+def query_budget(url_name):
+    """ The most queries a view is expected to run - its own budget if it has one, otherwise the default """
+    budgets = getattr(settings, 'PERFORMANCE_QUERY_BUDGETS', {})
+    return budgets.get(url_name, getattr(settings, 'PERFORMANCE_DEFAULT_QUERY_BUDGET', None))
+
+class QueryBudgetMiddleware:
+    """
+    Records the number of SQL queries, the time spent in the database and the total time
+    around get_response for every request to a named URL, and logs a warning when a view
+    runs more queries than its budget (settings.PERFORMANCE_QUERY_BUDGETS).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFORMANCE_MONITORING', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Runs async under ASGI, so async views aren't pushed onto a thread by this middleware
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def watch_queries(recorder):
+        """ Adds the recorder to this thread's database connections, until the returned stack is closed """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.watch_queries(recorder):
+            response = self.get_response(request)
+        self.record(request, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        # Connections belong to a thread, and an async request's queries all run on the one thread
+        # sync_to_async() gives it, so the recorder is added (and removed) there
+        stack = await sync_to_async(self.watch_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, recorder, time.perf_counter() - start)
+        return response
+
+    def record(self, request, recorder, total_time):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return
+
+        performance_stats.record(match.url_name, recorder.count, recorder.duration, total_time)
+
+        budget = query_budget(match.url_name)
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                "%s ran %d queries (budget %d) in %.1fms of database time - %s",
+                match.url_name, recorder.count, budget, recorder.duration * 1000, request.path
+            )
+
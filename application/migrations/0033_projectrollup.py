@@ -0,0 +1,29 @@
+# Generated by Django 5.0.9 on 2026-10-18 04:46
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0032_alter_historicalproject_halo_ref_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectRollup',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='application.project')),
+                ('total_tasks', models.IntegerField(default=0)),
+                ('completed_tasks', models.IntegerField(default=0)),
+                ('unassigned_tasks', models.IntegerField(default=0)),
+                ('overdue_tasks', models.IntegerField(default=0)),
+                ('estimated_time_total', models.DurationField(default=datetime.timedelta)),
+                ('actual_time_total', models.DurationField(default=datetime.timedelta)),
+                ('rag_status', models.CharField(default='A', max_length=1)),
+                ('last_updated_datetime', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.9 on 2026-10-18 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def build_task_conflicts(apps, schema_editor):
+    # Index the conflicts that already exist between tasks and their prerequisites
+    Task = apps.get_model('application', 'Task')
+    TaskConflict = apps.get_model('application', 'TaskConflict')
+    rows = Task.objects.filter(
+        deleted__isnull=True,
+        prereq_task__isnull=False,
+        prereq_task__deleted__isnull=True,
+        planned_start_date__lt=F('prereq_task__planned_end_date'),
+    ).values_list('id', 'prereq_task_id', 'project_id', 'planned_start_date', 'prereq_task__planned_end_date')
+    TaskConflict.objects.bulk_create([
+        TaskConflict(task_id=task_id, prereq_task_id=prereq_task_id, project_id=project_id, overlap_days=(end - start).days)
+        for task_id, prereq_task_id, project_id, start, end in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0033_projectrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskConflict',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='prereq_conflict', serialize=False, to='application.task')),
+                ('overlap_days', models.IntegerField()),
+                ('prereq_task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dependent_conflicts', to='application.task')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_conflicts', to='application.project')),
+            ],
+        ),
+        migrations.RunPython(build_task_conflicts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.9 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0034_taskconflict'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'planned_start_date', 'planned_end_date'], name='task_project_dates_idx'),
+        ),
+    ]
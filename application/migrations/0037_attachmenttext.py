@@ -0,0 +1,38 @@
+# Generated by Django 5.0.9 on 2026-10-18 05:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0036_comment_object_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('status', models.IntegerField(choices=[(1, 'Pending'), (2, 'Extracted'), (3, 'Failed'), (4, 'Not Supported'), (5, 'File Missing')], default=1)),
+                ('file_type', models.CharField(blank=True, max_length=10)),
+                ('text', models.TextField(blank=True)),
+                ('preview', models.TextField(blank=True)),
+                ('sender', models.TextField(blank=True)),
+                ('recipients', models.TextField(blank=True)),
+                ('subject', models.TextField(blank=True)),
+                ('page_count', models.IntegerField(blank=True, null=True)),
+                ('has_attachments', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('created_datetime', models.DateTimeField(auto_now_add=True)),
+                ('extracted_datetime', models.DateTimeField(blank=True, null=True)),
+                ('attachment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extractions', to='application.attachment')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='attachmenttext',
+            constraint=models.UniqueConstraint(fields=('attachment', 'content_hash'), name='attachment_text_hash_unique'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.0.9 on 2026-10-18 05:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# SQLite: an FTS5 index over the table, kept in step by triggers. Prefixes of up to four characters are indexed
+# so partly typed words are cheap to match. The document type is indexed as a word of its own (doctypetask and so
+# on) rather than as 'task', which is also in the text of most documents and would make filtering by type slow -
+# so the index has to be filled by the triggers, not FTS5's 'rebuild'.
+SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE application_searchdocument_fts USING fts5(title, body, doc_type, content='application_searchdocument', content_rowid='id', tokenize='porter unicode61', prefix='2 3 4')",
+    """CREATE TRIGGER application_searchdocument_ai AFTER INSERT ON application_searchdocument BEGIN
+        INSERT INTO application_searchdocument_fts(rowid, title, body, doc_type) VALUES (new.id, new.title, new.body, 'doctype' || new.doc_type);
+    END""",
+    """CREATE TRIGGER application_searchdocument_ad AFTER DELETE ON application_searchdocument BEGIN
+        INSERT INTO application_searchdocument_fts(application_searchdocument_fts, rowid, title, body, doc_type) VALUES ('delete', old.id, old.title, old.body, 'doctype' || old.doc_type);
+    END""",
+    """CREATE TRIGGER application_searchdocument_au AFTER UPDATE ON application_searchdocument BEGIN
+        INSERT INTO application_searchdocument_fts(application_searchdocument_fts, rowid, title, body, doc_type) VALUES ('delete', old.id, old.title, old.body, 'doctype' || old.doc_type);
+        INSERT INTO application_searchdocument_fts(rowid, title, body, doc_type) VALUES (new.id, new.title, new.body, 'doctype' || new.doc_type);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS application_searchdocument_au",
+    "DROP TRIGGER IF EXISTS application_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS application_searchdocument_ai",
+    "DROP TABLE IF EXISTS application_searchdocument_fts",
+]
+
+
+def create_full_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+        elif connection.vendor == 'microsoft':
+            # SQL Server keeps its full-text index up to date itself. It needs the name of the primary key index.
+            cursor.execute(
+                "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('application_searchdocument') AND is_primary_key = 1"
+            )
+            key_index = cursor.fetchone()[0]
+            cursor.execute(
+                "IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'application_search_catalog') "
+                "CREATE FULLTEXT CATALOG application_search_catalog"
+            )
+            cursor.execute(
+                f"CREATE FULLTEXT INDEX ON application_searchdocument (title, body) KEY INDEX [{key_index}] "
+                "ON application_search_catalog WITH CHANGE_TRACKING AUTO"
+            )
+
+
+def drop_full_text_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for statement in SQLITE_DROP:
+                cursor.execute(statement)
+        elif connection.vendor == 'microsoft':
+            cursor.execute("DROP FULLTEXT INDEX ON application_searchdocument")
+
+
+class Migration(migrations.Migration):
+    # SQL Server can't create a full-text index inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('application', '0038_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('url', models.CharField(max_length=255)),
+                ('updated_datetime', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='application.project')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('doc_type', 'object_id'), name='search_document_unique_object'),
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
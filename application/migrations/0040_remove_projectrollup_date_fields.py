@@ -0,0 +1,21 @@
+# Generated by Django 5.0.9 on 2026-10-18 06:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0039_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='projectrollup',
+            name='overdue_tasks',
+        ),
+        migrations.RemoveField(
+            model_name='projectrollup',
+            name='rag_status',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.9 on 2026-10-18 07:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0040_remove_projectrollup_date_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmenttext',
+            name='queued_datetime',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.9 on 2026-10-18 08:12
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def build_project_rollups(apps, schema_editor):
+    # Rollups are only written when tasks or projects are saved, so add them for the projects that already exist
+    Project = apps.get_model('application', 'Project')
+    ProjectRollup = apps.get_model('application', 'ProjectRollup')
+    Task = apps.get_model('application', 'Task')
+    missing = Project.objects.filter(deleted__isnull=True, rollup__isnull=True).values_list('id', flat=True)
+    rows = Task.objects.filter(deleted__isnull=True, project_id__in=missing).values('project_id').annotate(
+        total_tasks=Count('id'),
+        completed_tasks=Count('id', filter=Q(task_status=3)),  # Completed
+        unassigned_tasks=Count('id', filter=Q(task_status=1)),  # Unassigned
+        estimated_time_total=Sum('estimated_time_to_complete'),
+        actual_time_total=Sum('actual_time_to_complete'),
+    ).order_by()
+    figures = {row.pop('project_id'): row for row in rows}
+    rollups = []
+    for project_id in missing:
+        row = figures.get(project_id, {})
+        rollups.append(ProjectRollup(
+            project_id=project_id,
+            total_tasks=row.get('total_tasks', 0),
+            completed_tasks=row.get('completed_tasks', 0),
+            unassigned_tasks=row.get('unassigned_tasks', 0),
+            estimated_time_total=row.get('estimated_time_total') or timedelta(),
+            actual_time_total=row.get('actual_time_total') or timedelta(),
+        ))
+    ProjectRollup.objects.bulk_create(rollups, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0041_attachmenttext_queued_datetime'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_project_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.9 on 2026-10-18 08:40
+
+from django.db import migrations
+
+
+def build_search_index(apps, schema_editor):
+    # Migration 0039 created the index empty. Documents are built by the same code that keeps them up to date
+    # (titles, URLs and which objects are searchable), so it is used here rather than the historical models.
+    # New databases have nothing to index.
+    if not apps.get_model('application', 'Project').objects.exists():
+        return
+    from application.utils.search_helpers import rebuild_search_index
+    rebuild_search_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('application', '0042_backfill_projectrollups'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+from django.contrib import messages
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+from .models import Project
+
+class ProjectScopedMixin:
+    """
+    For the class-based views under projects/<project_id>/. The project - and, for views of one object on it, that
+    object - is looked up once per request and kept on the view, so dispatch, the form and the context all share it.
+    An object is loaded with its project (and object_select_related) in a single query.
+
+    Put it before PermissionRequiredMixin or LoginRequiredMixin. Requests for a closed project are turned away with
+    closed_message before the permission check, and users without the permission get permission_denied_message -
+    both are sent to redirect_url_name, unless get_closed_url() or get_permission_denied_url() say otherwise.
+    """
+    object_url_kwarg = None  # The URL argument naming the object, e.g. 'task_id' - unset for the project itself, lists and create views
+    object_select_related = ()  # Relations of the object the view uses, loaded in the same query
+    closed_message = None  # Unset lets requests for closed projects through
+    redirect_url_name = None  # A URL taking just the project_id
+    permission_denied_message = ''  # Unset uses Django's handling - a login redirect, or a 403
+    login_if_anonymous = False  # Send users who aren't logged in to the login page rather than redirect_url_name
+
+    @cached_property
+    def project(self):
+        if self.object_url_kwarg:
+            return self.scoped_object.project  # Loaded with the object
+        return get_object_or_404(Project, id=self.kwargs['project_id'])
+
+    @cached_property
+    def scoped_object(self):
+        queryset = self.model._default_manager.select_related('project', *self.object_select_related)
+        return get_object_or_404(
+            queryset,
+            id=self.kwargs[self.object_url_kwarg],
+            project_id=self.kwargs['project_id'],
+            project__deleted__isnull=True,
+        )
+
+    def get_object(self, queryset=None):
+        return self.scoped_object if self.object_url_kwarg else self.project
+
+    def project_url(self, url_name):
+        return reverse(url_name, kwargs={'project_id': self.kwargs['project_id']})
+
+    def get_closed_url(self):
+        return self.project_url(self.redirect_url_name)
+
+    def get_permission_denied_url(self):
+        return self.project_url(self.redirect_url_name)
+
+    def blocked_response(self):
+        """ A redirect when the request can't go ahead - by default, when the project is closed - or None """
+        if self.closed_message and self.project.project_status == 7:  # Closed
+            messages.error(self.request, self.closed_message)
+            return redirect(self.get_closed_url())
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.blocked_response()
+        if response is not None:
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def handle_no_permission(self):
+        if not self.permission_denied_message or (self.login_if_anonymous and not self.request.user.is_authenticated):
+            return super().handle_no_permission()
+        messages.error(self.request, self.get_permission_denied_message())
+        return redirect(self.get_permission_denied_url())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['project'] = self.project
+        return context
@@ -1,13 +1,16 @@
-from datetime import date
+from datetime import date, timedelta
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models
 from django.urls import reverse
 from django.db import transaction
+from django.utils import timezone
+from safedelete.managers import SafeDeleteManager
 from safedelete.models import SafeDeleteModel, SOFT_DELETE, SOFT_DELETE_CASCADE
+from safedelete.queryset import SafeDeleteQueryset
 from simple_history.models import HistoricalRecords
 
 # We can use Category for Department or Category
@@ -84,6 +87,75 @@ class Project(SafeDeleteModel):
         return reverse('project_detail', kwargs={'project_id': self.id})
 
 # The Task Details
+MAX_CHAIN_DEPTH = 500  # Stops the chain queries if the prerequisites ever loop back on themselves
+
+class TaskQuerySet(SafeDeleteQueryset):
+    """ Adds prerequisite chain lookups to the Task manager """
+
+    def _prereq_chain_sql(self, direction, table):
+        """
+        Builds one recursive CTE walking up ('upstream') or down ('downstream') the prerequisite
+        chain from every task in this queryset. Returns (name, sql, params) for the CTE.
+        """
+        seed_sql, seed_params = self.order_by().values('id', 'prereq_task_id').query.sql_with_params()
+        name = direction
+
+        if direction == 'upstream':
+            # Each row is a prerequisite, starting with the seed's own prerequisite at depth 1
+            anchor = f"SELECT seed.prereq_task_id, seed.id, 1 FROM ({seed_sql}) seed WHERE seed.prereq_task_id IS NOT NULL"
+            step = (
+                f"SELECT t.prereq_task_id, {name}.root_id, {name}.depth + 1 FROM {name} JOIN {table} t ON t.id = {name}.task_id "
+                f"WHERE t.prereq_task_id IS NOT NULL AND t.deleted IS NULL AND {name}.depth < %s"
+            )
+        else:
+            # Each row is a task that depends on the one above it, starting with the seed's direct dependents
+            anchor = f"SELECT t.id, seed.id, 1 FROM ({seed_sql}) seed JOIN {table} t ON t.prereq_task_id = seed.id WHERE t.deleted IS NULL"
+            step = (
+                f"SELECT t.id, {name}.root_id, {name}.depth + 1 FROM {name} JOIN {table} t ON t.prereq_task_id = {name}.task_id "
+                f"WHERE t.deleted IS NULL AND {name}.depth < %s"
+            )
+        return name, f"{name} (task_id, root_id, depth) AS ({anchor} UNION ALL {step})", (*seed_params, MAX_CHAIN_DEPTH)
+
+    def _prereq_chain(self, directions):
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        ctes, selects, params = [], [], []
+        for direction in directions:
+            name, cte, cte_params = self._prereq_chain_sql(direction, table)
+            ctes.append(cte)
+            params.extend(cte_params)
+            # Upstream depths are negative, so one ordering puts the whole chain top to bottom
+            sign = '-' if direction == 'upstream' else ''
+            selects.append(
+                f"SELECT t.*, {name}.root_id AS chain_root_id, {sign}{name}.depth AS chain_depth "
+                f"FROM {name} JOIN {table} t ON t.id = {name}.task_id WHERE t.deleted IS NULL"
+            )
+
+        # SQL Server does not accept the RECURSIVE keyword and stops at 100 levels unless told otherwise
+        is_mssql = connection.vendor == 'microsoft'
+        sql = (
+            f"WITH {'' if is_mssql else 'RECURSIVE '}{', '.join(ctes)} "
+            f"SELECT * FROM ({' UNION ALL '.join(selects)}) chain ORDER BY chain_root_id, chain_depth"
+            f"{' OPTION (MAXRECURSION 0)' if is_mssql else ''}"
+        )
+        return self.raw(sql, params)
+
+    def upstream(self):
+        """
+        Returns every task the tasks in this queryset are blocked by, all the way up their prerequisite
+        chains, in one query. Each task has chain_root_id (the task it was found from) and chain_depth
+        (-1 for the direct prerequisite, -2 for its prerequisite and so on).
+        """
+        return self._prereq_chain(['upstream'])
+
+    def downstream(self):
+        """ Returns every task blocked by the tasks in this queryset, as upstream(), with chain_depth counting up from 1 """
+        return self._prereq_chain(['downstream'])
+
+    def dependency_chain(self):
+        """ Returns both the upstream and downstream chains in one query, ordered from the top of each chain to the bottom """
+        return self._prereq_chain(['upstream', 'downstream'])
+
 class Task(SafeDeleteModel):
     _safedelete_policy = SOFT_DELETE_CASCADE
     STATUS_CHOICES = [
@@ -131,6 +203,14 @@ class Task(SafeDeleteModel):
     )
     halo_ref = models.IntegerField(null=True, blank=True, verbose_name="Halo Reference")
     history = HistoricalRecords()
+
+    objects = SafeDeleteManager(TaskQuerySet)
+
+    class Meta:
+        indexes = [
+            # Date range lookups for a project's calendar
+            models.Index(fields=['project', 'planned_start_date', 'planned_end_date'], name='task_project_dates_idx'),
+        ]
    
     @property
     def display_start_date(self):
@@ -346,14 +426,33 @@ class Comment(SafeDeleteModel):  # Using SafeDelete for soft delete functionalit
     last_updated_datetime = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
 
+    class Meta:
+        indexes = [
+            # Loading an object's comments in order, and many objects' comments at once (see comment_helpers.py)
+            models.Index(fields=['content_type', 'object_id', 'created_datetime'], name='comment_object_created_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user} on {self.content_object}"
       
+# Uploaded file contents, stored once however many attachments share them (see storage_helpers.py)
+class AttachmentBlob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs/')
+    size = models.BigIntegerField()
+    reference_count = models.IntegerField(default=0)  # Attachments using this blob - it is deleted when this drops to 0
+    created_datetime = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 class Attachment(models.Model): # Change to SafeDeleteModel when finished testing - I want to be able to permanently delete attachments until I sort storage solution.
     _safedelete_policy = SOFT_DELETE
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='attachments')
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     file = models.FileField(upload_to='media/')
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')  # Empty for files uploaded before the blob store
+    content_type = models.CharField(max_length=100, blank=True)  # MIME type detected at upload
     description = models.CharField(max_length=255, blank=True, null=True)
     filename = models.CharField(max_length=255)  # This should store the actual file name
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -363,3 +462,89 @@ class Attachment(models.Model): # Change to SafeDeleteModel when finished testin
 
     class Meta:
         ordering = ['-uploaded_at']
+
+# The text pulled out of an attachment for previews, one row per version of the file's contents (see attachment_helpers.py)
+class AttachmentText(models.Model):
+    STATUS_CHOICES = [
+        (1, 'Pending'),
+        (2, 'Extracted'),
+        (3, 'Failed'),
+        (4, 'Not Supported'),
+        (5, 'File Missing'),
+    ]
+    attachment = models.ForeignKey(Attachment, on_delete=models.CASCADE, related_name='extractions')
+    content_hash = models.CharField(max_length=64, blank=True)  # SHA-256 of the file the text came from
+    status = models.IntegerField(choices=STATUS_CHOICES, default=1)
+    file_type = models.CharField(max_length=10, blank=True)
+    text = models.TextField(blank=True)
+    preview = models.TextField(blank=True)
+    sender = models.TextField(blank=True)
+    recipients = models.TextField(blank=True)
+    subject = models.TextField(blank=True)
+    page_count = models.IntegerField(null=True, blank=True)
+    has_attachments = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    created_datetime = models.DateTimeField(auto_now_add=True)
+    queued_datetime = models.DateTimeField(default=timezone.now)  # When it was last sent for extraction
+    extracted_datetime = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # Also the index the preview lookup uses
+            models.UniqueConstraint(fields=['attachment', 'content_hash'], name='attachment_text_hash_unique'),
+        ]
+
+    def __str__(self):
+        return f"Text of {self.attachment}"
+
+# One row per searchable object, mirrored into the database's full-text index (see search_helpers.py)
+class SearchDocument(models.Model):
+    doc_type = models.CharField(max_length=20)  # project, task, risk, assumption, issue, dependency, comment or attachment
+    object_id = models.PositiveIntegerField()
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    url = models.CharField(max_length=255)
+    updated_datetime = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doc_type', 'object_id'], name='search_document_unique_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type} {self.object_id}"
+
+# Denormalised task figures for each project - kept current by signals (see signals.py).
+# Figures that depend on today's date (overdue tasks, RAG status) are worked out when read, see attach_rollups
+class ProjectRollup(models.Model):
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    total_tasks = models.IntegerField(default=0)
+    completed_tasks = models.IntegerField(default=0)
+    unassigned_tasks = models.IntegerField(default=0)
+    estimated_time_total = models.DurationField(default=timedelta)
+    actual_time_total = models.DurationField(default=timedelta)
+    last_updated_datetime = models.DateTimeField(auto_now=True)
+
+    @property
+    def incomplete_tasks(self):
+        return self.total_tasks - self.completed_tasks
+
+    @property
+    def percent_completed(self):
+        """ Projects without tasks are treated as 100% complete """
+        return round((self.completed_tasks / self.total_tasks) * 100, 2) if self.total_tasks > 0 else 100
+
+    def __str__(self):
+        return f"Rollup for {self.project}"
+
+# Scheduling conflicts between a task and its prerequisite - kept current by signals (see signals.py)
+class TaskConflict(models.Model):
+    # A task has at most one prerequisite, so it can only be the dependent side of one conflict
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True, related_name='prereq_conflict')
+    prereq_task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='dependent_conflicts')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='task_conflicts')
+    overlap_days = models.IntegerField()  # How many days the prerequisite overruns the task's planned start
+
+    def __str__(self):
+        return f"{self.task} starts before {self.prereq_task} ends"
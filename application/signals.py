@@ -1,8 +1,15 @@
-from django.db.models.signals import post_migrate, post_delete
+from django.db.models.signals import post_migrate, post_delete, post_save
 from django.dispatch import receiver
-from application.models import Skill, DayOfWeek,Asset, Task  # Import models
+from application.models import Skill, DayOfWeek,Asset, Task, Project, Attachment, Risk, Assumption, Issue, Dependency, Comment  # Import models
+from application.utils.rollup_helpers import refresh_project_rollup
+from application.utils.dashboard_helpers import invalidate_dashboard_stats
+from application.utils.conflict_helpers import refresh_task_conflicts
+from application.utils.storage_helpers import release_blob
+from application.utils.search_helpers import (
+    index_comments, index_object, index_project_attachments, remove_comment_documents, remove_document, remove_project_documents,
+)
 
-from safedelete.signals import pre_softdelete
+from safedelete.signals import post_softdelete, post_undelete, pre_softdelete
 import logging
 
 # Set up logging to see which functions are executed
@@ -85,4 +92,115 @@ def handle_asset_pre_softdelete(sender, instance, using, **kwargs):
     tasks = Task.objects.filter(assigned_to=instance)
     for task in tasks:
         task.assigned_to = None
-        task.save()
\ No newline at end of file
+        task.save()
+
+# Project Rollups
+# safedelete soft deletes and undeletes by calling save(), so post_save also covers
+# pre_softdelete/post_undelete. post_delete is only needed for hard deletes.
+
+@receiver(post_save, sender=Task)
+def update_conflicts_on_task_save(sender, instance, raw=False, **kwargs):
+    # Dates, prerequisite or deleted state may have changed - hard deletes cascade on their own
+    if raw:
+        return
+    refresh_task_conflicts(instance)
+
+@receiver(post_save, sender=Task)
+def update_rollup_on_task_save(sender, instance, raw=False, **kwargs):
+    if raw:  # Skip when loading fixtures
+        return
+    project = Project.objects.filter(pk=instance.project_id).first()
+    if project:
+        refresh_project_rollup(project)
+
+@receiver(post_delete, sender=Task)
+def update_rollup_on_task_delete(sender, instance, **kwargs):
+    project = Project.objects.filter(pk=instance.project_id).first()
+    if project:
+        refresh_project_rollup(project)
+
+@receiver(post_save, sender=Project)
+def update_rollup_on_project_save(sender, instance, raw=False, **kwargs):
+    # Status and dates feed into the RAG status
+    if raw or instance.deleted:
+        return
+    refresh_project_rollup(instance)
+
+# Dashboard Stats
+# Soft deletes go through save(), so post_save and post_delete cover every write
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Asset)
+@receiver(post_save, sender=Skill)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Asset)
+@receiver(post_delete, sender=Skill)
+def clear_dashboard_stats(sender, **kwargs):
+    invalidate_dashboard_stats()
+
+# Attachment Blobs
+# Attachments are deleted outright, so each delete gives up its reference to the stored file
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+# Search Index
+# Soft deletes come through post_save, and remove the document. A project's comments and attachments
+# aren't deleted with it, so everything under the project goes from the index too - and the comments on
+# a deleted task or RAID item go with it. Restoring an object indexes its comments again; restoring a project
+# restores its tasks and RAID items (which index themselves), so only its own comments and attachments are added.
+# Attachment text is saved with update(), so attachment_helpers.py indexes it itself.
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Risk)
+@receiver(post_save, sender=Assumption)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Dependency)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if isinstance(instance, Project) and instance.deleted:
+        remove_project_documents(instance.pk)
+        return
+    index_object(instance)
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Risk)
+@receiver(post_delete, sender=Assumption)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Dependency)
+@receiver(post_delete, sender=Comment)
+def remove_from_search_index(sender, instance, **kwargs):
+    remove_document(sender._meta.model_name, instance.pk)
+    if sender is not Comment:
+        remove_comment_documents(instance)
+
+@receiver(post_softdelete, sender=Task)
+@receiver(post_softdelete, sender=Risk)
+@receiver(post_softdelete, sender=Assumption)
+@receiver(post_softdelete, sender=Issue)
+@receiver(post_softdelete, sender=Dependency)
+def remove_comments_from_search_index(sender, instance, **kwargs):
+    remove_comment_documents(instance)
+
+@receiver(post_undelete, sender=Project)
+@receiver(post_undelete, sender=Task)
+@receiver(post_undelete, sender=Risk)
+@receiver(post_undelete, sender=Assumption)
+@receiver(post_undelete, sender=Issue)
+@receiver(post_undelete, sender=Dependency)
+def restore_in_search_index(sender, instance, **kwargs):
+    index_comments(instance)
+    if sender is Project:
+        index_project_attachments(instance)
+
+@receiver(post_delete, sender=Attachment)
+def remove_attachment_from_search_index(sender, instance, **kwargs):
+    remove_document('attachment', instance.pk)
@@ -1,16 +1,47 @@
 from application.factories import ProjectFactory, TaskFactory, RiskFactory, AssumptionFactory, IssueFactory, DependencyFactory, StakeholderFactory, CategoryFactory, DayOfWeekFactory, AssetFactory, SkillFactory, TeamFactory, CommentFactory, UserFactory
 
-from application.forms import ProjectForm, ProjectUpdateForm, CreateTaskForm, EditTaskForm, TaskCompleteForm
-from application.models import Skill, DayOfWeek, Project, Task, Risk, Category, Team, Asset, Comment, Assumption, Issue, Dependency, Stakeholder
+from application.forms import has_circular_dependency, ProjectForm, ProjectUpdateForm, CreateTaskForm, EditTaskForm, TaskCompleteForm
+from application.models import Skill, DayOfWeek, Project, Task, Risk, Category, Team, Asset, Comment, Assumption, Issue, Dependency, Stakeholder, ProjectRollup, TaskConflict, Attachment, AttachmentBlob, AttachmentText, SearchDocument
+from application.utils.project_helpers import rag_status_from_counts
+from application.utils.dashboard_helpers import calculate_dashboard_stats, get_dashboard_stats
+from application.utils.rollup_helpers import attach_rollups
+from application.utils.task_helpers import TASK_EXPORT_COLUMNS, task_url_template
+from application.utils.conflict_helpers import rebuild_task_conflicts
+from application.utils.time_helpers import time_totals, time_totals_by
+from application.utils.dependency_helpers import ancestors, descendants, get_task_graph, would_create_cycle
+from application.utils.capacity_helpers import build_capacity, capacity_matrix, count_work_days, summarise_capacity, weekday_hours
+from application.utils.skill_helpers import SkillIndex
+from application.utils.attachment_helpers import PENDING_TIMEOUT, queue_extraction, wait_for_extractions
+from application.utils.storage_helpers import detect_content_type
+from application.utils.download_helpers import parse_range
+from application.utils.text_extraction import PREVIEW_LENGTH, extract_file
+from application.utils.search_helpers import FACET_LIMIT, RANK_CANDIDATES, fts_match, rank_candidates, search
+from application.utils.comment_helpers import attach_comment_counts, comment_page, comments_for, comment_key, latest_comments
+from application.utils.membership_helpers import member_stats, skills_with_assets, teams_with_members
+from application.utils.assignment_helpers import assign_unassigned_tasks, recommend_assignees
+from application.utils.schedule_helpers import compute_schedule, critical_path, project_schedule, propagate_date_shift
+from application.middleware import performance_stats
 from datetime import date, timedelta
+from safedelete.config import HARD_DELETE
+from io import StringIO
+import csv
+import os
+import shutil
+import tempfile
+import json
 
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError, connection
-from django.test import TestCase, override_settings
-from django.urls import reverse
+from django.db import IntegrityError, connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.utils import timezone
 
 # Testing the signals (objects that are created after the migration - things like days of week, project and task status defaults)
@@ -1267,4 +1298,1955 @@ class ProjectCloseViewTest(BaseAuthTestCase):
         
         # Optionally, verify that the project's status has not changed
         self.project.refresh_from_db()
-        self.assertEqual(self.project.project_status, 1)  # Still 'Open'
\ No newline at end of file
+        self.assertEqual(self.project.project_status, 1)  # Still 'Open'
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProjectScopedViewTest(BaseAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory(project_status=1)
+        self.task = TaskFactory(project=self.project, prereq_task=None)
+        self.risk = RiskFactory(project=self.project)
+        self.task_edit_url = reverse('task_edit', kwargs={'project_id': self.project.id, 'task_id': self.task.id})
+        self.task_detail_url = reverse('task_detail', kwargs={'project_id': self.project.id, 'task_id': self.task.id})
+
+    def project_lookups(self, url, method='get'):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url)
+        lookups = [query['sql'] for query in queries if '"application_project"."project_name"' in query['sql']]  # Queries loading a project row
+        return response, lookups
+
+    def test_project_and_object_loaded_once(self):
+        """
+        Test that the project-scoped pages load the project (with the object, where there is one) in a single query.
+        """
+        self.client.login(username='manager', password='managerpass')
+        urls = [
+            self.task_edit_url,
+            self.task_detail_url,
+            reverse('task_create', kwargs={'project_id': self.project.id}),
+            reverse('task_complete', kwargs={'project_id': self.project.id, 'task_id': self.task.id}),
+            reverse('edit_risk', kwargs={'project_id': self.project.id, 'risk_id': self.risk.id}),
+            reverse('risk_detail', kwargs={'project_id': self.project.id, 'risk_id': self.risk.id}),
+            reverse('add_risk', kwargs={'project_id': self.project.id}),
+            reverse('project_edit', kwargs={'project_id': self.project.id}),
+        ]
+        for url in urls:
+            response, lookups = self.project_lookups(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(len(lookups), 1, url)
+            self.assertEqual(response.context['project'], self.project)
+
+    def test_object_from_another_project_is_not_found(self):
+        """
+        Test that an object is only found under its own project.
+        """
+        self.client.login(username='manager', password='managerpass')
+        other_project = ProjectFactory(project_status=1)
+        response = self.client.get(reverse('task_detail', kwargs={'project_id': other_project.id, 'task_id': self.task.id}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_closed_project_turned_away(self):
+        """
+        Test that closed projects are refused with the view's message before the permission check.
+        """
+        self.project.project_status = 7  # Closed
+        self.project.save()
+        self.client.login(username='regular', password='regularpass')
+
+        response = self.client.get(self.task_edit_url)
+        self.assertRedirects(response, self.task_detail_url)
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], ["This project is closed and its tasks cannot be edited."])
+
+        response = self.client.post(reverse('add_risk', kwargs={'project_id': self.project.id}), {})
+        self.assertRedirects(response, reverse('risk_list', kwargs={'project_id': self.project.id}))
+        self.assertFalse(Risk.objects.filter(project=self.project).exclude(pk=self.risk.pk).exists())
+
+    def test_permission_denied(self):
+        """
+        Test that users without the permission get the view's message, and anonymous users go to the login page where the view asks for it.
+        """
+        risk_edit_url = reverse('edit_risk', kwargs={'project_id': self.project.id, 'risk_id': self.risk.id})
+        response = self.client.get(risk_edit_url)
+        self.assertRedirects(response, f"{reverse('login')}?next={risk_edit_url}")
+
+        self.client.login(username='regular', password='regularpass')
+        response = self.client.get(risk_edit_url)
+        self.assertRedirects(response, reverse('risk_list', kwargs={'project_id': self.project.id}))
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], ["You do not have permission to edit this risk."])
+
+        response = self.client.get(self.task_edit_url)
+        self.assertRedirects(response, self.task_detail_url)
+
+# Helper Tests
+
+class RagStatusBatchTest(TestCase):
+    def setUp(self):
+        """
+        Generate projects covering each branch of the RAG calculation.
+        """
+        today = date.today()
+        date_ranges = [
+            (None, None),                                            # Missing dates
+            (today, today),                                          # Zero length project
+            (today - timedelta(days=10), today + timedelta(days=90)),  # Lots of time left
+            (today - timedelta(days=50), today + timedelta(days=50)),  # Half way through
+            (today - timedelta(days=90), today + timedelta(days=10)),  # Nearly out of time
+            (today - timedelta(days=60), today - timedelta(days=5)),   # Overdue
+        ]
+        owner = AssetFactory()
+        statuses = [1, 3, 4, 7]
+        for i, (start_date, end_date) in enumerate(date_ranges):
+            for status in statuses:
+                for task_count, completed_count in [(0, 0), (3, 0), (3, 1), (2, 2)]:
+                    project = ProjectFactory(
+                        project_owner=owner,
+                        project_status=status,
+                        planned_start_date=start_date,
+                        original_target_end_date=end_date,
+                    )
+                    for n in range(task_count):
+                        TaskFactory(project=project, assigned_to=None, task_status=3 if n < completed_count else 1)
+                    if task_count:
+                        # Soft deleted tasks should be ignored by both calculations
+                        TaskFactory(project=project, assigned_to=None).delete()
+
+    def test_rollups_match_per_project_calculation(self):
+        """
+        Test that attach_rollups gives the same RAG status as counting each project's live tasks.
+        """
+        expected = {}
+        for project in Project.objects.all():
+            tasks = project.task_set.all()
+            expected[project.pk] = rag_status_from_counts(
+                project.project_status,
+                tasks.count(),
+                tasks.filter(task_status=3).count(),
+                project.display_start_date,
+                project.display_end_date,
+            )
+        projects = attach_rollups(Project.objects.all())
+
+        self.assertEqual(len(projects), len(expected))
+        self.assertEqual({project.pk: project.rag_status for project in projects}, expected)
+        self.assertEqual(set(expected.values()), {'R', 'A', 'G'})
+
+class ProjectRollupTest(TestCase):
+    def setUp(self):
+        self.project = ProjectFactory()
+        self.task_a = TaskFactory(project=self.project, assigned_to=None, estimated_time_to_complete=timedelta(hours=8))
+        self.task_b = TaskFactory(project=self.project, estimated_time_to_complete=timedelta(hours=4))
+
+    def test_rollup_updated_on_task_save(self):
+        """
+        Test that saving tasks keeps the project rollup current.
+        """
+        rollup = ProjectRollup.objects.get(project=self.project)
+        self.assertEqual(rollup.total_tasks, 2)
+        self.assertEqual(rollup.completed_tasks, 0)
+        self.assertEqual(rollup.unassigned_tasks, 1)
+        self.assertEqual(rollup.estimated_time_total, timedelta(hours=12))
+
+        self.task_b.task_status = 3
+        self.task_b.actual_time_to_complete = timedelta(hours=5)
+        self.task_b.save()
+
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.completed_tasks, 1)
+        self.assertEqual(rollup.actual_time_total, timedelta(hours=5))
+        self.assertEqual(rollup.percent_completed, 50)
+
+    def test_rollup_updated_on_soft_delete_and_undelete(self):
+        """
+        Test that soft deleting and undeleting a task is reflected in the rollup.
+        """
+        self.task_a.delete()
+        rollup = ProjectRollup.objects.get(project=self.project)
+        self.assertEqual(rollup.total_tasks, 1)
+        self.assertEqual(rollup.unassigned_tasks, 0)
+
+        Task.all_objects.get(pk=self.task_a.pk).undelete()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.total_tasks, 2)
+
+    def test_overdue_tasks_counted(self):
+        """
+        Test that incomplete tasks past their due date are counted as overdue when the rollup is read.
+        """
+        TaskFactory(project=self.project, planned_start_date=date.today() - timedelta(days=10))
+        project = attach_rollups(Project.objects.filter(pk=self.project.pk))[0]
+        self.assertEqual(project.overdue_tasks, 1)
+        self.assertEqual(project.total_tasks, 3)
+
+    def test_date_dependent_figures_worked_out_when_read(self):
+        """
+        Test that overdue tasks and the RAG status follow today's date without the rollup being rewritten,
+        and that the rebuild command does not report the passing of time as drift.
+        """
+        self.project.planned_start_date = date.today()
+        self.project.original_target_end_date = date.today() + timedelta(days=100)
+        self.project.save()
+        self.task_a.due_date = date.today() + timedelta(days=5)
+        self.task_a.save()
+        self.task_b.due_date = date.today() + timedelta(days=200)
+        self.task_b.save()
+
+        project = attach_rollups([self.project])[0]
+        self.assertEqual((project.overdue_tasks, project.rag_status), (0, 'G'))
+
+        later = date.today() + timedelta(days=95)
+        project = attach_rollups([self.project], today=later)[0]
+        self.assertEqual((project.overdue_tasks, project.rag_status), (1, 'R'))
+
+        out = StringIO()
+        call_command('rebuild_project_rollups', '--dry-run', stdout=out)
+        self.assertIn('All project rollups are up to date.', out.getvalue())
+
+    def test_missing_rollup_built_when_read(self):
+        """
+        Test that reading a project without a stored rollup builds and stores one.
+        """
+        ProjectRollup.objects.filter(project=self.project).delete()
+        project = attach_rollups(Project.objects.filter(pk=self.project.pk))[0]
+        self.assertEqual(project.total_tasks, 2)
+        self.assertEqual(ProjectRollup.objects.get(project=self.project).total_tasks, 2)
+
+    def test_rebuild_command_reports_and_fixes_drift(self):
+        """
+        Test that the rebuild command reports rollups that have drifted and corrects them.
+        """
+        # Bulk updates skip signals, so the rollup will drift
+        Task.objects.filter(project=self.project).update(task_status=3)
+
+        out = StringIO()
+        call_command('rebuild_project_rollups', '--dry-run', stdout=out)
+        self.assertIn('completed_tasks was 0, expected 2', out.getvalue())
+        self.assertEqual(ProjectRollup.objects.get(project=self.project).completed_tasks, 0)
+
+        call_command('rebuild_project_rollups', stdout=StringIO())
+        self.assertEqual(ProjectRollup.objects.get(project=self.project).completed_tasks, 2)
+
+        out = StringIO()
+        call_command('rebuild_project_rollups', stdout=out)
+        self.assertIn('All project rollups are up to date.', out.getvalue())
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DashboardStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.open_project = ProjectFactory(project_status=3)
+        self.closed_project = ProjectFactory(project_status=7)
+        TaskFactory(project=self.open_project, assigned_to=None)
+        TaskFactory(project=self.closed_project, assigned_to=None)
+        TaskFactory(project=self.open_project, task_status=3, actual_time_to_complete=timedelta(hours=2))
+
+    def test_stats_match_individual_counts(self):
+        """
+        Test that the aggregated figures match the individual counts used previously.
+        """
+        stats = calculate_dashboard_stats()
+        self.assertEqual(stats['projects_total'], Project.objects.count())
+        self.assertEqual(stats['projects_open'], Project.objects.exclude(project_status=7).count())
+        self.assertEqual(stats['projects_closed'], 1)
+        self.assertEqual(stats['tasks_total'], 3)
+        self.assertEqual(stats['tasks_open'], 2)
+        self.assertEqual(stats['tasks_completed'], 1)
+        self.assertEqual(stats['tasks_unassigned'], 1)  # The closed project's task is not counted
+        self.assertEqual(stats['assets_total'], Asset.objects.count())
+        self.assertEqual(stats['skills_total'], Skill.objects.count())
+
+    def test_stats_cached_and_invalidated_on_write(self):
+        """
+        Test that the figures are cached and the cache is cleared when a task is saved.
+        """
+        get_dashboard_stats()
+        with self.assertNumQueries(0):
+            stats = get_dashboard_stats()
+        self.assertEqual(stats['tasks_total'], 3)
+
+        TaskFactory(project=self.open_project)
+        self.assertEqual(get_dashboard_stats()['tasks_total'], 4)
+
+    def test_stats_json_endpoint(self):
+        """
+        Test that the JSON endpoint returns the figures for logged in users.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tasks_total'], 3)
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'data-stat="tasks_total">3<')
+
+        self.client.logout()
+        response = self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(response.status_code, 302)
+
+class TaskListDataTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_login(self.user)
+        self.project = ProjectFactory(project_name='Alpha Project')
+        self.other_project = ProjectFactory(project_name='Beta Project')
+        for n in range(12):
+            TaskFactory(project=self.project, task_name=f'Alpha Task {n:02d}', assigned_to=None)
+        TaskFactory(project=self.other_project, task_name='Beta Task', task_status=3, actual_time_to_complete=timedelta(hours=1))
+
+    def datatables_params(self, columns, **extra):
+        """
+        Build the query string DataTables sends for server-side processing.
+        """
+        params = {'draw': 1, 'start': 0, 'length': 5, 'search[value]': ''}
+        for i, column in enumerate(columns):
+            params[f'columns[{i}][data]'] = column
+            params[f'columns[{i}][search][value]'] = ''
+        params.update(extra)
+        return params
+
+    def test_paging_and_totals(self):
+        """
+        Test that only one page of tasks is returned along with the totals DataTables needs.
+        """
+        params = self.datatables_params(['project', 'task_name'], **{'list': 'all_task_list', 'draw': 3})
+        response = self.client.get(reverse('task_list_data'), params)
+        data = response.json()
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 13)
+        self.assertEqual(data['recordsFiltered'], 13)
+        self.assertEqual(len(data['data']), 5)
+        self.assertIn('conflict_flag', data['data'][0])
+        self.assertIn('can_be_completed', data['data'][0])
+
+    def test_search_and_column_filter(self):
+        """
+        Test the global search and per-column filters, including matching on status labels.
+        """
+        params = self.datatables_params(['project', 'task_name', 'status'], **{'list': 'all_task_list', 'search[value]': 'beta'})
+        data = self.client.get(reverse('task_list_data'), params).json()
+        self.assertEqual(data['recordsFiltered'], 1)
+        self.assertEqual(data['data'][0]['task_name'], 'Beta Task')
+
+        params = self.datatables_params(['project', 'task_name', 'status'], **{'list': 'all_task_list', 'columns[2][search][value]': 'complete'})
+        data = self.client.get(reverse('task_list_data'), params).json()
+        self.assertEqual(data['recordsFiltered'], 1)
+
+        params = self.datatables_params(['task_name'], project_id=self.project.id)
+        data = self.client.get(reverse('task_list_data'), params).json()
+        self.assertEqual(data['recordsTotal'], 12)
+
+    def test_keyset_pages_match_offset_pages(self):
+        """
+        Test that following the cursor gives the same pages as using an offset.
+        """
+        ordering = {'order[0][column]': 1, 'order[0][dir]': 'desc'}
+        params = self.datatables_params(['project', 'task_name'], project_id=self.project.id, **ordering)
+        first_page = self.client.get(reverse('task_list_data'), params).json()
+        self.assertEqual(first_page['data'][0]['task_name'], 'Alpha Task 11')
+        self.assertIsNotNone(first_page['cursor'])
+
+        offset_page = self.client.get(reverse('task_list_data'), {**params, 'start': 5}).json()
+        keyset_page = self.client.get(reverse('task_list_data'), {**params, 'start': 5, 'cursor': first_page['cursor']}).json()
+        self.assertEqual([t['id'] for t in keyset_page['data']], [t['id'] for t in offset_page['data']])
+
+        # A cursor for a different start row is ignored rather than giving the wrong page
+        other_page = self.client.get(reverse('task_list_data'), {**params, 'start': 10, 'cursor': first_page['cursor']}).json()
+        self.assertEqual([t['task_name'] for t in other_page['data']], ['Alpha Task 01', 'Alpha Task 00'])
+
+    def test_export_streams_every_matching_task(self):
+        """
+        Test that the CSV export holds every task matching the searches, in the table's order, not just one page.
+        """
+        TaskFactory(project=self.project, task_name='=HYPERLINK("http://example.com")', assigned_to=None)
+        ordering = {'order[0][column]': 1, 'order[0][dir]': 'desc'}
+        params = self.datatables_params(['project', 'task_name'], project_id=self.project.id, **{'search[value]': 'alpha task', **ordering})
+        response = self.client.get(reverse('task_list_export'), params)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], TASK_EXPORT_COLUMNS)
+        self.assertEqual([row[1] for row in rows[1:]], [f'Alpha Task {n:02d}' for n in range(11, -1, -1)])
+
+        params = self.datatables_params(['task_name'], project_id=self.project.id, **{'search[value]': 'hyperlink'})
+        rows = list(csv.reader(StringIO(b''.join(self.client.get(reverse('task_list_export'), params).streaming_content).decode())))
+        self.assertEqual(rows[1][1], '\'=HYPERLINK("http://example.com")')
+        self.assertEqual(self.client.get(reverse('task_list_export'), {'project_id': 'x'}).status_code, 400)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_task_list_page_points_at_data_endpoint(self):
+        """
+        Test that the task list page renders without the rows and links to the data endpoint.
+        """
+        response = self.client.get(reverse('open_task_list'))
+        self.assertContains(response, 'data-source="/tasks/data/?list=open_task_list"')
+        self.assertContains(response, 'data-export="/tasks/export/?list=open_task_list"')
+        self.assertNotContains(response, 'Alpha Task 00')
+
+class TaskConflictTest(TestCase):
+    def setUp(self):
+        self.project = ProjectFactory()
+        start = date.today()
+        self.prereq = TaskFactory(project=self.project, planned_start_date=start, planned_end_date=start + timedelta(days=10))
+        # Both dependents start before the prerequisite ends
+        self.first = TaskFactory(project=self.project, prereq_task=self.prereq, planned_start_date=start + timedelta(days=3), planned_end_date=start + timedelta(days=12))
+        self.second = TaskFactory(project=self.project, prereq_task=self.prereq, planned_start_date=start + timedelta(days=5), planned_end_date=start + timedelta(days=12))
+
+    def test_conflicts_found_for_every_dependent(self):
+        """
+        Test that each dependent task starting before its prerequisite ends gets its own conflict.
+        """
+        conflicts = TaskConflict.objects.filter(prereq_task=self.prereq).order_by('overlap_days')
+        self.assertEqual([c.task for c in conflicts], [self.second, self.first])
+        self.assertEqual([c.overlap_days for c in conflicts], [5, 7])
+
+    def test_conflict_cleared_when_dates_fixed(self):
+        """
+        Test that moving the prerequisite's end date clears the conflicts of its dependents.
+        """
+        self.prereq.planned_end_date = date.today() + timedelta(days=2)
+        self.prereq.save()
+        self.assertFalse(TaskConflict.objects.exists())
+
+        # Pulling one dependent back before the prerequisite ends brings its conflict back
+        self.first.planned_start_date = date.today() + timedelta(days=1)
+        self.first.save()
+        self.assertEqual(list(TaskConflict.objects.values_list('task_id', flat=True)), [self.first.id])
+
+    def test_soft_deleted_prerequisite_drops_conflicts(self):
+        """
+        Test that soft deleting the prerequisite removes its conflicts.
+        """
+        self.prereq.delete()
+        self.assertFalse(TaskConflict.objects.exists())
+
+    def test_rebuild_matches_signals(self):
+        """
+        Test that rebuilding the whole index gives the same conflicts as the signals kept.
+        """
+        expected = set(TaskConflict.objects.values_list('task_id', 'prereq_task_id', 'overlap_days'))
+        TaskConflict.objects.all().delete()
+        self.assertEqual(rebuild_task_conflicts(), 2)
+        self.assertEqual(set(TaskConflict.objects.values_list('task_id', 'prereq_task_id', 'overlap_days')), expected)
+
+    def test_task_list_conflict_flag(self):
+        """
+        Test that the task list flags both sides of a conflict and nothing else.
+        """
+        unrelated = TaskFactory(project=self.project)
+        self.client.force_login(UserFactory())
+        params = {'draw': 1, 'start': 0, 'length': 10, 'search[value]': '', 'project_id': self.project.id}
+        data = self.client.get(reverse('task_list_data'), params).json()
+        flags = {row['id']: row['conflict_flag'] for row in data['data']}
+        self.assertEqual(flags, {self.prereq.id: True, self.first.id: True, self.second.id: True, unrelated.id: False})
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AssetListWorkloadTest(TestCase):
+    def setUp(self):
+        self.client.force_login(UserFactory())
+        self.asset = AssetFactory()
+        self.other_asset = AssetFactory()
+        ProjectFactory(project_owner=self.asset, project_status=1)
+        ProjectFactory(project_owner=self.asset, project_status=7)  # Closed projects are not counted
+        TaskFactory(assigned_to=self.asset)
+        TaskFactory(assigned_to=self.other_asset)
+        self.end_date = date.today()
+        TaskFactory(assigned_to=self.asset, task_status=3, actual_end_date=self.end_date, actual_time_to_complete=timedelta(hours=3))
+        TaskFactory(assigned_to=self.asset, task_status=3, actual_end_date=self.end_date, actual_time_to_complete=timedelta(hours=1))
+        TaskFactory(assigned_to=self.other_asset, task_status=3, actual_end_date=self.end_date, actual_time_to_complete=timedelta(hours=4))
+
+    def stats_for(self, response, asset):
+        return next(stat for stat in response.context['asset_stats'] if stat['asset'] == asset)
+
+    def test_now_stats(self):
+        """
+        Test the open projects and task counts shown in the "Now" view.
+        """
+        response = self.client.get(reverse('asset_list'))
+        stat = self.stats_for(response, self.asset)
+        self.assertEqual(stat['projects_owned'], 1)
+        self.assertEqual(stat['open_tasks_assigned'], 1)
+        self.assertEqual(stat['percentage_of_open_tasks'], 50)
+        self.assertEqual(stat['closed_tasks_assigned'], 2)
+        self.assertAlmostEqual(stat['percentage_of_closed_tasks'], 200 / 3)
+
+    def test_date_range_stats(self):
+        """
+        Test the completed task count and time spent shown for a date range.
+        """
+        start_date = self.end_date - timedelta(days=7)
+        response = self.client.get(reverse('asset_list_date_range', kwargs={'start_date': str(start_date), 'end_date': str(self.end_date)}))
+        stat = self.stats_for(response, self.asset)
+        self.assertEqual(stat['tasks_completed'], 2)
+        self.assertEqual(stat['total_time_spent_hours'], 4)
+        self.assertEqual(stat['avg_time_per_task_hours'], 2)
+        self.assertAlmostEqual(stat['percentage_of_tasks'], 200 / 3)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_assets(self):
+        """
+        Benchmark the number of queries for both modes before and after adding more assets with work.
+        """
+        start_date = self.end_date - timedelta(days=7)
+        urls = [
+            reverse('asset_list'),
+            reverse('asset_list_date_range', kwargs={'start_date': str(start_date), 'end_date': str(self.end_date)}),
+        ]
+        before = [self.count_queries(url) for url in urls]
+
+        for _ in range(10):
+            asset = AssetFactory()
+            ProjectFactory(project_owner=asset, project_status=1)
+            TaskFactory(assigned_to=asset, task_status=3, actual_end_date=self.end_date, actual_time_to_complete=timedelta(hours=2))
+
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(before, after)
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TimeTotalsTest(TestCase):
+    def setUp(self):
+        self.skill = SkillFactory()
+        self.asset = AssetFactory()
+        TaskFactory(assigned_to=self.asset, task_status=3, actual_time_to_complete=timedelta(hours=2), skills_required=[self.skill])
+        TaskFactory(assigned_to=self.asset, task_status=3, actual_time_to_complete=timedelta(hours=1, minutes=30), skills_required=[self.skill])
+        TaskFactory(assigned_to=self.asset, skills_required=[self.skill])  # No time recorded yet
+
+    def test_time_totals(self):
+        """
+        Test that totals and averages are returned in hours, with the average only over tasks that have a time.
+        """
+        totals = time_totals(Task.objects.filter(assigned_to=self.asset))
+        self.assertEqual(totals['task_count'], 3)
+        self.assertEqual(totals['total_hours'], 3.5)
+        self.assertEqual(totals['average_hours'], 1.75)
+        self.assertIsInstance(totals['total_hours'], float)
+
+    def test_time_totals_when_empty(self):
+        """
+        Test that an empty queryset gives zero hours rather than None.
+        """
+        totals = time_totals(Task.objects.none())
+        self.assertEqual(totals, {'task_count': 0, 'total_hours': 0.0, 'average_hours': 0.0})
+
+    def test_time_totals_by_group(self):
+        """
+        Test that grouped totals are keyed by the group value.
+        """
+        other_asset = AssetFactory()
+        TaskFactory(assigned_to=other_asset, task_status=3, actual_time_to_complete=timedelta(hours=4))
+        totals = time_totals_by(Task.objects.filter(task_status=3), 'assigned_to_id')
+        self.assertEqual(totals[self.asset.pk]['total_hours'], 3.5)
+        self.assertEqual(totals[other_asset.pk]['total_hours'], 4.0)
+
+    def test_detail_views(self):
+        """
+        Test the time figures shown on the asset and skill detail pages.
+        """
+        self.client.force_login(UserFactory())
+        response = self.client.get(reverse('asset_detail', kwargs={'pk': self.asset.pk}))
+        self.assertEqual(response.context['all_tasks_count'], 3)
+        self.assertEqual(response.context['completed_tasks'], 2)
+        self.assertEqual(response.context['incomplete_tasks'], 1)
+        self.assertEqual(response.context['total_time_spent_hours'], 3.5)
+        self.assertEqual(response.context['average_time_per_task'], 1.75)
+
+        response = self.client.get(reverse('skill_detail', kwargs={'pk': self.skill.pk}))
+        self.assertEqual(response.context['tasks_with_skill_count'], 3)
+        self.assertEqual(response.context['total_time_spent_hours'], 3.5)
+        self.assertEqual(response.context['average_time_per_task'], 1.17)
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class QueryBudgetMiddlewareTest(TestCase):
+    def setUp(self):
+        performance_stats.clear()
+        self.user = UserFactory(is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_records_summary_per_view(self):
+        """
+        Test that requests are recorded against their URL name and reported in the summary.
+        """
+        self.client.get(reverse('all_projects'))
+        self.client.get(reverse('all_projects'))
+        summary = self.client.get(reverse('performance_summary')).json()['views']
+        project_list = next(row for row in summary if row['view'] == 'all_projects')
+        self.assertEqual(project_list['requests'], 2)
+        self.assertGreater(project_list['avg_queries'], 0)
+        self.assertGreater(project_list['avg_app_ms'], 0)
+
+    def test_function_views_report_their_time(self):
+        """
+        Test that a function view calling render() reports the time spent outside the database, not zero.
+        """
+        self.client.get(reverse('home'))
+        summary = self.client.get(reverse('performance_summary')).json()['views']
+        home = next(row for row in summary if row['view'] == 'home')
+        self.assertGreater(home['avg_app_ms'], 0)
+
+    def test_warns_when_over_budget(self):
+        """
+        Test that a warning is logged when a view runs more queries than its budget.
+        """
+        with self.settings(PERFORMANCE_QUERY_BUDGETS={'all_projects': 0}):
+            with self.assertLogs('application.middleware', level='WARNING') as logs:
+                self.client.get(reverse('all_projects'))
+        self.assertIn('all_projects ran', logs.output[0])
+
+    def test_summary_is_staff_only(self):
+        """
+        Test that users who are not staff cannot see the summary.
+        """
+        self.client.force_login(UserFactory())
+        response = self.client.get(reverse('performance_summary'))
+        self.assertEqual(response.status_code, 302)
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ViewQueryCountTest(TestCase):
+    """
+    Performance regression suite - every list and detail view should run the same number of
+    queries however much data there is. Each view is measured, more data is added, and it is measured again.
+    """
+    def setUp(self):
+        self.user = UserFactory(is_superuser=True, is_staff=True)
+        self.client.force_login(self.user)
+        self.skill = SkillFactory()
+        self.team = TeamFactory()
+        self.project = ProjectFactory(project_status=1)
+        self.asset = self.project.project_owner
+        self.asset.skills.add(self.skill)
+        self.asset.teams.add(self.team)
+        self.add_data(2)
+        self.task = Task.objects.filter(project=self.project).first()
+        self.risk = Risk.objects.filter(project=self.project).first()
+        self.assumption = Assumption.objects.filter(project=self.project).first()
+        self.issue = Issue.objects.filter(project=self.project).first()
+        self.dependency = Dependency.objects.filter(project=self.project).first()
+
+    def add_data(self, size):
+        """ Adds `size` projects, assets, skills and teams, and `size` of each kind of item to the project being viewed """
+        for _ in range(size):
+            skill = SkillFactory()
+            team = TeamFactory()
+            asset = AssetFactory(skills=[self.skill, skill], teams=[self.team, team])
+            ProjectFactory(project_owner=asset, project_status=1)
+            previous = Task.objects.filter(project=self.project).last()
+            task = TaskFactory(project=self.project, assigned_to=asset, prereq_task=previous, skills_required=[self.skill])
+            TaskFactory(project=self.project, assigned_to=asset, task_status=3, actual_end_date=date.today(), actual_time_to_complete=timedelta(hours=2), skills_required=[self.skill])
+            for factory_class in (RiskFactory, AssumptionFactory, IssueFactory, DependencyFactory, StakeholderFactory):
+                factory_class(project=self.project, created_by=self.user)
+            CommentFactory(content_object=self.project, user=self.user)
+            CommentFactory(content_object=task, user=self.user)
+
+    def view_urls(self):
+        project_id = self.project.id
+        return {
+            'home': reverse('home'),
+            'all_projects': reverse('all_projects'),
+            'open_project_list': reverse('open_project_list'),
+            'closed_project_list': reverse('closed_project_list'),
+            'on_hold_project_list': reverse('on_hold_project_list'),
+            'project_detail': reverse('project_detail', kwargs={'project_id': project_id}),
+            'project_taskview': reverse('project_taskview', kwargs={'project_id': project_id}),
+            'all_task_list': reverse('all_task_list'),
+            'task_list_data': reverse('task_list_data') + f'?list=all_task_list&columns[0][data]=task_name',
+            'task_detail': reverse('task_detail', kwargs={'project_id': project_id, 'task_id': self.task.id}),
+            'risk_list': reverse('risk_list', kwargs={'project_id': project_id}),
+            'risk_detail': reverse('risk_detail', kwargs={'project_id': project_id, 'risk_id': self.risk.id}),
+            'assumption_list': reverse('assumption_list', kwargs={'project_id': project_id}),
+            'assumption_detail': reverse('assumption_detail', kwargs={'project_id': project_id, 'assumption_id': self.assumption.id}),
+            'issue_list': reverse('issue_list', kwargs={'project_id': project_id}),
+            'issue_detail': reverse('issue_detail', kwargs={'project_id': project_id, 'issue_id': self.issue.id}),
+            'dependency_list': reverse('dependency_list', kwargs={'project_id': project_id}),
+            'dependency_detail': reverse('dependency_detail', kwargs={'project_id': project_id, 'dependency_id': self.dependency.id}),
+            'stakeholder_list': reverse('stakeholder_list', kwargs={'project_id': project_id}),
+            'attachment_list': reverse('attachment_list', kwargs={'project_id': project_id}),
+            'project_calendar': reverse('project_calendar'),
+            'project_events': reverse('project_events'),
+            'project_task_calendar': reverse('project_task_calendar', kwargs={'project_id': project_id}),
+            'project_task_events': reverse('project_task_events', kwargs={'project_id': project_id}),
+            'project_gantt_chart': reverse('project_gantt_chart', kwargs={'project_id': project_id}),
+            'project_gantt_data': reverse('project_gantt_data', kwargs={'project_id': project_id}),
+            'portfolio_gantt_data': reverse('portfolio_gantt_data'),
+            'asset_list': reverse('asset_list'),
+            'asset_detail': reverse('asset_detail', kwargs={'pk': self.asset.pk}),
+            'skill_list': reverse('skill_list'),
+            'skill_detail': reverse('skill_detail', kwargs={'pk': self.skill.pk}),
+            'team_list': reverse('team_list'),
+            'team_detail': reverse('team_detail', kwargs={'team_id': self.team.pk}),
+        }
+
+    def count_queries(self):
+        counts = {}
+        for name, url in self.view_urls().items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_query_counts_stay_flat(self):
+        """
+        Test that no list or detail view runs more queries as the data grows.
+        """
+        before = self.count_queries()
+        self.add_data(6)
+        after = self.count_queries()
+        # Counts can drop slightly on the second pass as the ContentType cache warms up, so only growth is a failure
+        grown = {
+            name: (before[name], after[name]) for name in before
+            if after[name] > before[name]
+        }
+        self.assertEqual(grown, {})
+
+class GenerateLoadDataTest(TestCase):
+    def generate(self, seed=7):
+        call_command('generate_load_data', projects=3, tasks_per_project=6, assets=4, seed=seed, stdout=StringIO())
+        return list(
+            Task.objects.filter(project__project_name__startswith=f'Load{seed} ')
+            .order_by('task_name').values_list('task_name', 'planned_start_date', 'assigned_to__name', 'prereq_task__task_name')
+        )
+
+    def test_generates_dataset(self):
+        """
+        Test that the command creates projects, tasks with prerequisites, related rows and history.
+        """
+        tasks = self.generate()
+        self.assertEqual(len(tasks), 18)
+        self.assertEqual(Project.objects.filter(project_name__startswith='Load7 ').count(), 3)
+        self.assertEqual(Asset.objects.filter(name__startswith='Load7 ').count(), 4)
+        self.assertTrue(any(prereq for *_, prereq in tasks))
+        self.assertTrue(Asset.skills.through.objects.filter(asset__name__startswith='Load7 ').exists())
+        self.assertTrue(Task.skills_required.through.objects.filter(task__project__project_name__startswith='Load7 ').exists())
+        self.assertEqual(Task.history.filter(project__project_name__startswith='Load7 ').count(), 18)
+        self.assertTrue(Comment.objects.filter(content_type=ContentType.objects.get_for_model(Project)).exists())
+
+        # The rollups were rebuilt after the bulk inserts
+        out = StringIO()
+        call_command('rebuild_project_rollups', '--dry-run', stdout=out)
+        self.assertIn('All project rollups are up to date.', out.getvalue())
+
+    def test_same_seed_gives_same_data(self):
+        """
+        Test that generating with the same seed twice gives identical tasks.
+        """
+        try:
+            with transaction.atomic():
+                first = self.generate()
+                raise IntegrityError  # Roll back so the same seed can be generated again
+        except IntegrityError:
+            pass
+        self.assertEqual(self.generate(), first)
+
+    def test_refuses_to_generate_seed_twice(self):
+        """
+        Test that the command stops rather than clashing with data it already generated.
+        """
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+class ProjectEventsFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = ProjectFactory(planned_start_date=date(2024, 3, 4), original_target_end_date=date(2024, 3, 20), project_status=1)
+        self.later = ProjectFactory(planned_start_date=date(2024, 6, 1), original_target_end_date=date(2024, 6, 30), project_status=7)
+
+    def test_window_filters_projects(self):
+        """
+        Test that only projects overlapping FullCalendar's start/end window are returned.
+        """
+        response = self.client.get(reverse('project_events'), {'start': '2024-02-26T00:00:00Z', 'end': '2024-04-08T00:00:00Z'})
+        events = response.json()
+        self.assertEqual([event['title'] for event in events], [self.project.project_name])
+        self.assertEqual(events[0]['end'], '2024-03-21')  # Exclusive end date
+
+        events = self.client.get(reverse('project_events')).json()
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[1]['title'].endswith('(Closed)'))
+
+    def test_conditional_get(self):
+        """
+        Test that repeating a request with the ETag gets a 304, and the cached payload needs only one query.
+        """
+        params = {'start': '2024-02-26', 'end': '2024-04-08'}
+        response = self.client.get(reverse('project_events'), params)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            repeat = self.client.get(reverse('project_events'), params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(reverse('project_events'), params)
+        self.assertEqual(cached.content, response.content)
+
+    def test_project_write_invalidates(self):
+        """
+        Test that saving or soft deleting a project changes the ETag and the events.
+        """
+        params = {'start': '2024-02-26', 'end': '2024-04-08'}
+        first = self.client.get(reverse('project_events'), params)
+
+        self.project.project_name = 'Renamed Project'
+        self.project.save()
+        second = self.client.get(reverse('project_events'), params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()[0]['title'], 'Renamed Project')
+
+        self.project.delete()
+        third = self.client.get(reverse('project_events'), params, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.json(), [])
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TaskCalendarFeedTest(TestCase):
+    def setUp(self):
+        self.client.force_login(UserFactory())
+        self.project = ProjectFactory()
+        self.march = TaskFactory(project=self.project, planned_start_date=date(2024, 3, 4), planned_end_date=date(2024, 3, 8), due_date=date(2024, 4, 2))
+        self.june = TaskFactory(project=self.project, planned_start_date=date(2024, 6, 3), planned_end_date=date(2024, 6, 7), due_date=date(2024, 6, 10))
+        self.url = reverse('project_task_events', kwargs={'project_id': self.project.id})
+
+    def test_window_returns_overlapping_tasks(self):
+        """
+        Test that only task bars and due dates inside the window are returned.
+        """
+        events = self.client.get(self.url, {'start': '2024-02-26', 'end': '2024-04-08'}).json()
+        titles = [event['title'] for event in events]
+        self.assertEqual(titles, [self.march.task_name, f'{self.march.task_name} (Due)'])
+        self.assertEqual(events[0]['end'], '2024-03-09')  # Exclusive end date
+        self.assertEqual(events[0]['url'], reverse('task_detail', kwargs={'project_id': self.project.id, 'task_id': self.march.id}))
+
+        # A window holding only the due date returns just the due date event
+        events = self.client.get(self.url, {'start': '2024-04-01', 'end': '2024-04-08'}).json()
+        self.assertEqual([event['title'] for event in events], [f'{self.march.task_name} (Due)'])
+
+    def test_task_url_template_matches_task_detail(self):
+        """
+        Test that the task URL template gives the task detail URL, including for IDs containing the sentinel 0.
+        """
+        for project_id, task_id in [(self.project.id, self.march.id), (10, 200), (100, 0)]:
+            self.assertEqual(
+                task_url_template(project_id).format(task_id),
+                reverse('task_detail', kwargs={'project_id': project_id, 'task_id': task_id}),
+            )
+
+    def test_refetch_uses_etag(self):
+        """
+        Test that refetching an unchanged window gets a 304, and a change to a task gets new events.
+        """
+        params = {'start': '2024-05-27', 'end': '2024-07-08'}
+        response = self.client.get(self.url, params)
+        repeat = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+        self.june.task_status = 3
+        self.june.actual_time_to_complete = timedelta(hours=1)
+        self.june.save()
+        changed = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([event['title'] for event in changed.json()], [f'{self.june.task_name} (Completed)'])
+
+    def test_calendar_page_does_not_embed_tasks(self):
+        """
+        Test that the calendar page links to the feed instead of including the task events.
+        """
+        response = self.client.get(reverse('project_task_calendar', kwargs={'project_id': self.project.id}))
+        self.assertContains(response, self.url)
+        self.assertNotContains(response, self.march.task_name)
+
+class GanttDataTest(TestCase):
+    def setUp(self):
+        self.client.force_login(UserFactory())
+        self.project = ProjectFactory()
+        self.first = TaskFactory(project=self.project)
+        self.second = TaskFactory(project=self.project, prereq_task=self.first)
+        self.url = reverse('project_gantt_data', kwargs={'project_id': self.project.id})
+
+    def test_full_load_in_one_query(self):
+        """
+        Test that the whole task graph, with assets and prerequisites, is read in a single query
+        (plus one for the critical path).
+        """
+        TaskFactory(project=self.project, prereq_task=self.second)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(self.url).json()
+        task_queries = [q for q in queries if 'application_task' in q['sql']]
+        self.assertEqual(len(task_queries), 2)
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['schedule']['slack']), 3)
+        self.assertEqual(len(data['tasks']), 3)
+        second = next(task for task in data['tasks'] if task['id'] == self.second.id)
+        self.assertEqual(second['dependencies'], str(self.first.id))
+        self.assertEqual(second['resource'], self.second.assigned_to.name)
+
+    def test_delta_since_version(self):
+        """
+        Test that asking for changes since a version returns only changed, dependent and deleted tasks.
+        """
+        version = self.client.get(self.url).json()['version']
+        data = self.client.get(self.url, {'since': version}).json()
+        self.assertEqual(data['tasks'], [])
+        self.assertIsNone(data['schedule'])
+
+        # Changing the prerequisite also sends its dependent, whose conflict flag may have changed
+        self.first.planned_end_date = self.second.planned_start_date + timedelta(days=3)
+        self.first.save()
+        data = self.client.get(self.url, {'since': version}).json()
+        self.assertFalse(data['full'])
+        self.assertEqual({task['id'] for task in data['tasks']}, {self.first.id, self.second.id})
+        self.assertTrue(all(task['conflict'] for task in data['tasks']))
+
+        self.second.delete()
+        data = self.client.get(self.url, {'since': data['version']}).json()
+        self.assertEqual(data['deleted'], [self.second.id])
+        self.assertEqual(data['ids'], [self.first.id])
+
+        # A version without a UTC offset is read in the current time zone rather than failing
+        response = self.client.get(self.url, {'since': '2000-01-01T00:00:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(([task['id'] for task in response.json()['tasks']], response.json()['deleted']), ([self.first.id], [self.second.id]))
+
+    def test_delta_sends_prerequisite_of_changed_task(self):
+        """
+        Test that moving a dependent also sends its prerequisite, whose conflict flag changes with it, and that
+        tasks gone without a trace (hard deleted or moved to another project) drop out of the ids.
+        """
+        third = TaskFactory(project=self.project)
+        version = self.client.get(self.url).json()['version']
+        self.second.planned_start_date = self.first.display_end_date - timedelta(days=1)
+        self.second.planned_end_date = self.second.planned_start_date + timedelta(days=2)
+        self.second.save()
+        data = self.client.get(self.url, {'since': version}).json()
+        sent = {task['id']: task['conflict'] for task in data['tasks']}
+        self.assertEqual(sent, {self.first.id: True, self.second.id: True})
+
+        third.project = ProjectFactory()
+        third.save()
+        self.second.delete(force_policy=HARD_DELETE)  # Leaves no row to send
+        data = self.client.get(self.url, {'since': data['version']}).json()
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(data['ids'], [self.first.id])
+
+    def test_portfolio_stream(self):
+        """
+        Test that the portfolio endpoint streams one line per project.
+        """
+        other = ProjectFactory()
+        TaskFactory(project=other)
+        empty = ProjectFactory()
+        response = self.client.get(reverse('portfolio_gantt_data'), {'projects': [self.project.id, other.id, empty.id]})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(line['project_id'], len(line['tasks'])) for line in lines], [(self.project.id, 2), (other.id, 1), (empty.id, 0)])
+
+class ScheduleEngineTest(TestCase):
+    def graph(self):
+        # A -> B (pushed back to start when A ends), A -> C, and D on its own
+        return {
+            1: {'start': date(2024, 1, 1), 'end': date(2024, 1, 5), 'prereq_task_id': None},
+            2: {'start': date(2024, 1, 3), 'end': date(2024, 1, 8), 'prereq_task_id': 1},
+            3: {'start': date(2024, 1, 5), 'end': date(2024, 1, 6), 'prereq_task_id': 1},
+            4: {'start': date(2024, 1, 1), 'end': date(2024, 1, 3), 'prereq_task_id': None},
+        }
+
+    def test_compute_schedule(self):
+        """
+        Test earliest/latest dates, slack and the critical path for a small graph.
+        """
+        graph = self.graph()
+        schedule = compute_schedule(graph)
+        self.assertEqual(schedule[2]['earliest_start'], date(2024, 1, 5))
+        self.assertEqual(schedule[2]['earliest_finish'], date(2024, 1, 10))
+        self.assertEqual(schedule[3]['latest_finish'], date(2024, 1, 10))
+        self.assertEqual(schedule[3]['slack'], 4)
+        self.assertEqual(schedule[4]['slack'], 7)
+        self.assertEqual(critical_path(schedule, graph), [1, 2])
+
+    def test_cycle_is_left_out(self):
+        """
+        Test that tasks in a circular chain are left out rather than looping forever.
+        """
+        graph = self.graph()
+        graph[5] = {'start': date(2024, 1, 1), 'end': date(2024, 1, 2), 'prereq_task_id': 6}
+        graph[6] = {'start': date(2024, 1, 1), 'end': date(2024, 1, 2), 'prereq_task_id': 5}
+        schedule = compute_schedule(graph)
+        self.assertEqual(set(schedule), {1, 2, 3, 4})
+
+    def test_project_schedule_in_one_query(self):
+        """
+        Test that a project's schedule is worked out from a single query.
+        """
+        project = ProjectFactory()
+        first = TaskFactory(project=project, planned_start_date=date(2024, 1, 1), planned_end_date=date(2024, 1, 5), actual_start_date=None, actual_end_date=None)
+        second = TaskFactory(project=project, prereq_task=first, planned_start_date=date(2024, 1, 5), planned_end_date=date(2024, 1, 9), actual_start_date=None, actual_end_date=None)
+        with self.assertNumQueries(1):
+            schedule, path = project_schedule(project.pk)
+        self.assertEqual(path, [first.pk, second.pk])
+
+    def test_propagate_date_shift(self):
+        """
+        Test that moving a task's end date pushes back its not yet started dependents down the chain.
+        """
+        project = ProjectFactory()
+        dates = {'actual_start_date': None, 'actual_end_date': None, 'task_status': 2}
+        first = TaskFactory(project=project, planned_start_date=date(2024, 1, 1), planned_end_date=date(2024, 1, 5), **dates)
+        second = TaskFactory(project=project, prereq_task=first, planned_start_date=date(2024, 1, 5), planned_end_date=date(2024, 1, 8), **dates)
+        third = TaskFactory(project=project, prereq_task=second, planned_start_date=date(2024, 1, 8), planned_end_date=date(2024, 1, 9), **dates)
+        started = TaskFactory(project=project, prereq_task=first, planned_start_date=date(2024, 1, 5), planned_end_date=date(2024, 1, 6),
+                              actual_start_date=date(2024, 1, 5), actual_end_date=None, task_status=2)
+
+        first.planned_end_date = date(2024, 1, 10)
+        first.save()
+        moved = propagate_date_shift(first)
+
+        self.assertEqual({task.pk for task in moved}, {second.pk, third.pk})
+        second.refresh_from_db()
+        third.refresh_from_db()
+        started.refresh_from_db()
+        self.assertEqual((second.planned_start_date, second.planned_end_date), (date(2024, 1, 10), date(2024, 1, 13)))
+        self.assertEqual((third.planned_start_date, third.planned_end_date), (date(2024, 1, 13), date(2024, 1, 14)))
+        self.assertEqual(started.planned_start_date, date(2024, 1, 5))
+        self.assertEqual(second.history.first().history_change_reason, 'Rescheduled after a prerequisite moved')
+        # Only the started task, which could not be moved, is still in conflict
+        self.assertEqual(list(TaskConflict.objects.filter(project=project).values_list('task_id', flat=True)), [started.pk])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_task_edit_shows_schedule(self):
+        """
+        Test that the task edit page shows the task's slack and critical path status.
+        """
+        self.client.force_login(UserFactory(is_superuser=True))
+        task = TaskFactory(task_status=2, planned_start_date=date(2024, 1, 1), planned_end_date=date(2024, 1, 5), actual_start_date=None, actual_end_date=None)
+        response = self.client.get(reverse('task_edit', kwargs={'project_id': task.project_id, 'task_id': task.pk}))
+        self.assertTrue(response.context['schedule']['critical'])
+        self.assertContains(response, 'on the critical path')
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_task_edit_pushes_back_dependents(self):
+        """
+        Test that saving a new end date on the task edit page reschedules the tasks that depend on it.
+        """
+        self.client.force_login(UserFactory(is_superuser=True))
+        project = ProjectFactory(project_status=1, planned_start_date=date(2024, 1, 1), original_target_end_date=date(2024, 12, 31))
+        dates = {'actual_start_date': None, 'actual_end_date': None, 'task_status': 2}
+        first = TaskFactory(project=project, prereq_task=None, planned_start_date=date(2024, 1, 1), planned_end_date=date(2024, 1, 5), **dates)
+        second = TaskFactory(project=project, prereq_task=first, planned_start_date=date(2024, 1, 5), planned_end_date=date(2024, 1, 8), **dates)
+        url = reverse('task_edit', kwargs={'project_id': project.pk, 'task_id': first.pk})
+
+        # Post the form back as the page shows it, with only the end date changed
+        form = self.client.get(url).context['form']
+        data = {name: form[name].value() for name in form.fields}
+        data = {name: '' if value is None else value for name, value in data.items()}
+        data['planned_end_date'] = '2024-01-10'
+        response = self.client.post(url, data)
+
+        self.assertRedirects(response, reverse('task_detail', kwargs={'project_id': project.pk, 'task_id': first.pk}), fetch_redirect_response=False)
+        second.refresh_from_db()
+        self.assertEqual((second.planned_start_date, second.planned_end_date), (date(2024, 1, 10), date(2024, 1, 13)))
+
+    def test_benchmark_command(self):
+        """
+        Test that the benchmark command runs on a small synthetic graph.
+        """
+        out = StringIO()
+        call_command('benchmark_schedule', tasks=500, repeat=1, stdout=out)
+        self.assertIn('500 tasks scheduled', out.getvalue())
+
+class DependencyGraphTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = ProjectFactory()
+        self.chain = [TaskFactory(project=self.project)]
+        for _ in range(29):
+            self.chain.append(TaskFactory(project=self.project, prereq_task=self.chain[-1]))
+
+    def test_graph_queries(self):
+        """
+        Test ancestors, descendants and cycle checks on a prerequisite graph.
+        """
+        graph = {1: None, 2: 1, 3: 2, 4: 1, 5: None}
+        self.assertEqual(ancestors(graph, 3), [2, 1])
+        self.assertEqual(descendants(graph, 1), {2, 3, 4})
+        self.assertTrue(would_create_cycle(graph, 1, 3))
+        self.assertTrue(would_create_cycle(graph, 1, 1))
+        self.assertFalse(would_create_cycle(graph, 4, 3))
+        # A chain that already loops does not hang
+        self.assertEqual(ancestors({1: 2, 2: 1}, 1), [2])
+
+    def test_deep_chain_check_is_constant(self):
+        """
+        Test that checking for a cycle down a long chain does not run a query per task.
+        """
+        first, last = self.chain[0], self.chain[-1]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(has_circular_dependency(first, last))
+        self.assertLessEqual(len(queries), 2)
+
+        # Cached until one of the project's tasks is written
+        with self.assertNumQueries(1):
+            self.assertFalse(has_circular_dependency(last, self.chain[5]))
+
+    def test_graph_follows_task_saves(self):
+        """
+        Test that the cached graph is refreshed when a task's prerequisite changes.
+        """
+        first, middle, last = self.chain[0], self.chain[15], self.chain[-1]
+        self.assertEqual(get_task_graph(self.project.pk)[middle.pk], self.chain[14].pk)
+
+        # Cut the chain in the middle - the end is no longer downstream of the first task
+        middle.prereq_task = None
+        middle.save()
+        self.assertIsNone(get_task_graph(self.project.pk)[middle.pk])
+        self.assertFalse(has_circular_dependency(first, last))
+
+        middle.delete()
+        self.assertNotIn(middle.pk, get_task_graph(self.project.pk))
+
+class TaskChainQueryTest(TestCase):
+    def setUp(self):
+        # first -> second -> third, and second -> branch
+        self.project = ProjectFactory()
+        self.first = TaskFactory(project=self.project)
+        self.second = TaskFactory(project=self.project, prereq_task=self.first)
+        self.third = TaskFactory(project=self.project, prereq_task=self.second)
+        self.branch = TaskFactory(project=self.project, prereq_task=self.second)
+
+    def test_dependency_chain_in_one_query(self):
+        """
+        Test that the upstream and downstream chain, with depths, comes back from one query.
+        """
+        with self.assertNumQueries(1):
+            chain = [(task.pk, task.chain_depth) for task in Task.objects.filter(pk=self.second.pk).dependency_chain()]
+        self.assertEqual(chain[0], (self.first.pk, -1))
+        self.assertEqual(set(chain[1:]), {(self.third.pk, 1), (self.branch.pk, 1)})
+
+        self.assertEqual([(task.pk, task.chain_depth) for task in Task.objects.filter(pk=self.third.pk).upstream()], [(self.first.pk, -2), (self.second.pk, -1)])
+        self.assertEqual({(task.pk, task.chain_depth) for task in Task.objects.filter(pk=self.first.pk).downstream()},
+                         {(self.second.pk, 1), (self.third.pk, 2), (self.branch.pk, 2)})
+
+    def test_bulk_lookup(self):
+        """
+        Test that the chains for several tasks come back from the same query, tagged with the task they belong to.
+        """
+        chains = {}
+        for task in Task.objects.filter(pk__in=[self.third.pk, self.branch.pk]).upstream():
+            chains.setdefault(task.chain_root_id, []).append(task.pk)
+        self.assertEqual(chains, {self.third.pk: [self.first.pk, self.second.pk], self.branch.pk: [self.first.pk, self.second.pk]})
+
+    def test_deleted_tasks_and_cycles(self):
+        """
+        Test that a soft deleted task ends the chain, and that a circular chain still returns.
+        """
+        self.second.delete()
+        self.assertTrue(Task.objects.filter(pk=self.third.pk).exists())
+        self.assertEqual(list(Task.objects.filter(pk=self.third.pk).upstream()), [])
+
+        other = TaskFactory(project=self.project)
+        looped = TaskFactory(project=self.project, prereq_task=other)
+        Task.objects.filter(pk=other.pk).update(prereq_task=looped)
+        self.assertTrue(list(Task.objects.filter(pk=other.pk).upstream()))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_task_detail_panel(self):
+        """
+        Test that the task detail page lists the whole blocked by / blocking chain.
+        """
+        self.client.force_login(UserFactory())
+        response = self.client.get(reverse('task_detail', kwargs={'project_id': self.project.pk, 'task_id': self.third.pk}))
+        self.assertEqual([task.pk for task in response.context['blocked_by']], [self.first.pk, self.second.pk])
+        self.assertEqual(response.context['blocking'], [])
+        self.assertContains(response, self.first.task_name)
+
+class CapacityEngineTest(TestCase):
+    def setUp(self):
+        self.monday = date(2024, 1, 1)
+        self.sunday = date(2024, 1, 7)
+
+    def test_work_patterns(self):
+        """
+        Test that weekly hours are spread over an asset's work days, defaulting to Monday to Friday.
+        """
+        self.assertEqual(weekday_hours(['Monday', 'Wednesday'], 20), [10.0, 0.0, 10.0, 0.0, 0.0, 0.0, 0.0])
+        self.assertEqual(weekday_hours([], 40), [8.0] * 5 + [0.0] * 2)
+        self.assertEqual(count_work_days(self.monday, date(2024, 1, 14), weekday_hours([], 40)), 10)
+        self.assertEqual(count_work_days(date(2024, 1, 6), date(2024, 1, 8), weekday_hours([], 40)), 1)
+
+    def test_build_capacity(self):
+        """
+        Test that estimates are spread over work days in the task window and over-allocation is found.
+        """
+        patterns = {1: weekday_hours([], 40)}
+        tasks = [
+            (1, self.monday, date(2024, 1, 2), 16.0),  # 8 hours on Monday and Tuesday
+            (1, date(2024, 1, 2), date(2024, 1, 2), 8.0),  # Another 8 on Tuesday
+            (1, date(2023, 12, 28), self.monday, 12.0),  # Thu, Fri and Mon - only Monday falls in the range
+            (2, self.monday, self.sunday, 10.0),  # Not one of the assets asked for
+        ]
+        dates, capacity, allocated = build_capacity(patterns, tasks, self.monday, self.sunday)
+        self.assertEqual(capacity[1], [8.0] * 5 + [0.0] * 2)
+        self.assertEqual(allocated[1], [12.0, 16.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+
+        summary = summarise_capacity(dates, capacity, allocated)[1]
+        self.assertEqual(summary['capacity_hours'], 40)
+        self.assertEqual(summary['allocated_hours'], 28)
+        self.assertEqual(summary['utilisation'], 70.0)
+        self.assertEqual(summary['over_allocated_days'], [self.monday, date(2024, 1, 2)])
+        self.assertEqual(summary['over_allocated_hours'], 12)
+
+    def test_capacity_matrix_queries(self):
+        """
+        Test that the matrices for many assets come from a fixed number of queries.
+        """
+        assets = [AssetFactory(normal_work_week=37) for _ in range(5)]
+        for asset in assets:
+            TaskFactory(assigned_to=asset, planned_start_date=self.monday, planned_end_date=self.sunday, estimated_time_to_complete=timedelta(hours=10))
+        with self.assertNumQueries(2):
+            dates, capacity, allocated = capacity_matrix(assets, self.monday, self.sunday)
+        self.assertEqual(len(dates), 7)
+        self.assertTrue(all(round(sum(row), 2) == 10 for row in allocated.values()))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_asset_pages(self):
+        """
+        Test that the asset list date range and the asset detail page show capacity.
+        """
+        self.client.force_login(UserFactory())
+        asset = AssetFactory(normal_work_week=40)
+        response = self.client.get(reverse('asset_list_date_range', kwargs={'start_date': '2024-01-01', 'end_date': '2024-01-07'}))
+        stat = next(stat for stat in response.context['asset_stats'] if stat['asset'] == asset)
+        self.assertIn('utilisation', stat['capacity'])
+
+        response = self.client.get(reverse('asset_detail', kwargs={'pk': asset.pk}))
+        self.assertEqual(len(response.context['weekly_capacity']), 4 if timezone.now().date().weekday() == 0 else 5)
+        self.assertContains(response, 'Capacity - Next 4 Weeks')
+
+class SkillIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(UserFactory())
+        self.url = reverse('filter_assets_by_skills')
+        self.network, self.server, self.sql = SkillFactory(), SkillFactory(), SkillFactory()
+        self.both = AssetFactory(name='Asset B', skills=[self.network, self.server])
+        self.network_only = AssetFactory(name='Asset A', skills=[self.network])
+        self.all_three = AssetFactory(name='Asset C', skills=[self.network, self.server, self.sql])
+
+    def get_assets(self, skills, **params):
+        return self.client.get(self.url, {'skills[]': [skill.pk for skill in skills], **params}).json()['assets']
+
+    def test_index_matching(self):
+        """
+        Test ALL and ANY matching against the bitsets.
+        """
+        index = SkillIndex([(1, 'One'), (2, 'Two'), (3, 'Three')], [(1, 4), (1, 5), (2, 4), (3, 6)])
+        self.assertEqual(index.having_all([4, 5]), [1])
+        self.assertEqual(index.having_all([4]), [1, 2])
+        self.assertEqual(index.having_any([4, 5, 6]), [(1, 2), (2, 1), (3, 1)])
+        self.assertEqual(index.having_all([99]), [])
+        self.assertEqual(index.having_any([99]), [])
+
+        # Bits are numbered from 0 however large the skill ids are
+        index = SkillIndex([(1, 'One')], [(1, 10 ** 9)])
+        self.assertEqual(index.masks, [(1, 1)])
+        self.assertEqual(index.having_all([10 ** 9]), [1])
+
+    def test_filter_assets_with_all_skills(self):
+        """
+        Test that only assets with every selected skill are returned, without a query per skill.
+        """
+        self.get_assets([self.network])  # Builds the index
+        with CaptureQueriesContext(connection) as queries:
+            assets = self.get_assets([self.network, self.server, self.sql])
+        self.assertEqual(assets, [{'asset_id': self.all_three.pk, 'name': 'Asset C'}])
+        self.assertFalse([q for q in queries if '"application_asset_skills"."skill_id"' in q['sql']])  # Not rebuilt
+        self.assertEqual(self.client.session['filtered_assets'], [self.all_three.pk])
+
+        self.assertEqual([asset['asset_id'] for asset in self.get_assets([self.network, self.server])], [self.both.pk, self.all_three.pk])
+        self.assertEqual(self.client.get(self.url, {'skills[]': ['x']}).status_code, 400)
+
+    def test_any_match_ranked(self):
+        """
+        Test that match=any ranks by the number of matching skills, and rank=workload puts the least busy first.
+        """
+        assets = self.get_assets([self.server, self.sql], match='any')
+        self.assertEqual([(asset['asset_id'], asset['matched_skills']) for asset in assets], [(self.all_three.pk, 2), (self.both.pk, 1)])
+
+        TaskFactory(assigned_to=self.network_only, task_status=2)
+        TaskFactory(assigned_to=self.both, task_status=2)
+        TaskFactory(assigned_to=self.both, task_status=2)
+        assets = self.get_assets([self.network], rank='workload')
+        self.assertEqual([(asset['asset_id'], asset['open_tasks']) for asset in assets], [(self.all_three.pk, 0), (self.network_only.pk, 1), (self.both.pk, 2)])
+
+    def test_index_follows_changes(self):
+        """
+        Test that the index is rebuilt when an asset's skills change or an asset is deleted.
+        """
+        self.assertEqual(len(self.get_assets([self.sql])), 1)
+        self.network_only.skills.add(self.sql)
+        self.assertEqual(len(self.get_assets([self.sql])), 2)
+        self.all_three.skills.remove(self.sql)
+        self.assertEqual([asset['asset_id'] for asset in self.get_assets([self.sql])], [self.network_only.pk])
+        self.network_only.delete()
+        self.assertEqual(self.get_assets([self.sql]), [])
+
+        # Changes made without signals, as by another process, are seen too - the version comes from the database
+        Asset.skills.through.objects.create(asset=self.both, skill=self.sql)
+        self.assertEqual([asset['asset_id'] for asset in self.get_assets([self.sql])], [self.both.pk])
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class MembershipAggregationTest(TestCase):
+    def setUp(self):
+        self.client.force_login(UserFactory())
+        self.python, self.unused = SkillFactory(skill_name='Python'), SkillFactory(skill_name='Unused')
+        self.team, self.empty_team = TeamFactory(team_name='Ops'), TeamFactory(team_name='Empty')
+        self.anna = AssetFactory(name='Anna', skills=[self.python], teams=[self.team])
+        self.bob = AssetFactory(name='Bob', skills=[self.python], teams=[self.team])
+        self.gone = AssetFactory(name='Gone', skills=[self.python], teams=[self.team])
+        self.gone.delete()
+
+    def test_skills_and_teams_with_members(self):
+        """
+        Test that skills and teams come with their live members and counts in two queries.
+        """
+        with self.assertNumQueries(2):
+            skills = {skill.skill_name: skill for skill in skills_with_assets()}
+            self.assertEqual([asset.name for asset in skills['Python'].members], ['Anna', 'Bob'])
+        self.assertEqual((skills['Python'].asset_count, skills['Unused'].asset_count), (2, 0))
+
+        with self.assertNumQueries(2):
+            teams = {team.team_name: team for team in teams_with_members()}
+            self.assertEqual([asset.name for asset in teams['Ops'].members], ['Anna', 'Bob'])
+        self.assertEqual((teams['Ops'].member_count, teams['Empty'].member_count), (2, 0))
+
+    def test_member_stats(self):
+        """
+        Test that the project and task counts don't multiply each other and deleted rows are left out.
+        """
+        ProjectFactory(project_owner=self.anna)
+        project = ProjectFactory(project_owner=self.anna)
+        ProjectFactory(project_owner=self.anna).delete()
+        TaskFactory(project=project, assigned_to=self.anna)
+        TaskFactory(project=project, assigned_to=self.anna, task_status=3, actual_end_date=date.today(), actual_time_to_complete=timedelta(hours=1))
+        TaskFactory(project=project, assigned_to=self.anna).delete()
+
+        with self.assertNumQueries(3):
+            anna = member_stats(Asset.objects.filter(pk=self.anna.pk)).get()
+            self.assertEqual([skill.skill_name for skill in anna.skills.all()], ['Python'])
+        self.assertEqual((anna.projects_owned_count, anna.tasks_count, anna.completed_tasks_count), (2, 2, 1))
+
+    def test_views(self):
+        """
+        Test that the list and detail pages show the members and flag skills and teams without any.
+        """
+        response = self.client.get(reverse('skill_list'))
+        self.assertTrue(response.context['skills_without_assets'])
+        python = next(item for item in response.context['skill_assets'] if item['skill'] == self.python)
+        self.assertEqual([asset.name for asset in python['assets']], ['Anna', 'Bob'])
+
+        response = self.client.get(reverse('team_list'))
+        self.assertTrue(response.context['teams_without_members'])
+
+        response = self.client.get(reverse('team_detail', kwargs={'team_id': self.team.pk}))
+        self.assertEqual(response.context['member_count'], 2)
+        self.assertEqual(response.context['total_skills_count'], 1)
+
+class CommentServiceTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.project = ProjectFactory()
+        self.task = TaskFactory(project=self.project)
+        self.risk = RiskFactory(project=self.project, created_by=self.user)
+        self.quiet = RiskFactory(project=self.project, created_by=self.user)
+        self.project_comments = [CommentFactory(content_object=self.project, user=self.user) for _ in range(3)]
+        self.task_comments = [CommentFactory(content_object=self.task, user=self.user) for _ in range(2)]
+        self.risk_comment = CommentFactory(content_object=self.risk, user=self.user)
+        CommentFactory(content_object=self.risk, user=self.user).delete()
+        ContentType.objects.get_for_models(Project, Task, Risk)  # Warms the content type cache
+
+    def test_comments_for_mixed_objects(self):
+        """
+        Test that comments on objects of different models load in one query, oldest first, with their users.
+        """
+        with self.assertNumQueries(1):
+            grouped = comments_for([self.project, self.task, self.risk, self.quiet])
+            self.assertEqual([str(comment.user) for comment in grouped[comment_key(self.project)]], [str(self.user)] * 3)
+        self.assertEqual(grouped[comment_key(self.project)], self.project_comments)
+        self.assertEqual(grouped[comment_key(self.task)], self.task_comments)
+        self.assertEqual(grouped[comment_key(self.risk)], [self.risk_comment])
+        self.assertNotIn(comment_key(self.quiet), grouped)
+        self.assertEqual(comments_for([]), {})
+
+    def test_latest_comments_and_counts(self):
+        """
+        Test the newest N comments per object and the comment counts, each in one query, leaving out deleted comments.
+        """
+        with self.assertNumQueries(1):
+            latest = latest_comments([self.project, self.task], limit=2)
+        self.assertEqual(latest[comment_key(self.project)], self.project_comments[:0:-1])
+        self.assertEqual(latest[comment_key(self.task)], self.task_comments[::-1])
+
+        with self.assertNumQueries(1):
+            risks = attach_comment_counts([self.risk, self.quiet, self.project])
+        self.assertEqual([obj.comment_count for obj in risks], [1, 0, 3])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_list_page_shows_latest_comments(self):
+        """
+        Test that a RAID list page shows each row's comment count and newest comments, whatever the number of rows.
+        """
+        self.client.force_login(self.user)
+        CommentFactory(content_object=self.risk, user=self.user, comment_text='Supplier has confirmed a date')
+        url = reverse('risk_list', kwargs={'project_id': self.project.pk})
+        response = self.client.get(url)
+        risk = next(risk for risk in response.context['risks'] if risk.pk == self.risk.pk)
+        self.assertEqual((risk.comment_count, len(risk.latest_comments)), (2, 2))
+        self.assertContains(response, 'Supplier has confirmed a date')
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(5):
+            CommentFactory(content_object=RiskFactory(project=self.project, created_by=self.user), user=self.user)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(many), len(few))
+
+    def test_comment_pages(self):
+        """
+        Test paging back through an object's comments, newest first, and the JSON endpoint.
+        """
+        page, has_more = comment_page(self.project, limit=2)
+        self.assertEqual(page, self.project_comments[:0:-1])
+        self.assertTrue(has_more)
+        page, has_more = comment_page(self.project, before=page[-1].pk, limit=2)
+        self.assertEqual((page, has_more), ([self.project_comments[0]], False))
+
+        self.client.force_login(self.user)
+        url = reverse('object_comments', kwargs={'content_type': 'project', 'object_id': self.project.pk})
+        data = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([comment['id'] for comment in data['comments']], [self.project_comments[2].pk, self.project_comments[1].pk])
+        data = self.client.get(url, {'limit': 2, 'before': data['next']}).json()
+        self.assertEqual(([comment['id'] for comment in data['comments']], data['next']), ([self.project_comments[0].pk], None))
+        self.assertEqual(self.client.get(url, {'before': 'x'}).status_code, 400)
+
+        # Only the commentable models are looked up - other and stale content types are a 404
+        ContentType.objects.create(app_label='application', model='retiredmodel')
+        for content_type in ['retiredmodel', 'comment', 'attachment']:
+            url = reverse('object_comments', kwargs={'content_type': content_type, 'object_id': 1})
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+class AttachmentFileMixin:
+    """ Points MEDIA_ROOT at a temporary folder for the test and writes attachments into it """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = UserFactory(is_superuser=True)
+        self.project = ProjectFactory()
+
+    def attach(self, name, content):
+        os.makedirs(os.path.join(self.media_root, str(self.project.id)), exist_ok=True)
+        with open(os.path.join(self.media_root, str(self.project.id), name), 'wb') as f:
+            f.write(content)
+        return Attachment.objects.create(project=self.project, uploaded_by=self.user, file=f'{self.project.id}/{name}', filename=name)
+
+@override_settings(ATTACHMENT_EXTRACTION_WORKERS=0, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AttachmentExtractionTest(AttachmentFileMixin, TestCase):
+    def preview(self, attachment):
+        return self.client.get(reverse('preview_attachment', kwargs={'project_id': self.project.id, 'attachment_id': attachment.id}))
+
+    def test_extract_file(self):
+        """
+        Test that the text, preview and status come back for supported files, and errors for the rest.
+        """
+        notes = self.attach('notes.txt', b'x' * (PREVIEW_LENGTH + 10))
+        result = extract_file(os.path.join(self.media_root, notes.file.name))
+        self.assertEqual((result['status'], result['file_type'], len(result['text']), len(result['preview'])), (2, 'txt', PREVIEW_LENGTH + 10, PREVIEW_LENGTH))
+
+        broken = self.attach('broken.pdf', b'not a pdf')
+        self.assertEqual(extract_file(os.path.join(self.media_root, broken.file.name))['status'], 3)
+        self.assertEqual(extract_file(os.path.join(self.media_root, 'image.png'))['status'], 5)
+        image = self.attach('image.png', b'png')
+        self.assertEqual(extract_file(os.path.join(self.media_root, image.file.name))['status'], 4)
+
+    def test_preview_is_a_lookup(self):
+        """
+        Test that uploading extracts the text once, keyed by the file's hash, and the preview reads it back in one query.
+        """
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('notes.txt', b'Meeting notes')
+        response = self.client.post(reverse('add_attachment', kwargs={'project_id': self.project.id}), {'file': upload, 'description': 'Notes'})
+        self.assertEqual(response.status_code, 200)
+        attachment = Attachment.objects.get(project=self.project)
+        extraction = AttachmentText.objects.get(attachment=attachment)
+        self.assertEqual((extraction.status, extraction.preview, len(extraction.content_hash)), (2, 'Meeting notes', 64))
+
+        self.preview(attachment)  # Loads the session and user
+        with CaptureQueriesContext(connection) as queries:
+            data = self.preview(attachment).json()
+        self.assertEqual(data, {'type': 'txt', 'body': 'Meeting notes'})
+        self.assertEqual(len([q for q in queries if 'application_attachmenttext' in q['sql']]), 1)
+
+        # The same contents aren't extracted again, unless forced
+        self.assertEqual(queue_extraction(attachment).pk, extraction.pk)
+        self.assertEqual(AttachmentText.objects.filter(attachment=attachment).count(), 1)
+
+    def test_preview_of_older_and_missing_files(self):
+        """
+        Test that attachments without extracted text are extracted on their first preview, and missing files are a 404.
+        """
+        self.client.force_login(self.user)
+        attachment = self.attach('old.txt', b'Uploaded before previews')
+        self.assertEqual(self.preview(attachment).json()['body'], 'Uploaded before previews')
+
+        gone = self.attach('gone.txt', b'')
+        os.remove(os.path.join(self.media_root, gone.file.name))
+        self.assertEqual(self.preview(gone).status_code, 404)
+        self.assertEqual(self.preview(self.attach('image.png', b'png')).json(), {'error': 'This file type is not supported for preview.'})
+
+    def test_lost_pending_extraction_queued_again(self):
+        """
+        Test that a row left Pending past the timeout is extracted again, by the preview and the command,
+        while a recently queued one is left for its worker.
+        """
+        self.client.force_login(self.user)
+        attachment = self.attach('notes.txt', b'Extracted at last')
+        extraction = queue_extraction(attachment)
+        AttachmentText.objects.filter(pk=extraction.pk).update(status=1, preview='')  # Pending
+
+        self.assertEqual(self.preview(attachment).status_code, 202)
+        self.assertEqual(queue_extraction(attachment).status, 1)
+
+        AttachmentText.objects.filter(pk=extraction.pk).update(queued_datetime=timezone.now() - PENDING_TIMEOUT * 2)
+        self.assertEqual(self.preview(attachment).json()['body'], 'Extracted at last')
+
+        AttachmentText.objects.filter(pk=extraction.pk).update(status=1, queued_datetime=timezone.now() - PENDING_TIMEOUT * 2)
+        call_command('extract_attachments', stdout=StringIO())
+        extraction.refresh_from_db()
+        self.assertEqual((extraction.status, extraction.preview), (2, 'Extracted at last'))
+        self.assertEqual(AttachmentText.objects.filter(attachment=attachment).count(), 1)
+
+@override_settings(ATTACHMENT_EXTRACTION_WORKERS=1)
+class AttachmentExtractionPoolTest(AttachmentFileMixin, TransactionTestCase):
+    def test_extracts_in_worker_pool(self):
+        """
+        Test that the text is extracted in a worker process once the upload is committed.
+        """
+        attachment = self.attach('notes.txt', b'Extracted elsewhere')
+        extraction = queue_extraction(attachment)
+        self.assertTrue(wait_for_extractions(timeout=60))
+        extraction.refresh_from_db()
+        self.assertEqual((extraction.status, extraction.preview), (2, 'Extracted elsewhere'))
+
+@override_settings(ATTACHMENT_EXTRACTION_WORKERS=0, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AttachmentStorageTest(AttachmentFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def upload(self, name, content):
+        response = self.client.post(
+            reverse('add_attachment', kwargs={'project_id': self.project.id}),
+            {'file': SimpleUploadedFile(name, content), 'description': name},
+        )
+        self.assertEqual(response.status_code, 200)
+        return Attachment.objects.get(project=self.project, description=name)
+
+    def download(self, attachment, **headers):
+        return self.client.get(
+            reverse('download_attachment', kwargs={'project_id': self.project.id, 'attachment_id': attachment.id}), headers=headers
+        )
+
+    def test_duplicate_uploads_share_a_blob(self):
+        """
+        Test that the same contents uploaded twice are stored once, and the file goes when the last attachment does.
+        """
+        first = self.upload('report.pdf', b'%PDF-1.4 same contents')
+        second = self.upload('copy.pdf', b'%PDF-1.4 same contents')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual((second.blob.reference_count, second.blob.size), (2, 22))
+        self.assertEqual(first.content_type, 'application/pdf')
+        path = os.path.join(self.media_root, first.blob.file.name)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'blobs', 'tmp')), [])
+
+        first.delete()
+        second.blob.refresh_from_db()
+        self.assertEqual(second.blob.reference_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_detect_content_type(self):
+        """
+        Test that the type comes from the file's bytes, with the name refining zip and OLE containers.
+        """
+        self.assertEqual(detect_content_type('scan.txt', b'%PDF-1.7'), 'application/pdf')
+        self.assertEqual(detect_content_type('plan.docx', b'PK\x03\x04'), 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+        self.assertEqual(detect_content_type('mail.msg', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'), 'application/vnd.ms-outlook')
+        self.assertEqual(detect_content_type('notes.txt', b'hello'), 'text/plain')
+        self.assertEqual(detect_content_type('unknown', b'hello'), 'application/octet-stream')
+
+    def test_download_headers_and_conditional_requests(self):
+        """
+        Test the type, ETag and Last-Modified on downloads, and that a matching If-None-Match gets a 304.
+        """
+        attachment = self.upload('notes.txt', b'0123456789')
+        response = self.download(attachment)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], f'"{attachment.blob.sha256}"')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertIn('notes.txt', response['Content-Disposition'])
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        self.assertEqual(self.download(attachment, if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.download(attachment, if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_active_content_is_not_served_inline(self):
+        """
+        Test that uploaded HTML and SVG files are downloaded as octet-stream attachments rather than rendered.
+        """
+        for name, content in [
+            ('page.html', b'<html><script>alert(1)</script></html>'),
+            ('drawing.svg', b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'),
+        ]:
+            response = self.download(self.upload(name, content))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/octet-stream')
+            self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+            response = self.download(Attachment.objects.get(filename=name), range='bytes=0-4')
+            self.assertEqual((response.status_code, response['Content-Type']), (206, 'application/octet-stream'))
+
+        response = self.download(self.upload('scan.pdf', b'%PDF-1.4 a scan'))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+
+    def test_range_requests(self):
+        """
+        Test single, open-ended and suffix ranges, unsatisfiable ranges and an If-Range for another version.
+        """
+        attachment = self.upload('notes.txt', b'0123456789')
+        response = self.download(attachment, range='bytes=2-5')
+        self.assertEqual((response.status_code, response['Content-Range'], response['Content-Length']), (206, 'bytes 2-5/10', '4'))
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(b''.join(self.download(attachment, range='bytes=7-').streaming_content), b'789')
+        self.assertEqual(b''.join(self.download(attachment, range='bytes=-3').streaming_content), b'789')
+
+        response = self.download(attachment, range='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        self.assertEqual(self.download(attachment, range='bytes=2-5', if_range='"other"').status_code, 200)
+        self.assertEqual(self.download(attachment, range='bytes=0-1,4-5').status_code, 200)
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual([parse_range(header, 0) for header in ['bytes=-5', 'bytes=0-', 'bytes=0-0']], [False] * 3)
+
+class AssignmentRecommenderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.monday = date(2024, 1, 1)
+        self.friday = date(2024, 1, 5)
+        self.network, self.server = SkillFactory(), SkillFactory()
+        self.expert = AssetFactory(name='Expert', skills=[self.network, self.server], normal_work_week=40)
+        self.colleague = AssetFactory(name='Colleague', skills=[self.network, self.server], normal_work_week=40)
+        self.partial = AssetFactory(name='Partial', skills=[self.network], normal_work_week=40)
+        self.project = ProjectFactory(project_status=1)
+
+    def unassigned_task(self, hours=40):
+        return TaskFactory(project=self.project, assigned_to=None, skills_required=[self.network, self.server],
+                           planned_start_date=self.monday, planned_end_date=self.friday, estimated_time_to_complete=timedelta(hours=hours))
+
+    def test_recommendations_ranked(self):
+        """
+        Test that assets with every skill and free time rank above busy or partly skilled ones.
+        """
+        TaskFactory(assigned_to=self.expert, task_status=2, planned_start_date=self.monday, planned_end_date=self.friday,
+                    estimated_time_to_complete=timedelta(hours=40))
+        ranked = recommend_assignees([self.network.pk, self.server.pk], self.monday, self.friday, 20)
+        self.assertEqual([asset['asset_id'] for asset in ranked], [self.colleague.pk, self.expert.pk])
+        self.assertEqual(ranked[0]['free_hours'], 40)
+        self.assertEqual(ranked[1]['open_tasks'], 1)
+
+        # Nobody has both skills, so the closest matches are offered
+        sql = SkillFactory()
+        ranked = recommend_assignees([self.network.pk, sql.pk], self.monday, self.friday, 20, k=2)
+        self.assertEqual([asset['skill_coverage'] for asset in ranked], [0.5, 0.5])
+
+    def test_batch_spreads_the_load(self):
+        """
+        Test that the batch assigns tasks greedily, booking each one before choosing for the next.
+        """
+        first, second = self.unassigned_task(), self.unassigned_task()
+        plan = assign_unassigned_tasks([self.project.pk], dry_run=True)
+        self.assertEqual({asset_id for task_id, asset_id in plan}, {self.expert.pk, self.colleague.pk})
+        self.assertEqual(Task.objects.filter(pk__in=[first.pk, second.pk], assigned_to__isnull=True).count(), 2)
+
+        assign_unassigned_tasks([self.project.pk])
+        first.refresh_from_db()
+        self.assertEqual(first.task_status, 2)
+        self.assertIn(first.assigned_to_id, {self.expert.pk, self.colleague.pk})
+        self.assertEqual(first.history.first().history_change_reason, 'Assigned automatically')
+
+    def test_batch_queries_are_constant(self):
+        """
+        Test that the number of queries to plan a batch does not grow with the number of tasks.
+        """
+        self.unassigned_task()
+        assign_unassigned_tasks(dry_run=True)  # Builds the skill index
+        with CaptureQueriesContext(connection) as small:
+            assign_unassigned_tasks(dry_run=True)
+        for _ in range(10):
+            self.unassigned_task()
+        with CaptureQueriesContext(connection) as large:
+            assign_unassigned_tasks(dry_run=True)
+        self.assertEqual(len(small), len(large))
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_views_and_command(self):
+        """
+        Test the recommendation endpoint, the project auto-assign button and the management command.
+        """
+        self.client.force_login(UserFactory(is_superuser=True))
+        response = self.client.get(reverse('assignee_recommendations'), {
+            'skills[]': [self.network.pk, self.server.pk], 'start_date': '2024-01-01', 'end_date': '2024-01-05', 'estimate': '8', 'k': '1'
+        })
+        self.assertEqual(len(response.json()['assets']), 1)
+
+        task = self.unassigned_task()
+        response = self.client.post(reverse('project_auto_assign', kwargs={'project_id': self.project.pk}))
+        self.assertRedirects(response, reverse('project_taskview', kwargs={'project_id': self.project.pk}))
+        task.refresh_from_db()
+        self.assertIsNotNone(task.assigned_to_id)
+
+        self.unassigned_task()
+        out = StringIO()
+        call_command('assign_tasks', project=[self.project.pk], dry_run=True, stdout=out)
+        self.assertIn('1 of 1 unassigned task(s) would be assigned', out.getvalue())
+
+@override_settings(ATTACHMENT_EXTRACTION_WORKERS=0, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SearchTest(AttachmentFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.project.project_description = 'Replace the quillwort servers in the main data centre'
+        self.project.save()
+        self.task = TaskFactory(project=self.project, task_name='Order hardware', task_details='Order the quillwort racks and cabling')
+        self.risk = RiskFactory(project=self.project, risk_details='Quillwort delivery could slip <b>past</b> the outage window')
+        self.comment = CommentFactory(content_object=self.task, user=self.user, comment_text='Supplier confirmed the quillwort racks')
+
+    def found(self, query, doc_types=None):
+        return [(result['doc_type'], result['object_id']) for result in search(query, doc_types)['results']]
+
+    def test_ranking_snippets_and_facets(self):
+        """
+        Test that every matching type is found, title matches rank first, snippets are escaped and marked, and facets count each type.
+        """
+        cutover = TaskFactory(project=self.project, task_name='Quillwort cut-over', task_details='Switch to the new racks')
+        found = search('quillwort')
+        self.assertEqual(found['results'][0]['title'], 'Quillwort cut-over')
+        self.assertEqual(found['facets'], {'project': 1, 'task': 2, 'risk': 1, 'comment': 1})
+        self.assertEqual((found['total'], found['more'], found['capped']), (5, False, []))
+
+        risk = next(result for result in search('quillwort delivery')['results'])
+        self.assertEqual(risk['url'], reverse('risk_detail', kwargs={'project_id': self.project.pk, 'risk_id': self.risk.pk}))
+        self.assertIn('<mark>Quillwort</mark> <mark>delivery</mark>', risk['snippet'])
+        self.assertIn('&lt;b&gt;past&lt;/b&gt;', risk['snippet'])
+
+        # Types are filtered, but the facets still count every type; a short last word matches as a prefix
+        self.assertEqual(
+            set(self.found('quillwort', ['task', 'comment'])), {('task', cutover.pk), ('task', self.task.pk), ('comment', self.comment.pk)}
+        )
+        self.assertEqual(search('quillwort', ['comment'])['facets']['task'], 2)
+        self.assertEqual(self.found('rack cabl'), [('task', self.task.pk)])
+        self.assertEqual(self.found('cablin'), [])  # Too long to be looked up as a prefix
+        self.assertEqual(self.found('"quillwort (*: -'), self.found('quillwort'))
+        self.assertEqual(search('  ')['results'], [])
+
+    def test_index_follows_changes(self):
+        """
+        Test that saving, soft deleting and deleting objects keeps the index up to date.
+        """
+        self.risk.risk_details = 'Mitigated by a second supplier'
+        self.risk.save()
+        self.assertIn(('risk', self.risk.pk), self.found('supplier'))
+        self.assertNotIn(('risk', self.risk.pk), self.found('quillwort'))
+
+        with self.assertNumQueries(3):
+            self.risk.save()  # The risk, its history and a look at the document, which is unchanged so not written
+
+        self.task.delete()  # Soft delete
+        self.assertNotIn(('task', self.task.pk), self.found('quillwort'))
+        self.comment.delete()
+        self.assertEqual(self.found('supplier'), [('risk', self.risk.pk)])
+
+        self.project.delete()
+        self.assertFalse(SearchDocument.objects.filter(project=self.project).exists())
+
+    def test_comments_follow_their_parent(self):
+        """
+        Test that a task's comments leave the index with it and come back when it is restored, and that restoring
+        a project indexes its tasks, RAID items, comments and attachments again.
+        """
+        self.task.delete()  # Soft delete
+        self.assertEqual(self.found('supplier'), [])
+        Task.all_objects.get(pk=self.task.pk).undelete()
+        self.assertEqual(self.found('supplier'), [('comment', self.comment.pk)])
+
+        CommentFactory(content_object=self.project, user=self.user, comment_text='Kickoff moved for quillwort')
+        queue_extraction(self.attach('minutes.txt', b'Agreed to postpone the quillwort migration'))
+        before = set(self.found('quillwort'))
+        self.assertEqual(len(before), 6)
+
+        self.project.delete()
+        self.assertEqual(self.found('quillwort'), [])
+        Project.all_objects.get(pk=self.project.pk).undelete()
+        self.assertEqual(set(self.found('quillwort')), before)
+
+        # Comments stay in the database when their parent is deleted outright, but not in the index
+        task = Task.objects.get(pk=self.task.pk)
+        CommentFactory(content_object=task, user=self.user, comment_text='Zeppelin spares ordered')
+        self.assertEqual(len(self.found('zeppelin')), 1)
+        task.delete(force_policy=HARD_DELETE)
+        self.assertEqual(self.found('zeppelin'), [])
+
+    def test_attachment_text(self):
+        """
+        Test that extracted attachment text is searchable, and leaves the index with the attachment.
+        """
+        attachment = self.attach('minutes.txt', b'Agreed to postpone the quillwort migration')
+        queue_extraction(attachment)
+        found = search('postpone')['results']
+        self.assertEqual([(result['doc_type'], result['title']) for result in found], [('attachment', 'minutes.txt')])
+        self.assertEqual(found[0]['url'], reverse('download_attachment', kwargs={'project_id': self.project.pk, 'attachment_id': attachment.pk}))
+
+        attachment.delete()
+        self.assertEqual(self.found('postpone'), [])
+
+    def test_rank_candidates(self):
+        """
+        Test that title matches outweigh body matches, and more matches in a shorter body rank higher.
+        """
+        candidates = [
+            (1, 'Plan', 'the \x02rack\x03 is late'),
+            (2, '\x02Rack\x03 order', 'nothing else'),
+            (3, 'Plan', '\x02rack\x03 \x02rack\x03'),
+        ]
+        self.assertEqual([rowid for rowid, score in rank_candidates(candidates)], [2, 3, 1])
+        self.assertEqual(rank_candidates([]), [])
+        self.assertEqual(fts_match(['old', 'rack'], ['task']), '{title body} : ("old" "rack"*) AND doc_type : (doctypetask)')
+
+    def test_facets_are_capped(self):
+        """
+        Test that counts stop at FACET_LIMIT and show as capped.
+        """
+        SearchDocument.objects.bulk_create([
+            SearchDocument(doc_type='comment', object_id=number, title='Zeppelin', url='/') for number in range(1000, FACET_LIMIT + 1002)
+        ])
+        found = search('zeppelin', limit=5)
+        self.assertEqual((found['facets'], found['capped'], found['total']), ({'comment': FACET_LIMIT}, ['comment'], FACET_LIMIT))
+        self.assertTrue(found['more'])
+        self.assertEqual(len(found['results']), 5)
+
+    def test_truncated_results(self):
+        """
+        Test that with more matches than RANK_CANDIDATES, older title matches are still ranked, paging stops
+        at RANK_CANDIDATES and the results are marked as truncated on the page and in the JSON.
+        """
+        hangar = SearchDocument.objects.create(doc_type='comment', object_id=100000, title='Zeppelin hangar', body='', url='/')
+        SearchDocument.objects.bulk_create([
+            SearchDocument(doc_type='comment', object_id=number, title='Note', body='zeppelin', url='/') for number in range(100001, 100011 + RANK_CANDIDATES)
+        ])
+        found = search('zeppelin', limit=5)
+        self.assertTrue(found['truncated'])
+        self.assertEqual(found['results'][0]['object_id'], hangar.object_id)
+
+        found = search('zeppelin', limit=5, offset=RANK_CANDIDATES - 5)
+        self.assertEqual((len(found['results']), found['more']), (5, False))
+        self.assertEqual(search('zeppelin', offset=RANK_CANDIDATES)['results'], [])
+        self.assertFalse(search('quillwort')['truncated'])
+
+        self.client.force_login(self.user)
+        self.assertTrue(self.client.get(reverse('search_data'), {'q': 'zeppelin'}).json()['truncated'])
+        self.assertContains(self.client.get(reverse('search'), {'q': 'zeppelin'}), 'too many matches to rank them all')
+        self.assertNotContains(self.client.get(reverse('search'), {'q': 'quillwort'}), 'too many matches to rank them all')
+
+    def test_views_and_rebuild_command(self):
+        """
+        Test the search page and JSON endpoint, and that the rebuild command restores the index.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('search'), {'q': 'quillwort', 'type': 'task'})
+        self.assertContains(response, 'Order hardware')
+        self.assertNotContains(response, 'Quillwort delivery')
+        data = self.client.get(reverse('search_data'), {'q': 'quillwort', 'page': 'x'}).json()
+        self.assertEqual((data['total'], data['page'], data['facets']['comment']), (4, 1, 1))
+        self.assertIn('<mark>quillwort</mark>', data['results'][0]['snippet'].lower())
+
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 4 search document(s).', out.getvalue())
+        self.assertEqual(len(self.found('quillwort')), 4)
+
+@override_settings(ATTACHMENT_EXTRACTION_WORKERS=0, STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AsyncEndpointTest(AttachmentFileMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        performance_stats.clear()
+        self.skill = SkillFactory()
+        self.asset = AssetFactory(name='Async Asset', skills=[self.skill])
+        self.task = TaskFactory(project=self.project, task_status=2)
+        self.attachment = self.attach('notes.txt', b'Read on a thread')
+        self.async_client = AsyncClient()
+
+    def test_endpoints_are_async(self):
+        """
+        Test that the JSON endpoints are coroutines, so they don't hold a thread under ASGI.
+        """
+        for url in [
+            reverse('filter_assets_by_skills'),
+            reverse('get_prereq_task_dates'),
+            reverse('project_events'),
+            reverse('preview_attachment', kwargs={'project_id': self.project.pk, 'attachment_id': self.attachment.pk}),
+        ]:
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_async_requests(self):
+        """
+        Test the endpoints through the async client: logins are checked, missing objects are a 404 and queries are still counted.
+        """
+        filter_url = reverse('filter_assets_by_skills')
+        response = await self.async_client.get(filter_url, {'skills[]': [self.skill.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(filter_url, {'skills[]': [self.skill.pk], 'rank': 'workload'})
+        self.assertEqual(response.json(), {'assets': [{'asset_id': self.asset.pk, 'name': 'Async Asset', 'open_tasks': 0}]})
+        self.assertEqual(await sync_to_async(self.async_client.session.get)('filtered_assets'), [self.asset.pk])
+
+        response = await self.async_client.get(reverse('get_prereq_task_dates'), {'task_id': self.task.pk})
+        self.assertEqual(response.json()['start_date'], self.task.planned_start_date.strftime('%Y-%m-%d'))
+        response = await self.async_client.get(reverse('get_prereq_task_dates'), {'task_id': self.task.pk + 100})
+        self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get(
+            reverse('preview_attachment', kwargs={'project_id': self.project.pk, 'attachment_id': self.attachment.pk})
+        )
+        self.assertEqual(response.json(), {'type': 'txt', 'body': 'Read on a thread'})
+
+        response = await self.async_client.get(reverse('project_events'))
+        repeat = await self.async_client.get(reverse('project_events'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(repeat.status_code, 304)
+
+        stats = {row['view']: row for row in performance_stats.summary()}
+        self.assertGreater(stats['filter_assets_by_skills']['max_queries'], 0)
@@ -10,6 +10,12 @@ urlpatterns = [
     ################################## Authorised users URLS ##################################
     # Home Page
     path('', views.home, name='home'),  # Home page view
+    path('dashboard/stats/', views.dashboard_stats, name='dashboard_stats'),  # Home page figures as JSON
+    path('performance/summary/', views.performance_summary, name='performance_summary'),  # Rolling query/timing summary per view (staff only)
+    # Search
+    path('search/', views.search_page, name='search'),  # Full-text search across projects, tasks, RAID items, comments and attachments
+    path('search/data/', views.search_data, name='search_data'),  # Search results as JSON
+
     # Logout
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
 
@@ -36,6 +42,8 @@ urlpatterns = [
     path('tasks/unassigned/', TaskListView.as_view(), name='unassigned_tasks'),
     path('tasks/open/', TaskListView.as_view(), name='open_task_list'),
     path('tasks/completed/', TaskListView.as_view(), name='completed_task_list'),
+    path('tasks/data/', views.task_list_data, name='task_list_data'),  # Server-side data for the task list tables
+    path('tasks/export/', views.task_list_export, name='task_list_export'),  # Every task in a task list table as CSV
     
     path('projects/<int:project_id>/tasks/', TaskListView.as_view(), name='project_task_list'),
 
@@ -73,11 +81,13 @@ urlpatterns = [
 
     # Comments
     path('add_comment/<str:content_type>/<int:object_id>/', add_comment, name='add_comment'), # Add Comment to an Object
+    path('ajax/comments/<str:content_type>/<int:object_id>/', views.object_comments, name='object_comments'),  # Newest comments on an object, a page at a time
 
     # Calendar Stuff
     path('projects/events/', project_events, name='project_events'), # Endpoint to retrieve Project Events
     path('projects/calendar/', project_calendar, name='project_calendar'), # Projects Calendar (from Menu)
     path('projects/<int:project_id>/tasks/calendar/', ProjectTaskCalendarView.as_view(), name='project_task_calendar'), # Project Task Calendar
+    path('projects/<int:project_id>/tasks/calendar/events/', views.project_task_events, name='project_task_events'), # Task events for the Project Task Calendar
     
     # Attachments Views
     path('projects/<int:project_id>/attachments/', AttachmentListView.as_view(), name='attachment_list'),  # List Tasks for Project
@@ -100,7 +110,11 @@ urlpatterns = [
 
     path('ajax/filter_assets/', filter_assets_by_skills, name='filter_assets_by_skills'),
     path('ajax/get_task_dates/', views.get_prereq_task_dates, name='get_prereq_task_dates'),
+    path('ajax/recommend_assignees/', views.assignee_recommendations, name='assignee_recommendations'),  # Best assets for a task's skills and dates
+    path('projects/<int:project_id>/tasks/auto-assign/', views.project_auto_assign, name='project_auto_assign'),  # Assign every unassigned task on a project
 
     path('projects/<int:project_id>/gantt/', ProjectGanttChartView.as_view(), name='project_gantt_chart'),
+    path('projects/<int:project_id>/gantt/data/', views.project_gantt_data, name='project_gantt_data'),  # Gantt chart tasks, or the changes since a version
+    path('gantt/portfolio/data/', views.portfolio_gantt_data, name='portfolio_gantt_data'),  # Gantt chart tasks for several projects, streamed
 
 ]
\ No newline at end of file
@@ -0,0 +1,182 @@
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+
+from ..models import Asset, Project, Task
+from .capacity_helpers import capacity_matrix
+from .dashboard_helpers import invalidate_dashboard_stats
+from .rollup_helpers import build_rollups
+from .skill_helpers import get_skill_index
+from .time_helpers import to_hours
+from .workload_helpers import OPEN_PROJECT_STATUSES
+
+# How much each part of the score counts - skills matter most, then free time, then how busy the asset is
+SKILL_WEIGHT = 0.6
+CAPACITY_WEIGHT = 0.3
+WORKLOAD_WEIGHT = 0.1
+DEFAULT_RECOMMENDATIONS = 5
+
+class AssignmentPlanner:
+    """
+    Scores assets for tasks from the skill index, the capacity matrices for a date range and the
+    number of tasks each asset already has assigned. Assigning a task through the planner adds its
+    hours and count to the asset, so later tasks in a batch see the load of earlier ones.
+    """
+    def __init__(self, start_date, end_date):
+        self.index = get_skill_index()
+        self.start_date = start_date
+        self.dates, self.capacity, self.allocated = capacity_matrix(Asset.objects.all(), start_date, end_date)
+        # Only assets in both the index and the matrices can be scored
+        self.skill_masks = {asset_id: mask for asset_id, mask in self.index.masks if asset_id in self.capacity}
+        self.open_tasks = dict(
+            Task.objects.filter(task_status=2)  # Assigned
+            .values('assigned_to_id').annotate(open_tasks=Count('id')).order_by()
+            .values_list('assigned_to_id', 'open_tasks')
+        )
+        self._candidates = {}  # Many tasks ask for the same skills, so the matches are kept for the batch
+
+    def _window(self, start_date, end_date):
+        """ The slice of the matrix rows covering the task's planned window (the whole range if it has no dates) """
+        if not start_date or not end_date:
+            return 0, len(self.dates)
+        begin = max((start_date - self.start_date).days, 0)
+        finish = min((end_date - self.start_date).days + 1, len(self.dates))
+        return begin, max(begin, finish)
+
+    def candidates(self, skill_ids):
+        """ The assets with every required skill, or if there are none, those with the most of them """
+        key = frozenset(skill_ids)
+        if key not in self._candidates:
+            if not skill_ids:
+                matches = list(self.skill_masks)
+            else:
+                matches = self.index.having_all(skill_ids)
+                if not matches:
+                    ranked = self.index.having_any(skill_ids)
+                    matches = [asset_id for asset_id, overlap in ranked if overlap == ranked[0][1]]
+            self._candidates[key] = [asset_id for asset_id in matches if asset_id in self.skill_masks]
+        return self._candidates[key]
+
+    def score(self, asset_id, wanted, skill_count, begin, finish, hours):
+        """ Returns (score, skill coverage, free hours in the window) for one asset """
+        coverage = (self.skill_masks[asset_id] & wanted).bit_count() / skill_count if skill_count else 1.0
+        free = sum(self.capacity[asset_id][begin:finish]) - sum(self.allocated[asset_id][begin:finish])
+        if hours:
+            fit = max(min(free / hours, 1.0), 0.0)
+        else:
+            fit = 1.0 if free > 0 else 0.0
+        workload = 1 / (1 + self.open_tasks.get(asset_id, 0))
+        return SKILL_WEIGHT * coverage + CAPACITY_WEIGHT * fit + WORKLOAD_WEIGHT * workload, coverage, free
+
+    def rank(self, skill_ids, start_date, end_date, hours, k=DEFAULT_RECOMMENDATIONS):
+        """ Returns the k best assets for a task, best first """
+        wanted = self.index.mask(skill_ids)
+        begin, finish = self._window(start_date, end_date)
+        scored = []
+        for asset_id in self.candidates(skill_ids):
+            score, coverage, free = self.score(asset_id, wanted, len(skill_ids), begin, finish, hours)
+            scored.append({
+                'asset_id': asset_id,
+                'name': self.index.names[asset_id],
+                'score': round(score, 3),
+                'skill_coverage': round(coverage, 2),
+                'free_hours': round(free, 2),
+                'open_tasks': self.open_tasks.get(asset_id, 0),
+            })
+        scored.sort(key=lambda candidate: -candidate['score'])  # Stable, so ties stay in name order
+        return scored[:k]
+
+    def best(self, skill_ids, start_date, end_date, hours):
+        """ Returns the id of the best asset for a task (or None), as rank() with k=1 but without building the details """
+        wanted = self.index.mask(skill_ids)
+        begin, finish = self._window(start_date, end_date)
+        best_asset, best_score = None, None
+        for asset_id in self.candidates(skill_ids):
+            score = self.score(asset_id, wanted, len(skill_ids), begin, finish, hours)[0]
+            if best_score is None or score > best_score:
+                best_asset, best_score = asset_id, score
+        return best_asset
+
+    def assign(self, asset_id, start_date, end_date, hours):
+        """ Books a task's hours evenly over the asset's work days in its window """
+        self.open_tasks[asset_id] = self.open_tasks.get(asset_id, 0) + 1
+        begin, finish = self._window(start_date, end_date)
+        days = [index for index in range(begin, finish) if self.capacity[asset_id][index]] or list(range(begin, finish))
+        row = self.allocated[asset_id]
+        for index in days:
+            row[index] += (hours or 0) / len(days)
+
+def _planning_range(windows):
+    """ The date range covering every task window, or just today when none of the tasks have dates """
+    starts = [start for start, end in windows if start and end]
+    ends = [end for start, end in windows if start and end]
+    today = timezone.now().date()
+    return (min(starts), max(ends)) if starts else (today, today)
+
+def recommend_assignees(skill_ids, start_date=None, end_date=None, hours=None, k=DEFAULT_RECOMMENDATIONS):
+    """ Returns the k best assets for a task with these skills, planned window and estimated hours """
+    planning_start, planning_end = _planning_range([(start_date, end_date)])
+    planner = AssignmentPlanner(planning_start, planning_end)
+    return planner.rank(list(skill_ids), start_date, end_date, hours, k)
+
+def unassigned_tasks(project_ids=None):
+    """ Unassigned tasks on the given projects, or on every open project, highest priority first """
+    tasks = Task.objects.filter(task_status=1, assigned_to__isnull=True)  # Unassigned
+    if project_ids is not None:
+        tasks = tasks.filter(project_id__in=project_ids)
+    else:
+        tasks = tasks.filter(project__project_status__in=OPEN_PROJECT_STATUSES)
+    return tasks.order_by('-project__priority', '-priority', 'planned_start_date', 'id')
+
+def plan_assignments(tasks):
+    """
+    Greedily picks the best asset for each task in order, booking each choice before scoring the next,
+    so the load is spread rather than every task going to the same asset. Returns a list of
+    (task id, asset id or None). Reads the tasks and their skills in two queries.
+    """
+    rows = list(tasks.values_list('id', 'planned_start_date', 'planned_end_date', 'estimated_time_to_complete'))
+    skills = {}
+    for task_id, skill_id in Task.skills_required.through.objects.filter(task_id__in=[row[0] for row in rows]).values_list('task_id', 'skill_id'):
+        skills.setdefault(task_id, []).append(skill_id)
+
+    planning_start, planning_end = _planning_range([(start, end) for task_id, start, end, estimate in rows])
+    planner = AssignmentPlanner(planning_start, planning_end)
+
+    plan = []
+    for task_id, start_date, end_date, estimate in rows:
+        hours = to_hours(estimate)
+        asset_id = planner.best(skills.get(task_id, []), start_date, end_date, hours)
+        if asset_id is not None:
+            planner.assign(asset_id, start_date, end_date, hours)
+        plan.append((task_id, asset_id))
+    return plan
+
+def assign_unassigned_tasks(project_ids=None, dry_run=False):
+    """
+    Assigns every unassigned task on the projects (or every open project) to the best asset.
+    Returns the plan from plan_assignments(). With dry_run nothing is saved.
+    """
+    plan = plan_assignments(unassigned_tasks(project_ids))
+    assignments = {task_id: asset_id for task_id, asset_id in plan if asset_id is not None}
+    if dry_run or not assignments:
+        return plan
+
+    # bulk_update() skips save(), so the status change and last updated time are set here
+    now = timezone.now()
+    tasks = list(Task.objects.filter(pk__in=assignments))
+    for task in tasks:
+        task.assigned_to_id = assignments[task.pk]
+        task.task_status = 2  # Assigned
+        task.last_updated_datetime = now
+    with transaction.atomic():
+        bulk_update_with_history(
+            tasks, Task, ['assigned_to', 'task_status', 'last_updated_datetime'],
+            batch_size=500, default_change_reason='Assigned automatically',
+        )
+
+    # Saving a task refreshes these through signals, but bulk_update() does not send them
+    for rollup in build_rollups(Project.objects.filter(pk__in={task.project_id for task in tasks})):
+        rollup.save()
+    invalidate_dashboard_stats()
+    return plan
@@ -0,0 +1,31 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+
+# Django 5.0 has no async versions of these, and request.user, request.session and get_object_or_404()
+# would query the database from the event loop, which Django refuses to do
+
+def alogin_required(view):
+    """ login_required() for async views - the user is loaded with request.auser() """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user  # Already loaded, so anything later in the request doesn't look it up again
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+async def aget_object_or_404(klass, **kwargs):
+    """ get_object_or_404() for async views. Takes a model or a queryset. """
+    queryset = klass._default_manager.all() if hasattr(klass, '_default_manager') else klass
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+async def asession_set(request, key, value):
+    """ Sets a session value from an async view - the session is read from the database the first time it's used """
+    await sync_to_async(request.session.__setitem__)(key, value)
@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import AttachmentText
+from .search_helpers import index_object
+from .text_extraction import extract_file, file_sha256, is_supported
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRACTION_WORKERS = 2  # Used when ATTACHMENT_EXTRACTION_WORKERS isn't set - 0 extracts in the request instead
+
+# A row still Pending this long after it was queued has been lost - e.g. the process that queued it stopped before the
+# worker finished - and is queued again
+PENDING_TIMEOUT = timedelta(minutes=10)
+
+# One pool per web process, started the first time a file is queued
+_executor = None
+_executor_lock = threading.Lock()
+
+# Extractions submitted but not yet saved, so a management command can wait for them
+_in_flight = 0
+_in_flight_changed = threading.Condition()
+
+def extraction_workers():
+    return getattr(settings, 'ATTACHMENT_EXTRACTION_WORKERS', DEFAULT_EXTRACTION_WORKERS)
+
+def attachment_path(attachment):
+    return os.path.join(settings.MEDIA_ROOT, attachment.file.name)
+
+def _get_executor(reset=False):
+    global _executor
+    with _executor_lock:
+        if _executor is None or reset:
+            # Workers are spawned rather than forked - they only import text_extraction, not the
+            # web process's threads and database connections
+            _executor = ProcessPoolExecutor(max_workers=extraction_workers(), mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def save_extraction(extraction_id, result):
+    """ Stores an extraction result (from text_extraction.extract_file) on its row, and makes the text searchable """
+    AttachmentText.objects.filter(pk=extraction_id).update(extracted_datetime=timezone.now(), **result)
+    extraction = AttachmentText.objects.select_related('attachment').filter(pk=extraction_id).first()
+    if extraction is not None:
+        index_object(extraction)
+
+def _extraction_done(extraction_id, submitted_by, future):
+    global _in_flight
+    try:
+        try:
+            result = future.result()
+        except Exception as e:  # The worker died, rather than the file failing to parse
+            result = {'status': 3, 'error': f'Extraction failed: {e}'}  # Failed
+        save_extraction(extraction_id, result)
+    except Exception:
+        logger.exception("Could not save the extracted text for attachment text %s", extraction_id)
+    finally:
+        # Usually called on the pool's result thread, whose connection would otherwise stay open
+        if threading.get_ident() != submitted_by:
+            connection.close()
+        with _in_flight_changed:
+            _in_flight -= 1
+            _in_flight_changed.notify_all()
+
+def _submit(extraction_id, file_path, file_name):
+    global _in_flight
+    with _in_flight_changed:
+        _in_flight += 1
+    try:
+        future = _get_executor().submit(extract_file, file_path, file_name)
+    except BrokenProcessPool:
+        future = _get_executor(reset=True).submit(extract_file, file_path, file_name)
+    submitted_by = threading.get_ident()
+    future.add_done_callback(lambda done: _extraction_done(extraction_id, submitted_by, done))
+
+def queue_extraction(attachment, force=False):
+    """
+    Makes sure the text of the attachment's current file has been (or is being) extracted. Files are
+    hashed first, so contents already extracted aren't parsed again unless force is set - rows left Pending
+    for longer than PENDING_TIMEOUT are queued again, as their extraction was lost. Parsing happens in
+    the worker pool once the transaction commits - unsupported or missing files, and everything when
+    ATTACHMENT_EXTRACTION_WORKERS is 0, are dealt with straight away. Returns the AttachmentText row.
+    """
+    file_path = attachment_path(attachment)
+    if not os.path.exists(file_path):
+        content_hash = ''
+    elif attachment.blob_id:
+        content_hash = attachment.blob.sha256  # Hashed as it was uploaded
+    else:
+        content_hash = file_sha256(file_path)
+    extraction, created = AttachmentText.objects.get_or_create(attachment=attachment, content_hash=content_hash)
+    if not created:
+        rows = AttachmentText.objects.filter(pk=extraction.pk)
+        if not force:
+            # File Missing - it may be back now - or lost while Pending. Only one caller gets to queue it again.
+            rows = rows.filter(Q(status=5) | Q(status=1, queued_datetime__lt=timezone.now() - PENDING_TIMEOUT))
+        if not rows.update(status=1, error='', queued_datetime=timezone.now()):  # Pending
+            return extraction
+
+    if extraction_workers() and content_hash and is_supported(attachment.filename):
+        transaction.on_commit(lambda: _submit(extraction.pk, file_path, attachment.filename))
+    else:
+        save_extraction(extraction.pk, extract_file(file_path, attachment.filename))
+    extraction.refresh_from_db()
+    return extraction
+
+def wait_for_extractions(timeout=None):
+    """ Blocks until every submitted extraction has been saved. Returns False if the timeout ran out first. """
+    with _in_flight_changed:
+        return _in_flight_changed.wait_for(lambda: _in_flight == 0, timeout)
+
+def is_stale(extraction):
+    """ Whether a Pending row has waited long enough that its extraction must have been lost """
+    return extraction.status == 1 and extraction.queued_datetime < timezone.now() - PENDING_TIMEOUT
+
+async def alatest_extraction(project_id, attachment_id):
+    """ The newest extracted text for an attachment on a project, in one query on the (attachment, content_hash) index """
+    return await (
+        AttachmentText.objects.filter(attachment_id=attachment_id, attachment__project_id=project_id)
+        .order_by('-created_datetime', '-id').afirst()
+    )
@@ -0,0 +1,183 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, DateField, Max, Q
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.dateparse import parse_date
+
+from ..models import Project, Task
+from .colour_helpers import get_cycled_colour, get_text_colour_based_on_background, mute_colour
+from .task_helpers import annotate_task_flags, task_url_template
+
+PROJECT_EVENTS_CACHE_TIMEOUT = 60 * 60  # Seconds - the cache key changes whenever a project is written
+
+def parse_calendar_window(params):
+    """
+    Reads FullCalendar's start/end parameters (ISO dates, possibly with a time and offset).
+    Returns (start, end) as dates, either of which may be None when missing or invalid.
+    """
+    def read(name):
+        value = params.get(name, '')
+        return parse_date(value[:10]) if len(value) >= 10 else None
+    try:
+        return read('start'), read('end')
+    except ValueError:
+        return None, None
+
+async def aproject_events_stamp():
+    """
+    Returns (last modified datetime, live project count) for the project table in one query.
+    Every save moves the last modified time on, and soft deleting or restoring a project
+    changes the count, so together they change whenever a project is written.
+    """
+    stamp = await Project.all_objects.aaggregate(
+        last_modified=Max('last_updated_datetime'),
+        live=Count('id', filter=Q(deleted__isnull=True)),
+    )
+    return stamp['last_modified'], stamp['live']
+
+def project_events_etag(stamp, start, end):
+    """ An ETag for the feed - the same stamp and window always give the same payload """
+    last_modified, live = stamp
+    key = f"{last_modified.isoformat() if last_modified else ''}|{live}|{start}|{end}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+def project_event(project, start_date, end_date):
+    """ Builds the FullCalendar event for one project """
+    background_colour = get_cycled_colour(project.pk)
+
+    # Add 'Closed' to closed projects and mute the colour for better visibility
+    if project.project_status == 7:
+        project_name = project.project_name + ' (Closed)'
+        background_colour = mute_colour(background_colour)
+    else:
+        project_name = project.project_name
+
+    return {
+        'title': project_name,
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': (end_date + timedelta(days=1)).strftime('%Y-%m-%d'),  # Add one day to include end date
+        'url': reverse('project_detail', args=[project.pk]),  # Link to project detail page
+        'color': background_colour,  # Background colour for the event
+        'textColor': get_text_colour_based_on_background(background_colour),  # Text colour based on the background
+        'allDay': True,
+    }
+
+async def abuild_project_events(start=None, end=None):
+    """
+    Returns the events for projects that overlap the window (or all projects when there is no window).
+    The overlap test is done by the database on the display start and end dates.
+    """
+    projects = Project.objects.annotate(
+        event_start=Coalesce('actual_start_date', 'planned_start_date', output_field=DateField()),
+        event_end=Coalesce('actual_end_date', 'revised_target_end_date', 'original_target_end_date', output_field=DateField()),
+    ).filter(event_start__isnull=False, event_end__isnull=False)  # Skip projects that don't have a start or end date
+
+    # FullCalendar's end is exclusive
+    if start:
+        projects = projects.filter(event_end__gte=start)
+    if end:
+        projects = projects.filter(event_start__lt=end)
+
+    projects = projects.only(
+        'id', 'project_name', 'project_status', 'actual_start_date', 'planned_start_date',
+        'actual_end_date', 'revised_target_end_date', 'original_target_end_date',
+    ).order_by('planned_start_date')
+    return [project_event(project, project.event_start, project.event_end) async for project in projects]
+
+async def aget_project_events_payload(stamp, start=None, end=None):
+    """
+    Returns the serialised events for a window, from the cache when the projects have not changed.
+    The stamp is part of the cache key, so writing a project makes every cached window stale.
+    """
+    cache_key = f'project_events:{project_events_etag(stamp, start, end)}'
+    payload = await cache.aget(cache_key)
+    if payload is None:
+        payload = json.dumps(await abuild_project_events(start, end))
+        await cache.aset(cache_key, payload, PROJECT_EVENTS_CACHE_TIMEOUT)
+    return payload
+
+# Task calendar colours by priority
+TASK_PRIORITY_COLOURS = {
+    1: '#373a3c',  # Low (Grey)
+    2: '#3fb618',  # Medium (Green)
+    3: '#ff7518',  # High (Yellow)
+    4: '#f0ad4e',  # Critical (Orange)
+    5: '#ff0039',  # Urgent (Red)
+}
+
+def task_window_filter(start=None, end=None):
+    """
+    Matches tasks whose bar or due date falls in the window. The display dates are written out as
+    actual-or-planned conditions, rather than compared through Coalesce, so the database can use
+    the (project, planned_start_date, planned_end_date) index.
+    """
+    if not start and not end:
+        return Q()
+    condition = Q()
+    if end:
+        condition &= Q(actual_start_date__lt=end) | Q(actual_start_date__isnull=True, planned_start_date__lt=end)
+    if start:
+        condition &= Q(actual_end_date__gte=start) | Q(actual_end_date__isnull=True, planned_end_date__gte=start)
+
+    due = Q(due_date__isnull=False) & ~Q(task_status=3)
+    if start:
+        due &= Q(due_date__gte=start)
+    if end:
+        due &= Q(due_date__lt=end)
+    return condition | due
+
+def build_task_events(project_id, start=None, end=None):
+    """
+    Returns the FullCalendar events for a project's tasks in the window - a bar for each task
+    and a separate event for the due date of tasks that are not completed.
+    Rows are read as values, and every URL is built from one reverse() call.
+    """
+    tasks = annotate_task_flags(Task.objects.filter(project_id=project_id)).filter(task_window_filter(start, end)).values(
+        'id', 'task_name', 'task_status', 'priority', 'due_date', 'annotated_start_date', 'annotated_end_date', 'conflict_flag'
+    ).order_by('annotated_start_date', 'id')
+
+    task_url = task_url_template(project_id)
+
+    events = []
+    for task in tasks:
+        start_date, end_date = task['annotated_start_date'], task['annotated_end_date']
+        url = task_url.format(task['id'])
+
+        # Set color and title for completed tasks
+        if task['task_status'] == 3:  # Status ID 3 is 'Completed'
+            background_colour = '#808080'  # Grey
+            task_title = f"{task['task_name']} (Completed)"
+        else:
+            # Use the priority color or fallback to grey
+            background_colour = TASK_PRIORITY_COLOURS.get(task['priority'], '#808080')
+            task_title = task['task_name']
+
+        if start_date and end_date and (not end or start_date < end) and (not start or end_date >= start):
+            events.append({
+                'id': task['id'],
+                'title': task_title,
+                'start': str(start_date),
+                'end': str(end_date + timedelta(days=1)),  # FullCalendar uses exclusive end dates
+                'backgroundColor': background_colour,
+                'borderColor': '#ff0039' if task['conflict_flag'] else background_colour,  # Red border for scheduling conflicts
+                'textColor': get_text_colour_based_on_background(background_colour),
+                'url': url,
+            })
+
+        # Add a separate event for the due date if it exists, but only if the task is not completed
+        due_date = task['due_date']
+        if due_date and task['task_status'] != 3 and (not start or due_date >= start) and (not end or due_date < end):
+            events.append({
+                'title': f"{task['task_name']} (Due)",
+                'start': str(due_date),
+                'end': str(due_date),
+                'backgroundColor': '#000000',
+                'borderColor': '#FF6347',  # Tomato border for due dates
+                'textColor': '#FFFFFF',
+                'url': url,
+            })
+    return events
@@ -0,0 +1,133 @@
+from datetime import timedelta
+
+from ..models import Asset, Task
+from .time_helpers import to_hours
+
+# DayOfWeek names in date.weekday() order
+WEEKDAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DEFAULT_WORK_DAYS = WEEKDAY_NAMES[:5]  # Assets without any work days set are taken to work Monday to Friday
+CAPACITY_LOOKAHEAD_DAYS = 28  # Shown on the asset detail page, starting today
+
+def weekday_hours(day_names, normal_work_week):
+    """ Spreads an asset's weekly hours evenly over its work days. Returns the hours for each weekday, Monday first. """
+    day_names = set(day_names) or set(DEFAULT_WORK_DAYS)
+    hours = (normal_work_week or 0) / len(day_names)
+    return [hours if name in day_names else 0.0 for name in WEEKDAY_NAMES]
+
+def work_patterns(assets):
+    """
+    Returns the hours each asset works on each weekday, keyed by asset id, reading every
+    asset's work days in one query on the through table.
+    """
+    assets = list(assets)
+    day_names = {asset.pk: [] for asset in assets}
+    rows = Asset.work_days.through.objects.filter(asset_id__in=list(day_names), dayofweek__deleted__isnull=True)
+    for asset_id, day_name in rows.values_list('asset_id', 'dayofweek__day_name'):
+        day_names[asset_id].append(day_name)
+    return {asset.pk: weekday_hours(day_names[asset.pk], asset.normal_work_week) for asset in assets}
+
+def count_work_days(start_date, end_date, pattern):
+    """ Counts the days between two dates (inclusive) the pattern has hours on, without walking every day """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return 0
+    full_weeks, remainder = divmod(days, 7)
+    count = full_weeks * sum(1 for hours in pattern if hours)
+    first = start_date.weekday()
+    count += sum(1 for offset in range(remainder) if pattern[(first + offset) % 7])
+    return count
+
+def build_capacity(patterns, tasks, start_date, end_date):
+    """
+    Builds the availability and allocation matrices for a date range - one row of hours per day for each asset.
+    patterns maps asset id to weekday hours (from work_patterns), and tasks is an iterable of
+    (asset id, planned start, planned end, estimated hours). Each task's estimate is spread evenly over the
+    asset's work days in its planned window (or every day, if none fall in it) and only the part inside
+    the range is added. Returns (dates, capacity, allocated).
+    """
+    days = (end_date - start_date).days + 1
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    first = start_date.weekday()
+
+    # Capacity repeats every week, so each row is one week of hours rotated to the first date and repeated
+    capacity = {}
+    for asset_id, pattern in patterns.items():
+        week = pattern[first:] + pattern[:first]
+        capacity[asset_id] = (week * (days // 7 + 1))[:days]
+
+    allocated = {asset_id: [0.0] * days for asset_id in patterns}
+    for asset_id, task_start, task_end, hours in tasks:
+        row = allocated.get(asset_id)
+        if row is None or not hours or task_end < task_start:
+            continue
+        pattern = patterns[asset_id]
+        work_days = count_work_days(task_start, task_end, pattern)
+        if not work_days:
+            pattern = [1.0] * 7  # No work days in the window, so the time is spread over every day
+            work_days = (task_end - task_start).days + 1
+        per_day = hours / work_days
+
+        # Only the days inside the range are added
+        begin = max((task_start - start_date).days, 0)
+        finish = min((task_end - start_date).days, days - 1)
+        weekday = (first + begin) % 7
+        for index in range(begin, finish + 1):
+            if pattern[weekday]:
+                row[index] += per_day
+            weekday = (weekday + 1) % 7
+    return dates, capacity, allocated
+
+def capacity_matrix(assets, start_date, end_date):
+    """
+    Loads the work patterns and planned tasks for the assets and builds the matrices, in two queries.
+    Completed tasks count as well, so a past range shows the load that was planned for it.
+    """
+    patterns = work_patterns(assets)
+    rows = Task.objects.filter(
+        assigned_to_id__in=list(patterns),
+        estimated_time_to_complete__isnull=False,
+        planned_start_date__lte=end_date,
+        planned_end_date__gte=start_date,
+    ).values_list('assigned_to_id', 'planned_start_date', 'planned_end_date', 'estimated_time_to_complete')
+    tasks = ((asset_id, task_start, task_end, to_hours(estimate)) for asset_id, task_start, task_end, estimate in rows)
+    return build_capacity(patterns, tasks, start_date, end_date)
+
+def _utilisation(allocated_hours, capacity_hours):
+    if capacity_hours:
+        return round(allocated_hours / capacity_hours * 100, 1)
+    return 100.0 if allocated_hours else 0.0
+
+def summarise_capacity(dates, capacity, allocated):
+    """
+    Totals the matrices for each asset - hours available and allocated, utilisation (%) and
+    the days (and hours) allocated beyond what the asset can work that day.
+    """
+    summary = {}
+    for asset_id, available in capacity.items():
+        planned = allocated[asset_id]
+        capacity_hours, allocated_hours = sum(available), sum(planned)
+        over = [(day, hours - limit) for day, hours, limit in zip(dates, planned, available) if hours - limit > 0.005]
+        summary[asset_id] = {
+            'capacity_hours': round(capacity_hours, 2),
+            'allocated_hours': round(allocated_hours, 2),
+            'utilisation': _utilisation(allocated_hours, capacity_hours),
+            'over_allocated_days': [day for day, excess in over],
+            'over_allocated_hours': round(sum(excess for day, excess in over), 2),
+        }
+    return summary
+
+def asset_capacity(assets, start_date, end_date):
+    """ Returns the capacity summary (see summarise_capacity) for each asset between two dates, keyed by asset id """
+    return summarise_capacity(*capacity_matrix(assets, start_date, end_date))
+
+def weekly_capacity(dates, available, planned):
+    """ Totals one asset's rows from the matrices by week, for a breakdown table """
+    weeks = []
+    for index, day in enumerate(dates):
+        if not weeks or day.weekday() == 0:
+            weeks.append({'week_start': day, 'capacity_hours': 0.0, 'allocated_hours': 0.0})
+        weeks[-1]['capacity_hours'] += available[index]
+        weeks[-1]['allocated_hours'] += planned[index]
+    for week in weeks:
+        week['utilisation'] = _utilisation(week['allocated_hours'], week['capacity_hours'])
+    return weeks
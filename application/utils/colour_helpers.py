@@ -0,0 +1,58 @@
+from functools import lru_cache
+
+# Colour helpers for the calendars. The inputs come from a handful of site colours,
+# so the results are memoised rather than worked out again for every event.
+
+def get_cycled_colour(id):
+    """Generate a color based on the project ID."""
+    # Predefined list of colors to cycle through using site colours
+    colours = ['#2780e3', '#3fb618', '#9954bb', '#ff7518','#ff0039']
+    return colours[id % len(colours)]  # Cycle through the list based on the id
+
+@lru_cache(maxsize=None)
+def mute_colour(hex_colour, factor=0.5):
+    """Lightens the given hex color by blending it with white to make it more subtle.
+    
+    The factor determines how much of the white to blend in.
+    Default factor of 0.5 makes the color half as intense.
+    """
+    # Remove '#' if it exists
+    hex_colour = hex_colour.lstrip('#')
+
+    # Convert hex to RGB
+    r = int(hex_colour[0:2], 16)
+    g = int(hex_colour[2:4], 16)
+    b = int(hex_colour[4:6], 16)
+
+    # Blend with white, which is represented as (255, 255, 255)
+    r = int(r + (255 - r) * factor)
+    g = int(g + (255 - g) * factor)
+    b = int(b + (255 - b) * factor)
+
+    # Ensure values stay within RGB limits (0-255)
+    r = max(0, min(255, r))
+    g = max(0, min(255, g))
+    b = max(0, min(255, b))
+
+    # Convert back to hex
+    muted_hex = f'#{r:02x}{g:02x}{b:02x}'
+
+    return muted_hex
+
+@lru_cache(maxsize=None)
+def get_text_colour_based_on_background(hex_colour):
+    """Returns the ideal text color (black or white) based on the brightness of the given hex color."""
+    # Remove the hash if it exists
+    hex_colour = hex_colour.lstrip('#')
+
+    # Convert hex to RGB
+    r = int(hex_colour[0:2], 16)
+    g = int(hex_colour[2:4], 16)
+    b = int(hex_colour[4:6], 16)
+
+    # Calculate the luminance using a weighted average
+    # These weights are based on the human eye's sensitivity to each colour channel
+    luminance = (0.299 * r + 0.587 * g + 0.114 * b)
+
+    # If the luminance is high, use black text; otherwise, use white text
+    return '#000000' if luminance > 146 else '#FFFFFF' # This was originally 186 - changed to 146 as it seemed better to me
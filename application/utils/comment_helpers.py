@@ -0,0 +1,119 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from ..models import Assumption, Comment, Dependency, Issue, Project, Risk, Task
+
+COMMENTS_PAGE_SIZE = 20
+LATEST_COMMENTS = 2  # Newest comments shown against each row of a list page
+
+# The models that can be commented on, by the content type name used in comment URLs
+COMMENTABLE_MODELS = {model._meta.model_name: model for model in [Project, Task, Risk, Assumption, Issue, Dependency]}
+
+def comment_key(obj):
+    """ The (content type id, object id) pair comments are grouped by, for any model instance """
+    return ContentType.objects.get_for_model(obj).pk, obj.pk
+
+def _objects_filter(objects):
+    """
+    A filter matching the comments on any of the objects, one (content type, object ids) term per model
+    so each term can use the (content_type, object_id, created_datetime) index.
+    Content types come from ContentType's own cache, so this doesn't query once it is warm.
+    """
+    ids_by_type = {}
+    for obj in objects:
+        content_type_id, object_id = comment_key(obj)
+        ids_by_type.setdefault(content_type_id, set()).add(object_id)
+    if not ids_by_type:
+        return None
+    return reduce(or_, (Q(content_type_id=content_type_id, object_id__in=ids) for content_type_id, ids in ids_by_type.items()))
+
+def comments_for(objects):
+    """
+    Loads the comments on many objects, of any mix of models, in one query with their users.
+    Returns lists of comments, oldest first, keyed by comment_key() - objects without comments are left out.
+    """
+    condition = _objects_filter(objects)
+    if condition is None:
+        return {}
+    grouped = {}
+    for comment in Comment.objects.filter(condition).select_related('user').order_by('created_datetime', 'id'):
+        grouped.setdefault((comment.content_type_id, comment.object_id), []).append(comment)
+    return grouped
+
+def comments_for_object(obj):
+    """ The comments on one object, oldest first, with their users """
+    return comments_for([obj]).get(comment_key(obj), [])
+
+def latest_comments(objects, limit=LATEST_COMMENTS):
+    """
+    Loads up to `limit` of the newest comments on each object in one query, numbering each object's
+    comments in the database so only the ones wanted are read. Returns lists, newest first, keyed by comment_key().
+    """
+    condition = _objects_filter(objects)
+    if condition is None:
+        return {}
+    comments = Comment.objects.filter(condition).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F('content_type_id'), F('object_id')],
+            order_by=[F('created_datetime').desc(), F('id').desc()],
+        ),
+    ).filter(position__lte=limit).select_related('user').order_by('content_type_id', 'object_id', 'position')
+    grouped = {}
+    for comment in comments:
+        grouped.setdefault((comment.content_type_id, comment.object_id), []).append(comment)
+    return grouped
+
+def comment_counts(objects):
+    """ Counts the comments on each object in one grouped query, keyed by comment_key() """
+    condition = _objects_filter(objects)
+    if condition is None:
+        return {}
+    rows = (
+        Comment.objects.filter(condition)
+        .values('content_type_id', 'object_id').annotate(comment_count=Count('id')).order_by()
+        .values_list('content_type_id', 'object_id', 'comment_count')
+    )
+    return {(content_type_id, object_id): count for content_type_id, object_id, count in rows}
+
+def attach_comment_counts(objects):
+    """ Sets comment_count on each object, for list pages. Returns the objects as a list. """
+    objects = list(objects)
+    counts = comment_counts(objects)
+    for obj in objects:
+        obj.comment_count = counts.get(comment_key(obj), 0)
+    return objects
+
+def attach_comment_summaries(objects, limit=LATEST_COMMENTS):
+    """
+    Sets comment_count and latest_comments (the newest `limit`, newest first) on each object, for list pages,
+    in two queries whatever the number of rows. Returns the objects as a list.
+    """
+    objects = attach_comment_counts(objects)
+    latest = latest_comments(objects, limit)
+    for obj in objects:
+        obj.latest_comments = latest.get(comment_key(obj), [])
+    return objects
+
+def comment_page(obj, before=None, limit=COMMENTS_PAGE_SIZE):
+    """
+    A page of the newest comments on an object, newest first, with their users. `before` is the id of
+    the last comment on the previous page - pages follow (created_datetime, id) down the index rather than
+    using an offset. Returns (comments, whether there are older ones).
+    """
+    content_type_id, object_id = comment_key(obj)
+    comments = Comment.objects.filter(content_type_id=content_type_id, object_id=object_id)
+    if before is not None:
+        last = Comment.objects.filter(pk=before, content_type_id=content_type_id, object_id=object_id).values('created_datetime').first()
+        if last is None:
+            return [], False
+        comments = comments.filter(
+            Q(created_datetime__lt=last['created_datetime'])
+            | Q(created_datetime=last['created_datetime'], id__lt=before)
+        )
+    page = list(comments.select_related('user').order_by('-created_datetime', '-id')[:limit + 1])
+    return page[:limit], len(page) > limit
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import F, Q
+
+from ..models import Task, TaskConflict
+
+def find_conflicts(tasks):
+    """
+    Finds every task in the queryset that is planned to start before its prerequisite ends,
+    using a single join between each task and its prerequisite. Returns unsaved TaskConflicts.
+    """
+    rows = tasks.filter(
+        prereq_task__isnull=False,
+        prereq_task__deleted__isnull=True,
+        planned_start_date__lt=F('prereq_task__planned_end_date'),
+    ).values_list('id', 'prereq_task_id', 'project_id', 'planned_start_date', 'prereq_task__planned_end_date')
+
+    return [
+        TaskConflict(
+            task_id=task_id,
+            prereq_task_id=prereq_task_id,
+            project_id=project_id,
+            overlap_days=(prereq_end_date - start_date).days,
+        )
+        for task_id, prereq_task_id, project_id, start_date, prereq_end_date in rows
+    ]
+
+def refresh_task_conflicts(task):
+    """
+    Recalculates the conflicts a task is involved in - with its own prerequisite,
+    and with every task that depends on it.
+    """
+    refresh_conflicts_for([task.pk])
+
+def refresh_conflicts_for(task_ids):
+    """ Recalculates the conflicts for several tasks at once, as refresh_task_conflicts() """
+    with transaction.atomic():
+        TaskConflict.objects.filter(Q(task_id__in=task_ids) | Q(prereq_task_id__in=task_ids)).delete()
+        # Soft deleted tasks are left out by the default manager, so their conflicts are simply dropped
+        TaskConflict.objects.bulk_create(find_conflicts(Task.objects.filter(Q(pk__in=task_ids) | Q(prereq_task_id__in=task_ids))))
+
+def rebuild_task_conflicts():
+    """ Rebuilds the whole conflict index in one pass. Returns the number of conflicts found. """
+    conflicts = find_conflicts(Task.objects.all())
+    with transaction.atomic():
+        TaskConflict.objects.all().delete()
+        TaskConflict.objects.bulk_create(conflicts, batch_size=500)
+    return len(conflicts)
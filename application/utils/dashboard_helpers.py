@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+from ..models import Project, ProjectRollup, Asset, Skill
+
+DASHBOARD_STATS_CACHE_KEY = 'dashboard_stats'
+DASHBOARD_STATS_CACHE_TIMEOUT = 60  # Seconds - writes to Projects and Tasks clear the cache straight away
+
+def calculate_dashboard_stats():
+    """
+    Counts everything shown on the home page using one conditional aggregation query per table.
+    Task figures are summed from the project rollups.
+    """
+    project_stats = Project.objects.aggregate(
+        projects_total=Count('id'),
+        projects_open=Count('id', filter=~Q(project_status=7)),  # All projects except 'Closed' [7]
+        projects_onhold=Count('id', filter=Q(project_status=4)),  # Status ID 4: 'On Hold'
+        projects_closed=Count('id', filter=Q(project_status=7)),  # Status ID 7: 'Closed'
+    )
+    task_stats = ProjectRollup.objects.filter(project__deleted__isnull=True).aggregate(
+        tasks_total=Coalesce(Sum('total_tasks'), 0),
+        tasks_completed=Coalesce(Sum('completed_tasks'), 0),  # Status ID 3: 'Completed'
+        # Only count tasks that are 'Unassigned' on projects that are not closed
+        tasks_unassigned=Coalesce(Sum('unassigned_tasks', filter=~Q(project__project_status=7)), 0),
+    )
+    task_stats['tasks_open'] = task_stats['tasks_total'] - task_stats['tasks_completed']  # All tasks except 'Completed'
+    asset_stats = Asset.objects.aggregate(assets_total=Count('asset_id'))
+    skill_stats = Skill.objects.aggregate(skills_total=Count('skill_id'))
+
+    return {**project_stats, **task_stats, **asset_stats, **skill_stats}
+
+def get_dashboard_stats():
+    """ Returns the home page figures, using the cached copy if there is one """
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = calculate_dashboard_stats()
+        cache.set(DASHBOARD_STATS_CACHE_KEY, stats, DASHBOARD_STATS_CACHE_TIMEOUT)
+    return stats
+
+def invalidate_dashboard_stats():
+    cache.delete(DASHBOARD_STATS_CACHE_KEY)
@@ -0,0 +1,91 @@
+from django.core import signing
+from django.db.models import F, Q
+
+# Largest page a client is allowed to ask for in one request
+MAX_PAGE_LENGTH = 500
+
+def _to_int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def parse_datatables_request(params):
+    """
+    Reads the DataTables server-side processing parameters from a QueryDict.
+    See https://datatables.net/manual/server-side for the protocol.
+    """
+    length = _to_int(params.get('length'), 10)
+    if length < 0 or length > MAX_PAGE_LENGTH:  # -1 means "All", which we do not allow
+        length = MAX_PAGE_LENGTH
+
+    columns = []
+    i = 0
+    while f'columns[{i}][data]' in params:
+        columns.append({
+            'data': params.get(f'columns[{i}][data]'),
+            'search': params.get(f'columns[{i}][search][value]', '').strip(),
+        })
+        i += 1
+
+    order = []
+    i = 0
+    while f'order[{i}][column]' in params:
+        column_index = _to_int(params.get(f'order[{i}][column]'), -1)
+        if 0 <= column_index < len(columns):
+            order.append((columns[column_index]['data'], params.get(f'order[{i}][dir]') == 'desc'))
+        i += 1
+
+    return {
+        'draw': _to_int(params.get('draw'), 0),
+        'start': max(_to_int(params.get('start'), 0), 0),
+        'length': length,
+        'search': params.get('search[value]', '').strip(),
+        'columns': columns,
+        'order': order,
+        'cursor': params.get('cursor'),
+    }
+
+def lookup_value(obj, path):
+    """ Follows a Django lookup path such as 'project__project_name' on a model instance """
+    for attr in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    return obj
+
+def keyset_filter(ordering, values):
+    """
+    Builds the WHERE clause that selects the rows after `values` for the given ordering,
+    a list of (field, descending) pairs whose last entry is unique (usually the primary key).
+    """
+    condition = Q(pk__in=[])
+    equal_so_far = Q()
+    for (field, descending), value in zip(ordering, values):
+        lookup = f'{field}__lt' if descending else f'{field}__gt'
+        condition |= equal_so_far & Q(**{lookup: value})
+        equal_so_far &= Q(**{field: value})
+    return condition
+
+def make_cursor(state, values):
+    """ Signs the ordering values of the last row on a page so the next page can continue from it """
+    return signing.dumps({'state': state, 'values': values}, salt='datatables-cursor', compress=True)
+
+def read_cursor(cursor, state):
+    """ Returns the ordering values stored in a cursor, or None if it is invalid or for a different query """
+    if not cursor:
+        return None
+    try:
+        data = signing.loads(cursor, salt='datatables-cursor')
+    except signing.BadSignature:
+        return None
+    if data.get('state') != state:
+        return None
+    return data.get('values')
+
+def order_expressions(ordering):
+    """ Turns (field, descending) pairs into order_by() expressions, keeping empty values last """
+    return [
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field, descending in ordering
+    ]
@@ -0,0 +1,56 @@
+from collections import defaultdict, deque
+
+from django.core.cache import cache
+
+from ..models import Task
+from .task_helpers import project_tasks_stamp
+
+TASK_GRAPH_CACHE_TIMEOUT = 60 * 60  # Seconds - the cache key changes whenever one of the project's tasks is written
+
+def load_task_graph(project_id):
+    """ Reads every (task id, prerequisite id) pair for a project in one query, as a dict """
+    return dict(Task.objects.filter(project_id=project_id).values_list('id', 'prereq_task_id'))
+
+def get_task_graph(project_id):
+    """
+    Returns a project's prerequisite graph, from the cache when none of its tasks have changed.
+    The tasks stamp is part of the cache key, so saving, deleting or restoring a task in any
+    process makes the cached graph stale.
+    """
+    last_modified, live = project_tasks_stamp(project_id)
+    cache_key = f"task_graph:{project_id}:{last_modified.isoformat() if last_modified else ''}:{live}"
+    graph = cache.get(cache_key)
+    if graph is None:
+        graph = load_task_graph(project_id)
+        cache.set(cache_key, graph, TASK_GRAPH_CACHE_TIMEOUT)
+    return graph
+
+def ancestors(graph, task_id):
+    """ Returns the ids up a task's prerequisite chain, nearest first. Stops if the chain loops back on itself. """
+    chain, seen = [], {task_id}
+    current = graph.get(task_id)
+    while current is not None and current not in seen:
+        chain.append(current)
+        seen.add(current)
+        current = graph.get(current)
+    return chain
+
+def descendants(graph, task_id):
+    """ Returns the ids of every task that depends on a task, directly or further down the chain """
+    dependents = defaultdict(list)
+    for dependent_id, prereq_task_id in graph.items():
+        if prereq_task_id is not None:
+            dependents[prereq_task_id].append(dependent_id)
+
+    found = set()
+    queue = deque(dependents.get(task_id, ()))
+    while queue:
+        dependent_id = queue.popleft()
+        if dependent_id not in found and dependent_id != task_id:
+            found.add(dependent_id)
+            queue.extend(dependents.get(dependent_id, ()))
+    return found
+
+def would_create_cycle(graph, task_id, prereq_task_id):
+    """ Checks whether making prereq_task_id the prerequisite of task_id would make the chain loop """
+    return prereq_task_id == task_id or task_id in ancestors(graph, prereq_task_id)
@@ -0,0 +1,93 @@
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Types the browser may open on the app's own origin. Anything else (HTML, SVG and so on could run script) is
+# downloaded as application/octet-stream instead.
+INLINE_CONTENT_TYPES = {'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'text/plain'}
+
+def parse_range(header, size):
+    """
+    Reads a single-range Range header against a file's size. Returns (first byte, last byte), None when
+    there is no usable range (the whole file is sent), or False when the range is unsatisfiable.
+    Several ranges in one header are answered with the whole file, which the spec allows.
+    """
+    match = RANGE_PATTERN.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # A suffix range - the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:  # An empty file has no bytes to send
+            return False
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        return False
+    return first, last
+
+def _if_range_matches(request, etag, last_modified):
+    """ Whether a Range should be honoured - an If-Range naming another version means the whole file is sent """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag  # Only a strong match counts
+    return parse_http_date_safe(if_range) == last_modified
+
+def _read_range(path, first, last):
+    with open(path, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def file_download(request, path, etag, last_modified, content_type, filename):
+    """
+    Sends a file with a strong ETag and Last-Modified (last_modified is a timestamp), answering
+    conditional requests with 304/412 and a single byte range with 206 Partial Content.
+    Files are streamed in chunks rather than read into memory. Only INLINE_CONTENT_TYPES are opened in the
+    browser - everything else is sent as an application/octet-stream attachment.
+    """
+    inline = content_type in INLINE_CONTENT_TYPES
+    if not inline:
+        content_type = 'application/octet-stream'
+    etag = quote_etag(etag)
+    size = os.path.getsize(path)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = parse_range(request.headers.get('Range'), size) if _if_range_matches(request, etag, last_modified) else None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(_read_range(path, first, last), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = str(last - first + 1)
+        # `inline` lets the browser open the safe types itself, the rest are saved
+        response['Content-Disposition'] = content_disposition_header(not inline, filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'  # The browser mustn't guess a type it would run
+    # Attachments need a login, so only the user's browser may keep them, and it checks back with the ETag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
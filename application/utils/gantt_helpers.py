@@ -0,0 +1,139 @@
+import json
+from itertools import groupby
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from django.utils.html import escape
+
+from ..models import Project, Task
+from .schedule_helpers import project_schedule
+from .task_helpers import annotate_task_flags, task_url_template
+
+# Map priorities to existing CSS classes in jsgantt.css
+GANTT_PRIORITY_CSS_CLASSES = {
+    1: 'gtaskblue',   # Low Priority
+    2: 'gtaskgreen',  # Medium Priority
+    3: 'gtaskyellow', # High Priority
+    4: 'gtaskred',    # Critical Priority
+    5: 'gtaskpurple', # Urgent Priority
+}
+
+# Everything the chart needs from a task, read as values in a single query
+GANTT_TASK_FIELDS = [
+    'id', 'project_id', 'task_name', 'task_status', 'priority', 'prereq_task_id', 'assigned_to_id',
+    'assigned_to__name', 'annotated_start_date', 'annotated_end_date', 'conflict_flag',
+    'last_updated_datetime', 'deleted',
+]
+
+def gantt_task_rows(tasks):
+    """
+    Reads the Gantt rows for a queryset of tasks in one query - the assigned asset's name and the
+    prerequisite id come from the same row, and the conflict flag from the TaskConflict index.
+    """
+    return annotate_task_flags(tasks).values(*GANTT_TASK_FIELDS)
+
+def gantt_task(row, task_url):
+    """ Serialises a task row for jsGantt, with task_url from task_url_template() """
+    return {
+        'id': row['id'],
+        'name': escape(row['task_name']),
+        'start': str(row['annotated_start_date']),
+        'end': str(row['annotated_end_date']),
+        'dependencies': str(row['prereq_task_id']) if row['prereq_task_id'] else "",
+        'progress': 100 if row['task_status'] == 3 else 0,
+        'priority': row['priority'],
+        'conflict': row['conflict_flag'],
+        'css_class': GANTT_PRIORITY_CSS_CLASSES.get(row['priority'], 'gtaskblue'),  # Default to 'gtaskblue' if priority not found
+        'url': task_url.format(row['id']),
+        'resource': row['assigned_to__name'] or "",  # The asset name for the Resource column
+        'resource_id': row['assigned_to_id'],
+    }
+
+def parse_gantt_version(value):
+    """
+    Turns the version sent back by the chart into a datetime, or None for a full load. Versions without
+    a UTC offset are taken to be in the current time zone.
+    """
+    try:
+        version = parse_datetime(value) if value else None
+    except ValueError:
+        return None
+    if version is not None and timezone.is_naive(version):
+        version = timezone.make_aware(version)
+    return version
+
+def gantt_data(project_id, since=None):
+    """
+    Returns the chart data for a project. The version is the latest last_updated_datetime seen, so the
+    chart can ask for only what has changed since. A delta includes tasks that were changed or soft deleted,
+    and the prerequisites and dependents of changed tasks (their conflict flags may have changed with them).
+    Hard deleted tasks and tasks moved to another project leave no row behind, so a delta also lists the
+    ids of every task on the chart - the chart reloads in full when one of its tasks is missing.
+    The critical path and slack come from schedule_helpers.
+    """
+    # all_objects, so that soft deleted tasks can be reported as deleted
+    tasks = Task.all_objects.filter(project_id=project_id)
+    if since is not None:
+        changed_dependents = Task.all_objects.filter(prereq_task_id=OuterRef('pk'), last_updated_datetime__gt=since)
+        tasks = tasks.filter(
+            Q(last_updated_datetime__gt=since) | Q(prereq_task__last_updated_datetime__gt=since) | Q(Exists(changed_dependents))
+        )
+
+    version = since
+    task_url = task_url_template(project_id)
+    changed, deleted = [], []
+    for row in gantt_task_rows(tasks).order_by('id'):
+        if version is None or row['last_updated_datetime'] > version:
+            version = row['last_updated_datetime']
+        if row['deleted'] is not None:
+            deleted.append(row['id'])
+        elif row['annotated_start_date'] and row['annotated_end_date']:  # Tasks without dates cannot be drawn
+            changed.append(gantt_task(row, task_url))
+        else:
+            deleted.append(row['id'])  # A task that has lost its dates is taken off the chart
+
+    return {
+        'version': version.isoformat() if version else None,
+        'full': since is None,
+        'tasks': changed,
+        'deleted': deleted if since is not None else [],
+        'ids': gantt_task_ids(project_id) if since is not None else None,
+        # Any change can move the critical path, so it is sent whole, but only when something changed
+        'schedule': gantt_schedule(project_id) if since is None or changed or deleted else None,
+    }
+
+def gantt_task_ids(project_id):
+    """ The ids of the tasks that can be drawn on a project's chart - live, with a start and an end date """
+    tasks = Task.objects.filter(project_id=project_id).filter(
+        Q(actual_start_date__isnull=False) | Q(planned_start_date__isnull=False),
+        Q(actual_end_date__isnull=False) | Q(planned_end_date__isnull=False),
+    )
+    return list(tasks.order_by('id').values_list('id', flat=True))
+
+def gantt_schedule(project_id):
+    """ The critical path and each task's slack in days, for highlighting on the chart """
+    schedule, path = project_schedule(project_id)
+    return {
+        'critical_path': path,
+        'slack': {task_id: entry['slack'] for task_id, entry in schedule.items()},
+    }
+
+def stream_portfolio_gantt(project_ids):
+    """
+    Yields one line of JSON per project (newline delimited JSON) with its chart data, reading the tasks
+    for every project in a single query and streaming them through rather than building one big payload.
+    """
+    projects = dict(Project.objects.filter(id__in=project_ids).values_list('id', 'project_name'))
+    rows = gantt_task_rows(Task.objects.filter(project_id__in=list(projects))).order_by('project_id', 'id')
+
+    seen = set()
+    for project_id, project_rows in groupby(rows.iterator(chunk_size=2000), key=lambda row: row['project_id']):
+        seen.add(project_id)
+        task_url = task_url_template(project_id)
+        tasks = [gantt_task(row, task_url) for row in project_rows if row['annotated_start_date'] and row['annotated_end_date']]
+        yield json.dumps({'project_id': project_id, 'project_name': projects[project_id], 'tasks': tasks}) + '\n'
+
+    # Projects without any tasks still get a line, so the chart can show them
+    for project_id in sorted(set(projects) - seen):
+        yield json.dumps({'project_id': project_id, 'project_name': projects[project_id], 'tasks': []}) + '\n'
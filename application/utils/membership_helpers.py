@@ -0,0 +1,59 @@
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from ..models import Asset, Project, Skill, Task, Team
+
+def live_assets():
+    """ Live assets in name order, the queryset every membership prefetch uses """
+    return Asset.objects.order_by('name')
+
+def skills_with_assets(skills=None):
+    """
+    Skills with the assets that have them, in two queries however many skills there are.
+    Each skill gets `asset_count` and `members` (its live assets in name order).
+    """
+    skills = Skill.objects.all() if skills is None else skills
+    return skills.annotate(
+        asset_count=Count('asset', filter=Q(asset__deleted__isnull=True)),
+    ).prefetch_related(
+        Prefetch('asset_set', queryset=live_assets(), to_attr='members'),
+    ).order_by('skill_name')
+
+def teams_with_members(teams=None):
+    """
+    Teams with their member assets, in two queries however many teams there are.
+    Each team gets `member_count` and `members` (its live assets in name order).
+    """
+    teams = Team.objects.all() if teams is None else teams
+    return teams.annotate(
+        member_count=Count('asset', filter=Q(asset__deleted__isnull=True)),
+    ).prefetch_related(
+        Prefetch('asset_set', queryset=live_assets(), to_attr='members'),
+    ).order_by('team_name')
+
+def with_memberships(assets):
+    """ Prefetches each asset's live skills and teams, so asset.skills.all and asset.teams.all don't query per asset """
+    return assets.prefetch_related(
+        Prefetch('skills', queryset=Skill.objects.order_by('skill_name')),
+        Prefetch('teams', queryset=Team.objects.order_by('team_name')),
+    )
+
+def count_per_asset(rows, field):
+    """ A subquery counting the live rows whose `field` is the outer asset, 0 when there are none """
+    counts = rows.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+def member_stats(assets):
+    """
+    Annotates assets with the number of projects they own, tasks assigned to them and of those
+    the completed ones, and prefetches their skills and teams. Each count is its own correlated
+    subquery, so the project and task tables are never joined against each other.
+    """
+    return with_memberships(assets.annotate(
+        projects_owned_count=count_per_asset(Project.objects.all(), 'project_owner'),
+        tasks_count=count_per_asset(Task.objects.all(), 'assigned_to'),
+        completed_tasks_count=count_per_asset(Task.objects.filter(task_status=3), 'assigned_to'),  # Completed
+    )).order_by('name')
+
+def completion_percentage(completed, total):
+    return (completed / total) * 100 if total > 0 else 0
@@ -1,34 +1,29 @@
 from datetime import date
+from django.db.models import DateField
+from django.db.models.functions import Coalesce
 
-def calculate_rag_status(project):
+def rag_status_from_counts(project_status, total_tasks_count, completed_tasks_count, display_start_date, display_end_date, today=None):
+    """ Works out the RAG status from figures that have already been counted """
     # If the project is closed, always return Green (G)
-    if project.project_status == 7:
+    if project_status == 7:
         return 'G'
-    
-    # Continue with existing logic
-    all_tasks = project.task_set.all()
-    completed_tasks_count = all_tasks.filter(task_status=3).count()
-    total_tasks_count = all_tasks.count()
 
     # If no tasks, default to Green if closed, else Amber
     if total_tasks_count == 0:
-        return 'A' if project.project_status != 7 else 'G'
+        return 'A' if project_status != 7 else 'G'
 
     # Calculate percentage of tasks completed
     percent_completed = (completed_tasks_count / total_tasks_count) * 100
 
     # Determine time remaining and RAG status
-    display_start_date = project.display_start_date
-    display_end_date = project.display_end_date
     if display_end_date and display_start_date:
-        today = date.today()
+        today = today or date.today()
         total_days = (display_end_date - display_start_date).days
         remaining_days = (display_end_date - today).days if today <= display_end_date else 0
 
         if percent_completed >= 100:
             return 'G'
         elif total_days > 0:
-            progress_rate = percent_completed / 100
             remaining_rate = remaining_days / total_days
 
             if remaining_rate > 0.75:
@@ -40,4 +35,11 @@ def calculate_rag_status(project):
         else:
             return 'R'
 
-    return 'A'  # Default to Amber if dates are missing or not meaningful
\ No newline at end of file
+    return 'A'  # Default to Amber if dates are missing or not meaningful
+
+def annotate_display_dates(queryset):
+    """ Annotates a Project queryset with its display start and end dates, so lists can be sorted by them """
+    return queryset.annotate(
+        annotated_start_date=Coalesce('actual_start_date', 'planned_start_date', output_field=DateField()),
+        annotated_end_date=Coalesce('actual_end_date', 'revised_target_end_date', 'original_target_end_date', output_field=DateField()),
+    )
@@ -0,0 +1,140 @@
+from datetime import date, timedelta
+from django.db.models import Count, Q, Sum
+
+from ..models import Project, ProjectRollup, Task
+from .project_helpers import rag_status_from_counts
+
+# Fields that make up a rollup, in the order they are reported by the rebuild command.
+# Overdue tasks and the RAG status depend on today's date, so they are not stored - see attach_rollups
+ROLLUP_FIELDS = [
+    'total_tasks',
+    'completed_tasks',
+    'unassigned_tasks',
+    'estimated_time_total',
+    'actual_time_total',
+]
+
+def task_figures(project_ids=None):
+    """
+    Returns {project_id: {...}} with the task totals for each project from one grouped query.
+    Projects without any (live) tasks are not included.
+    """
+    tasks = Task.objects.all()  # The default manager already excludes soft deleted tasks
+    if project_ids is not None:
+        tasks = tasks.filter(project_id__in=project_ids)
+
+    rows = tasks.values('project_id').annotate(
+        total_tasks=Count('id'),
+        completed_tasks=Count('id', filter=Q(task_status=3)),
+        unassigned_tasks=Count('id', filter=Q(task_status=1)),
+        estimated_time_total=Sum('estimated_time_to_complete'),
+        actual_time_total=Sum('actual_time_to_complete'),
+    ).order_by()
+
+    figures = {}
+    for row in rows:
+        project_id = row.pop('project_id')
+        row['estimated_time_total'] = row['estimated_time_total'] or timedelta()
+        row['actual_time_total'] = row['actual_time_total'] or timedelta()
+        figures[project_id] = row
+    return figures
+
+def build_rollups(projects):
+    """ Builds (unsaved) ProjectRollup instances for the given projects using one grouped query """
+    projects = list(projects)
+    figures = task_figures([project.pk for project in projects])
+    return [ProjectRollup(project=project, **figures.get(project.pk, {})) for project in projects]
+
+def refresh_project_rollup(project):
+    """ Recalculates and stores the rollup for a single project """
+    rollup = build_rollups([project])[0]
+    rollup.save()
+    return rollup
+
+def overdue_counts(project_ids, today=None):
+    """
+    Returns {project_id: number of overdue tasks} from one grouped query. A task is overdue when it is not
+    completed and its due date (or planned end date) has passed. Projects without overdue tasks are not included.
+    """
+    today = today or date.today()
+    rows = Task.objects.filter(project_id__in=project_ids).exclude(task_status=3).filter(
+        Q(due_date__lt=today) | Q(due_date__isnull=True, planned_end_date__lt=today)
+    ).values('project_id').annotate(overdue_tasks=Count('id')).order_by()
+    return {row['project_id']: row['overdue_tasks'] for row in rows}
+
+def attach_rollups(projects, today=None):
+    """
+    Sets the task figures on every project from its stored rollup: total_tasks, completed_tasks, incomplete_tasks
+    and percent_completed, plus overdue_tasks and rag_status, which depend on today's date and so are worked out
+    here rather than stored. Querysets are loaded with their rollups; any project without one yet has it built.
+    Returns the evaluated list of projects.
+    """
+    if hasattr(projects, 'query'):
+        projects = projects.select_related('rollup')
+    today = today or date.today()
+    projects = list(projects)
+
+    rollups = {}
+    missing = []
+    for project in projects:
+        try:
+            rollups[project.pk] = project.rollup
+        except ProjectRollup.DoesNotExist:
+            missing.append(project)
+    if missing:
+        built = build_rollups(missing)
+        ProjectRollup.objects.bulk_create(built, ignore_conflicts=True)
+        rollups.update((rollup.pk, rollup) for rollup in built)
+
+    overdue = overdue_counts(list(rollups), today=today)
+    for project in projects:
+        rollup = rollups[project.pk]
+        project.total_tasks = rollup.total_tasks
+        project.completed_tasks = rollup.completed_tasks
+        project.incomplete_tasks = rollup.incomplete_tasks
+        project.percent_completed = rollup.percent_completed
+        project.overdue_tasks = overdue.get(project.pk, 0)
+        project.rag_status = rag_status_from_counts(
+            project.project_status,
+            rollup.total_tasks,
+            rollup.completed_tasks,
+            project.display_start_date,
+            project.display_end_date,
+            today=today,
+        )
+    return projects
+
+def rebuild_rollups(fix=True):
+    """
+    Recalculates the rollup for every project and compares it with what is stored.
+    Returns a list of (project, field, stored value, expected value) for everything that had drifted,
+    where a missing rollup is reported with a field of None. Drift is corrected when fix is True.
+    """
+    projects = Project.objects.all()
+    stored = {rollup.pk: rollup for rollup in ProjectRollup.objects.all()}
+
+    drift = []
+    to_create = []
+    to_update = []
+    for rollup in build_rollups(projects):
+        existing = stored.get(rollup.pk)
+        if existing is None:
+            drift.append((rollup.project, None, None, None))
+            to_create.append(rollup)
+            continue
+
+        changed = False
+        for field in ROLLUP_FIELDS:
+            if getattr(existing, field) != getattr(rollup, field):
+                drift.append((rollup.project, field, getattr(existing, field), getattr(rollup, field)))
+                changed = True
+        if changed:
+            to_update.append(rollup)
+
+    if fix:
+        ProjectRollup.objects.bulk_create(to_create, batch_size=500)
+        ProjectRollup.objects.bulk_update(to_update, ROLLUP_FIELDS, batch_size=500)
+        # Remove rollups for projects that no longer exist (or have been soft deleted)
+        ProjectRollup.objects.exclude(project__in=projects).delete()
+
+    return drift
@@ -0,0 +1,162 @@
+from collections import defaultdict, deque
+
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+
+from ..models import Project, Task
+from .conflict_helpers import refresh_conflicts_for
+from .dashboard_helpers import invalidate_dashboard_stats
+from .rollup_helpers import refresh_project_rollup
+
+def load_schedule_graph(project_id):
+    """
+    Reads a project's task graph in one query. Returns a dict of task id to its display start
+    and end dates and prerequisite id. Tasks without both dates cannot be scheduled and are left out.
+    """
+    rows = Task.objects.filter(project_id=project_id).values_list(
+        'id', 'prereq_task_id', 'actual_start_date', 'planned_start_date', 'actual_end_date', 'planned_end_date'
+    )
+    graph = {}
+    for task_id, prereq_task_id, actual_start, planned_start, actual_end, planned_end in rows:
+        start, end = actual_start or planned_start, actual_end or planned_end
+        if start and end:
+            graph[task_id] = {'start': start, 'end': max(start, end), 'prereq_task_id': prereq_task_id}
+    return graph
+
+def topological_order(graph):
+    """
+    Orders the graph so that every task comes after its prerequisite (Kahn's algorithm).
+    Returns (order, dependents) where dependents maps a task id to the ids that depend on it.
+    A prerequisite outside the graph is ignored, and tasks caught in a cycle are left out of the order.
+    """
+    dependents = defaultdict(list)
+    roots = deque()
+    for task_id, task in graph.items():
+        if task['prereq_task_id'] in graph:
+            dependents[task['prereq_task_id']].append(task_id)
+        else:
+            roots.append(task_id)
+
+    # Each task has at most one prerequisite, so a task is ready as soon as its prerequisite is placed
+    order = []
+    while roots:
+        task_id = roots.popleft()
+        order.append(task_id)
+        roots.extend(dependents.get(task_id, ()))
+    return order, dependents
+
+def compute_schedule(graph):
+    """
+    Works out the earliest and latest start and finish, slack (in days) and whether each task is on
+    the critical path, with one forward and one backward pass over the topological order.
+    A task's own start date is kept as the earliest it can start. Returns a dict keyed by task id.
+    """
+    order, dependents = topological_order(graph)
+    if not order:
+        return {}
+
+    earliest = {}
+    for task_id in order:
+        task = graph[task_id]
+        start = task['start']
+        prereq = earliest.get(task['prereq_task_id'])
+        if prereq and prereq[1] > start:
+            start = prereq[1]
+        earliest[task_id] = (start, start + (task['end'] - task['start']))
+
+    project_finish = max(finish for start, finish in earliest.values())
+
+    schedule = {}
+    for task_id in reversed(order):
+        earliest_start, earliest_finish = earliest[task_id]
+        children = dependents.get(task_id)
+        latest_finish = min(schedule[child]['latest_start'] for child in children) if children else project_finish
+        latest_start = latest_finish - (earliest_finish - earliest_start)
+        slack = (latest_start - earliest_start).days
+        schedule[task_id] = {
+            'earliest_start': earliest_start,
+            'earliest_finish': earliest_finish,
+            'latest_start': latest_start,
+            'latest_finish': latest_finish,
+            'slack': slack,
+            'critical': slack == 0,
+        }
+    return schedule
+
+def critical_path(schedule, graph):
+    """ Returns the ids of the critical tasks in the order they are worked on """
+    return sorted(
+        (task_id for task_id, entry in schedule.items() if entry['critical']),
+        key=lambda task_id: (schedule[task_id]['earliest_start'], graph[task_id]['end'], task_id)
+    )
+
+def project_schedule(project_id):
+    """ Loads and schedules a project's tasks. Returns (schedule, critical path ids). """
+    graph = load_schedule_graph(project_id)
+    schedule = compute_schedule(graph)
+    return schedule, critical_path(schedule, graph)
+
+def propagate_date_shift(task):
+    """
+    Moves the tasks downstream of a task so that none of them starts before its prerequisite ends,
+    keeping their durations. Only tasks that have not started (and are not completed) are moved;
+    a task that does not need to move stops the shift from going any further down its chain.
+    Returns the list of tasks that were moved.
+    """
+    rows = Task.objects.filter(project_id=task.project_id).values_list(
+        'id', 'prereq_task_id', 'planned_start_date', 'planned_end_date', 'actual_start_date', 'actual_end_date', 'task_status'
+    )
+    tasks, dependents = {}, defaultdict(list)
+    for task_id, prereq_task_id, planned_start, planned_end, actual_start, actual_end, status in rows:
+        tasks[task_id] = {
+            'start': planned_start, 'end': planned_end, 'actual_end': actual_end,
+            'locked': actual_start is not None or status == 3,  # Started or Completed
+        }
+        if prereq_task_id:
+            dependents[prereq_task_id].append(task_id)
+
+    shifts = {}
+    queue = deque([task.pk])
+    while queue:
+        prereq_id = queue.popleft()
+        prereq_end = tasks[prereq_id]['actual_end'] or tasks[prereq_id]['end']
+        if prereq_end is None:
+            continue
+        for task_id in dependents.get(prereq_id, ()):
+            dependent = tasks[task_id]
+            if task_id in shifts or task_id == task.pk:  # Only possible in a circular chain
+                continue
+            if dependent['locked'] or dependent['start'] is None or dependent['start'] >= prereq_end:
+                continue
+            shift = prereq_end - dependent['start']
+            dependent['start'] += shift
+            if dependent['end'] is not None:
+                dependent['end'] += shift
+            shifts[task_id] = dependent
+            queue.append(task_id)
+
+    if not shifts:
+        return []
+
+    # bulk_update() skips auto_now, so the last updated time is set here for the Gantt and calendar feeds
+    now = timezone.now()
+    moved = list(Task.objects.filter(pk__in=shifts))
+    for moved_task in moved:
+        moved_task.planned_start_date = shifts[moved_task.pk]['start']
+        moved_task.planned_end_date = shifts[moved_task.pk]['end']
+        moved_task.last_updated_datetime = now
+
+    with transaction.atomic():
+        bulk_update_with_history(
+            moved, Task, ['planned_start_date', 'planned_end_date', 'last_updated_datetime'],
+            batch_size=500, default_change_reason='Rescheduled after a prerequisite moved',
+        )
+        refresh_conflicts_for(list(shifts))
+
+    # Saving a task refreshes these through signals, but bulk_update() does not send them
+    project = Project.objects.filter(pk=task.project_id).first()
+    if project:
+        refresh_project_rollup(project)
+    invalidate_dashboard_stats()
+    return moved
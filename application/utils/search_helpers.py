@@ -0,0 +1,374 @@
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from ..models import Assumption, AttachmentText, Comment, Dependency, Issue, Project, Risk, SearchDocument, Task
+from .comment_helpers import COMMENTABLE_MODELS
+
+SEARCH_TABLE = SearchDocument._meta.db_table
+FTS_TABLE = f'{SEARCH_TABLE}_fts'
+DOCUMENT_TYPES = ['project', 'task', 'risk', 'assumption', 'issue', 'dependency', 'comment', 'attachment']
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_TERMS = 10
+PREFIX_LENGTH = 4  # Longest prefix the FTS5 index holds (see migration 0039)
+RANK_CANDIDATES = 1000  # Newest matches (and newest title matches) ranked against each other - results are paged within these
+TITLE_WEIGHT = 10.0  # A match in the title counts as much as ten in the body
+BM25_K1, BM25_B = 1.2, 0.75
+FACET_LIMIT = 1000  # Matches counted for each document type before the count shows as 1000+
+SNIPPET_WORDS = 16
+TITLE_LENGTH = 80
+
+# The FTS5 index (SQLite) and full-text index (SQL Server) are created by migration 0039
+
+# Building documents
+
+def _short(text, length=TITLE_LENGTH):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= length else text[:length - 1] + '…'
+
+def _raid_document(doc_type, details_field, url_name):
+    def build(item):
+        details = getattr(item, details_field)
+        return {
+            'project_id': item.project_id,
+            'title': _short(details),
+            'body': details,
+            'url': reverse(url_name, kwargs={'project_id': item.project_id, f'{doc_type}_id': item.pk}),
+        }
+    return build
+
+def _project_document(project):
+    return {
+        'project_id': project.pk,
+        'title': project.project_name,
+        'body': project.project_description or '',
+        'url': reverse('project_detail', kwargs={'project_id': project.pk}),
+    }
+
+def _task_document(task):
+    return {
+        'project_id': task.project_id,
+        'title': task.task_name,
+        'body': task.task_details or '',
+        'url': reverse('task_detail', kwargs={'project_id': task.project_id, 'task_id': task.pk}),
+    }
+
+def _comment_document(comment):
+    parent = comment.content_object
+    if type(parent) not in COMMENTED_TYPES or getattr(parent, 'deleted', None):
+        return None
+    return {
+        'project_id': parent.pk if isinstance(parent, Project) else parent.project_id,
+        'title': f"Comment by {comment.user} on {_short(str(parent), 40)}",
+        'body': comment.comment_text,
+        'url': DOCUMENT_BUILDERS[type(parent)][1](parent)['url'],
+    }
+
+def _attachment_document(extraction):
+    if extraction.status != 2:  # Extracted
+        return None
+    attachment = extraction.attachment
+    return {
+        'object_id': attachment.pk,  # One document per attachment, from its newest extracted text
+        'project_id': attachment.project_id,
+        'title': attachment.filename,
+        'body': extraction.text,
+        'url': reverse('download_attachment', kwargs={'project_id': attachment.project_id, 'attachment_id': attachment.pk}),
+    }
+
+# Each indexed model, its document type and how its document is built
+DOCUMENT_BUILDERS = {
+    Project: ('project', _project_document),
+    Task: ('task', _task_document),
+    Risk: ('risk', _raid_document('risk', 'risk_details', 'risk_detail')),
+    Assumption: ('assumption', _raid_document('assumption', 'assumption_details', 'assumption_detail')),
+    Issue: ('issue', _raid_document('issue', 'issue_details', 'issue_detail')),
+    Dependency: ('dependency', _raid_document('dependency', 'dependency_details', 'dependency_detail')),
+    Comment: ('comment', _comment_document),
+    AttachmentText: ('attachment', _attachment_document),
+}
+COMMENTED_TYPES = set(COMMENTABLE_MODELS.values())
+
+def document_for(instance):
+    """ The search document fields for an object, or None if it shouldn't be found (deleted, or nothing to index) """
+    if getattr(instance, 'deleted', None):
+        return None
+    doc_type, build = DOCUMENT_BUILDERS[type(instance)]
+    document = build(instance)
+    if document is not None:
+        document.setdefault('object_id', instance.pk)
+        document['doc_type'] = doc_type
+        document['title'] = document['title'][:255]
+    return document
+
+def index_object(instance):
+    """ Adds, updates or (if it has been deleted) removes an object's search document """
+    document = document_for(instance)
+    if document is None:
+        if isinstance(instance, AttachmentText):
+            if instance.status != 1:  # Pending - the last text found stays searchable until the new text is in
+                remove_document('attachment', instance.attachment_id)
+        else:
+            remove_document(DOCUMENT_BUILDERS[type(instance)][0], instance.pk)
+        return
+    doc_type, object_id = document.pop('doc_type'), document.pop('object_id')
+    existing = SearchDocument.objects.filter(doc_type=doc_type, object_id=object_id).first()
+    if existing is None:
+        SearchDocument.objects.create(doc_type=doc_type, object_id=object_id, **document)
+    elif any(getattr(existing, field) != value for field, value in document.items()):
+        # Only written when the text has changed, as each write re-indexes the document
+        for field, value in document.items():
+            setattr(existing, field, value)
+        existing.save()
+
+def remove_document(doc_type, object_id):
+    SearchDocument.objects.filter(doc_type=doc_type, object_id=object_id).delete()
+
+def remove_project_documents(project_id):
+    """ Drops everything found under a project - its comments and attachments aren't deleted along with it """
+    SearchDocument.objects.filter(project_id=project_id).delete()
+
+def _comments_on(instance):
+    return Comment.objects.filter(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk)
+
+def remove_comment_documents(instance):
+    """ Drops the documents of the comments on an object, which stay in the database when it is deleted """
+    SearchDocument.objects.filter(doc_type='comment', object_id__in=_comments_on(instance).values('pk')).delete()
+
+def index_comments(instance):
+    """ Indexes the comments on an object again, for when it is restored """
+    for comment in _comments_on(instance).select_related('user'):
+        comment.content_object = instance  # Already loaded
+        index_object(comment)
+
+def index_project_attachments(project):
+    """ Indexes the newest extracted text of each of a project's attachments again, for when the project is restored """
+    seen = set()
+    extractions = AttachmentText.objects.filter(attachment__project=project, status=2).select_related('attachment')  # Extracted
+    for extraction in extractions.order_by('attachment_id', '-created_datetime', '-id'):
+        if extraction.attachment_id not in seen:
+            seen.add(extraction.attachment_id)
+            index_object(extraction)
+
+def rebuild_search_index(batch_size=1000):
+    """ Rebuilds every search document from scratch. Returns the number indexed. """
+    SearchDocument.objects.all().delete()
+    sources = [
+        Project.objects.all(),
+        Task.objects.all(),
+        Risk.objects.all(),
+        Assumption.objects.all(),
+        Issue.objects.all(),
+        Dependency.objects.all(),
+        Comment.objects.select_related('user').prefetch_related('content_object'),  # Parents loaded a type at a time
+        AttachmentText.objects.filter(status=2).select_related('attachment').order_by('attachment_id', '-created_datetime', '-id'),  # Extracted
+    ]
+    live_projects = set(Project.objects.values_list('pk', flat=True))
+    documents, seen, count = [], set(), 0
+    for queryset in sources:
+        for instance in queryset.iterator(chunk_size=batch_size):
+            document = document_for(instance)
+            if document is None or document['project_id'] not in live_projects:
+                continue
+            key = (document['doc_type'], document['object_id'])
+            if key in seen:
+                continue  # An older extraction of an attachment already indexed
+            seen.add(key)
+            documents.append(SearchDocument(**document))
+            if len(documents) >= batch_size:
+                SearchDocument.objects.bulk_create(documents)
+                count += len(documents)
+                documents = []
+    SearchDocument.objects.bulk_create(documents)
+    return count + len(documents)
+
+# Searching
+
+WORD = re.compile(r'\w+')
+
+def search_terms(query):
+    """ The words of a query, as the index splits them - punctuation and query syntax are dropped """
+    return WORD.findall(query or '')[:MAX_SEARCH_TERMS]
+
+def fts_match(terms, doc_types=None, columns='{title body}'):
+    """
+    An FTS5 MATCH expression finding every term in the columns (the title or body), limited to the given document types.
+    A short last term also matches the start of longer words, so results come as the user types - only
+    prefixes the index holds are used, as longer ones have to be merged from every matching word.
+    """
+    phrases = [f'"{term}"' for term in terms]
+    if len(terms[-1]) <= PREFIX_LENGTH:
+        phrases[-1] += '*'
+    expression = columns + ' : (' + ' '.join(phrases) + ')'
+    if doc_types:
+        expression += ' AND doc_type : (' + ' OR '.join(f'doctype{doc_type}' for doc_type in doc_types) + ')'  # As indexed by migration 0039
+    return expression
+
+def rank_candidates(candidates):
+    """
+    Orders (rowid, title, body) rows, with matches marked by FTS5's highlight(), best first. Scored by
+    BM25 over the title and body without the terms' IDF - every candidate holds every term, and FTS5's own
+    bm25() works the IDF out by reading every row holding each term, which is what made common words slow.
+    Lengths are measured in characters rather than words, which ranks the same and costs nothing to find.
+    """
+    if not candidates:
+        return []
+    columns = [(1, TITLE_WEIGHT), (2, 1.0)]
+    lengths = {column: [len(row[column]) for row in candidates] for column, weight in columns}
+    averages = {column: (sum(lengths[column]) / len(candidates)) or 1 for column, weight in columns}
+    scored = []
+    for index, row in enumerate(candidates):
+        score = 0.0
+        for column, weight in columns:
+            hits = row[column].count('\x02')
+            norm = 1 - BM25_B + BM25_B * lengths[column][index] / averages[column]
+            score += weight * hits / (hits + BM25_K1 * norm) if hits else 0
+        scored.append((row[0], score))
+    return sorted(scored, key=lambda item: (-item[1], -item[0]))
+
+def _sqlite_search(terms, doc_types, limit, offset):
+    """
+    Ranks a page of matches and counts the matches of each document type. The time taken doesn't grow
+    with the number of matches: the newest RANK_CANDIDATES matches (every match, for all but common
+    words) are ranked, snippets are made for the page only, and each count stops at FACET_LIMIT.
+    When there are more matches than that, the newest RANK_CANDIDATES title matches are ranked as well, so
+    older documents named by the search aren't lost, and the results are marked as truncated. Either way
+    only the best RANK_CANDIDATES are paged through.
+    """
+    expression = fts_match(terms, doc_types)
+    candidates_sql = (
+        f"SELECT rowid, highlight({FTS_TABLE}, 0, char(2), char(3)), highlight({FTS_TABLE}, 1, char(2), char(3)) "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        # One row past the limit shows whether some matches were left out
+        cursor.execute(candidates_sql, [expression, RANK_CANDIDATES + 1])
+        candidates = cursor.fetchall()
+        truncated = len(candidates) > RANK_CANDIDATES
+        if truncated:
+            candidates = {row[0]: row for row in candidates[:RANK_CANDIDATES]}
+            cursor.execute(candidates_sql, [fts_match(terms, doc_types, columns='title'), RANK_CANDIDATES])
+            candidates.update((row[0], row) for row in cursor.fetchall())
+            candidates = list(candidates.values())
+        ranked = rank_candidates(candidates)[:RANK_CANDIDATES][offset:offset + limit]
+        snippets = {}
+        if ranked:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, 1, char(2), char(3), '…', %s) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({', '.join(['%s'] * len(ranked))})",
+                [SNIPPET_WORDS, expression] + [document_id for document_id, score in ranked],
+            )
+            snippets = dict(cursor.fetchall())
+        cursor.execute(
+            ' UNION ALL '.join(
+                [f"SELECT %s, (SELECT count(*) FROM (SELECT 1 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s))"] * len(DOCUMENT_TYPES)
+            ),
+            [value for doc_type in DOCUMENT_TYPES for value in (doc_type, fts_match(terms, [doc_type]), FACET_LIMIT + 1)],
+        )
+        facets = {doc_type: count for doc_type, count in cursor.fetchall() if count}
+    return [(document_id, snippets.get(document_id), score) for document_id, score in ranked], facets, truncated
+
+def mssql_contains(terms):
+    """ A CONTAINS condition for SQL Server's full-text index, written the same way as the FTS5 one """
+    phrases = [f'"{term}"' for term in terms]
+    if len(terms[-1]) <= PREFIX_LENGTH:
+        phrases[-1] = f'"{terms[-1]}*"'
+    return ' AND '.join(phrases)
+
+def _mssql_search(terms, doc_types, limit, offset):
+    """
+    CONTAINSTABLE ranks the best RANK_CANDIDATES matches itself, so the results are truncated when there are
+    more matches than that. The counts are full ones - SQL Server groups them in the index.
+    """
+    type_filter, params = '', [mssql_contains(terms), RANK_CANDIDATES]
+    if doc_types:
+        type_filter = f"WHERE d.doc_type IN ({', '.join(['%s'] * len(doc_types))})"
+        params += list(doc_types)
+    contains = f"CONTAINSTABLE({SEARCH_TABLE}, (title, body), %s, %s) AS ft JOIN {SEARCH_TABLE} d ON d.id = ft.[KEY]"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT d.id, ft.RANK FROM {contains} {type_filter} ORDER BY ft.RANK DESC, d.id DESC OFFSET %s ROWS FETCH NEXT %s ROWS ONLY",
+            params + [offset, limit],
+        )
+        ranked = [(document_id, None, rank) for document_id, rank in cursor.fetchall()]
+        cursor.execute(
+            f"SELECT d.doc_type, COUNT(*) FROM CONTAINSTABLE({SEARCH_TABLE}, (title, body), %s) AS ft "
+            f"JOIN {SEARCH_TABLE} d ON d.id = ft.[KEY] GROUP BY d.doc_type",
+            [mssql_contains(terms)],
+        )
+        facets = dict(cursor.fetchall())
+    truncated = sum(count for doc_type, count in facets.items() if not doc_types or doc_type in doc_types) > RANK_CANDIDATES
+    return ranked, facets, truncated
+
+def _fallback_search(terms, doc_types, limit, offset):
+    """ Other databases have no full-text index set up, so every term has to appear somewhere in the title or body """
+    documents = SearchDocument.objects.all()
+    for term in terms:
+        documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    facets = dict(documents.values('doc_type').annotate(count=Count('id')).order_by().values_list('doc_type', 'count'))
+    if doc_types:
+        documents = documents.filter(doc_type__in=doc_types)
+    ranked = [(document_id, None, 0) for document_id in documents.order_by('-updated_datetime', '-id').values_list('id', flat=True)[offset:offset + limit]]
+    return ranked, facets, False  # Every match is paged through
+
+def _mark(text):
+    """ Escapes a snippet and turns the highlight markers into <mark> tags """
+    return mark_safe(escape(text).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+def make_snippet(body, terms, words=SNIPPET_WORDS):
+    """ A window of the body around the first matching word, with the matches marked, for databases without snippet() """
+    tokens = body.split()
+    pattern = re.compile(r'(' + '|'.join(re.escape(term) for term in terms) + r')', re.IGNORECASE)
+    first = next((index for index, token in enumerate(tokens) if pattern.search(token)), 0)
+    start = max(first - words // 3, 0)
+    window = ' '.join(tokens[start:start + words])
+    marked = pattern.sub(lambda match: f'\x02{match.group(0)}\x03', window)
+    return ('…' if start else '') + marked + ('…' if start + words < len(tokens) else '')
+
+def search(query, doc_types=None, limit=SEARCH_PAGE_SIZE, offset=0):
+    """
+    Full-text search across projects, tasks, RAID items, comments and attachment text. Returns a dict with
+    the page of `results` (best first, each with a highlighted `snippet`), whether there are `more` after it,
+    `facets` (matches of each document type, ignoring doc_types so they can be used to switch type), the types
+    in `capped` whose count stopped at FACET_LIMIT, `total` (matches of the chosen types) and whether the
+    results are `truncated` - there were more matches than could be ranked, so only the best RANK_CANDIDATES
+    of those that were are paged through.
+    """
+    terms = search_terms(query)
+    doc_types = [doc_type for doc_type in (doc_types or []) if doc_type in DOCUMENT_TYPES]
+    if not terms:
+        return {'results': [], 'more': False, 'facets': {}, 'capped': [], 'total': 0, 'truncated': False}
+
+    # One result past the page shows whether there is another
+    if connection.vendor == 'sqlite':
+        ranked, facets, truncated = _sqlite_search(terms, doc_types, limit + 1, offset)
+    elif connection.vendor == 'microsoft':
+        ranked, facets, truncated = _mssql_search(terms, doc_types, limit + 1, offset)
+    else:
+        ranked, facets, truncated = _fallback_search(terms, doc_types, limit + 1, offset)
+    more, ranked = len(ranked) > limit, ranked[:limit]
+
+    documents = SearchDocument.objects.in_bulk([document_id for document_id, snippet, rank in ranked])
+    results = []
+    for document_id, snippet, rank in ranked:
+        document = documents.get(document_id)
+        if document is None:
+            continue
+        results.append({
+            'doc_type': document.doc_type,
+            'object_id': document.object_id,
+            'project_id': document.project_id,
+            'title': document.title,
+            'url': document.url,
+            'snippet': _mark(snippet if snippet is not None else make_snippet(document.body, terms)),
+            'rank': rank,
+        })
+    capped = [doc_type for doc_type in DOCUMENT_TYPES if facets.get(doc_type, 0) > FACET_LIMIT]
+    facets = {doc_type: min(count, FACET_LIMIT) for doc_type, count in facets.items()}
+    total = sum(count for doc_type, count in facets.items() if not doc_types or doc_type in doc_types)
+    return {'results': results, 'more': more, 'facets': facets, 'capped': capped, 'total': total, 'truncated': truncated}
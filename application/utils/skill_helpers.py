@@ -0,0 +1,119 @@
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Count
+
+from ..models import Asset, Skill, Task
+
+class SkillIndex:
+    """
+    Each asset's skills held as an integer bitset, so matching a set of skills is a single AND per
+    asset rather than a join per skill. Skills are numbered from 0 in id order, so the masks only
+    grow with the number of skills in use, not with the highest skill id.
+    """
+    def __init__(self, assets, asset_skills):
+        # assets is (asset id, name) pairs in display order, asset_skills is (asset id, skill id) pairs
+        self.bits = {skill_id: bit for bit, skill_id in enumerate(sorted({skill_id for asset_id, skill_id in asset_skills}))}
+        masks = dict.fromkeys((asset_id for asset_id, name in assets), 0)
+        for asset_id, skill_id in asset_skills:
+            if asset_id in masks:
+                masks[asset_id] |= 1 << self.bits[skill_id]
+        self.names = dict(assets)
+        self.masks = list(masks.items())
+
+    def mask(self, skill_ids):
+        mask = 0
+        for skill_id in skill_ids:
+            # A skill no asset has gets a bit no mask has, so it matches nothing
+            mask |= 1 << self.bits.get(skill_id, len(self.bits))
+        return mask
+
+    def having_all(self, skill_ids):
+        """ Returns the ids of the assets that have every one of the skills, in name order """
+        wanted = self.mask(skill_ids)
+        return [asset_id for asset_id, mask in self.masks if mask & wanted == wanted]
+
+    def having_any(self, skill_ids):
+        """ Returns (asset id, number of the skills it has) for assets with at least one, most matching first """
+        wanted = self.mask(skill_ids)
+        matches = [(asset_id, (mask & wanted).bit_count()) for asset_id, mask in self.masks if mask & wanted]
+        matches.sort(key=lambda match: -match[1])  # Stable, so ties stay in name order
+        return matches
+
+def _skill_index_rows():
+    """ Every live asset as (asset id, name) in name order, and every live skill an asset has as (asset id, skill id) """
+    assets = Asset.objects.order_by('name').values_list('asset_id', 'name')
+    asset_skills = Asset.skills.through.objects.filter(
+        asset__deleted__isnull=True, skill__deleted__isnull=True
+    ).values_list('asset_id', 'skill_id')
+    return assets, asset_skills
+
+def build_skill_index():
+    """ Reads every live asset and its live skills in two queries """
+    assets, asset_skills = _skill_index_rows()
+    return SkillIndex(list(assets), list(asset_skills))
+
+async def abuild_skill_index():
+    assets, asset_skills = _skill_index_rows()
+    return SkillIndex([row async for row in assets], [row async for row in asset_skills])
+
+# The index is kept in each process, tagged with the version of the data it was built from
+_skill_index = (None, None)
+_skill_index_lock = threading.Lock()
+
+def _index_version():
+    """
+    Read from the database, so a change made by any process is seen by all of them. Every save or delete
+    of an asset or skill adds a history row, and adding or removing an asset's skill changes the row
+    count or the highest id of the asset skills table (ids aren't reused).
+    """
+    asset_history, skill_history, asset_skills = (
+        connection.ops.quote_name(model._meta.db_table)
+        for model in (Asset.history.model, Skill.history.model, Asset.skills.through)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT (SELECT MAX(history_id) FROM {asset_history}), (SELECT MAX(history_id) FROM {skill_history}), "
+            f"(SELECT COUNT(*) FROM {asset_skills}), (SELECT MAX(id) FROM {asset_skills})"
+        )
+        return cursor.fetchone()
+
+def get_skill_index():
+    """ Returns the skill index, rebuilding it when assets or skills have changed (in this or any other process) """
+    global _skill_index
+    version = _index_version()
+    built_for, index = _skill_index
+    if index is None or built_for != version:
+        with _skill_index_lock:
+            built_for, index = _skill_index
+            if index is None or built_for != version:
+                index = build_skill_index()
+                _skill_index = (version, index)
+    return index
+
+async def aget_skill_index():
+    """
+    get_skill_index() for async views. The lock isn't taken, as it would block the event loop - two
+    requests that find the index stale at the same moment may both rebuild it.
+    """
+    global _skill_index
+    version = await sync_to_async(_index_version)()
+    built_for, index = _skill_index
+    if index is None or built_for != version:
+        index = await abuild_skill_index()
+        _skill_index = (version, index)
+    return index
+
+async def arank_by_workload(asset_ids):
+    """
+    Orders asset ids by the number of Assigned tasks each has, fewest first, using one grouped query.
+    Returns (ordered ids, open task count by asset id). Ties keep their order.
+    """
+    counts = (
+        Task.objects.filter(assigned_to_id__in=asset_ids, task_status=2)  # Assigned
+        .values('assigned_to_id').annotate(open_tasks=Count('id')).order_by()
+        .values_list('assigned_to_id', 'open_tasks')
+    )
+    open_tasks = {asset_id: count async for asset_id, count in counts}
+    return sorted(asset_ids, key=lambda asset_id: open_tasks.get(asset_id, 0)), open_tasks
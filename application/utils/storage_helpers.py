@@ -0,0 +1,158 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import transaction
+from django.db.models import F
+
+from ..models import AttachmentBlob
+
+BLOB_FOLDER = 'blobs'
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SNIFF_LENGTH = 16  # Bytes read from the start of a file to recognise its type
+
+# Types Python's mimetypes doesn't know on every platform
+mimetypes.add_type('application/vnd.ms-outlook', '.msg')
+mimetypes.add_type('application/vnd.openxmlformats-officedocument.wordprocessingml.document', '.docx')
+
+# The first bytes of common file types, and the type they mean
+SIGNATURES = [
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'PK\x03\x04', 'application/zip'),  # Also Office Open XML (.docx, .xlsx) files
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),  # Also Outlook .msg and older Office files
+]
+CONTAINER_TYPES = {'application/zip', 'application/x-ole-storage'}
+SIGNATURE_TYPES = {content_type for signature, content_type in SIGNATURES} - CONTAINER_TYPES
+
+def blob_name(sha256):
+    """ Where a blob is kept under MEDIA_ROOT - split on the first two characters so no folder gets too big """
+    return f'{BLOB_FOLDER}/{sha256[:2]}/{sha256}'
+
+def detect_content_type(file_name, head):
+    """
+    Works out a file's MIME type from its first bytes, falling back to its name. A zip or OLE container
+    takes the more specific type its name gives (a .docx is a zip), as long as the name doesn't claim
+    something the bytes rule out.
+    """
+    guessed = mimetypes.guess_type(file_name)[0]
+    sniffed = next((content_type for signature, content_type in SIGNATURES if head.startswith(signature)), None)
+    if sniffed is None:
+        return guessed or 'application/octet-stream'
+    if sniffed in CONTAINER_TYPES and guessed and guessed not in SIGNATURE_TYPES:
+        return guessed
+    return sniffed
+
+class HashedUploadedFile(UploadedFile):
+    """ An upload written to a temporary file next to the blob store, with its SHA-256 worked out as it arrived """
+    def __init__(self, file, name, content_type, size, charset, sha256, head):
+        super().__init__(file, name, content_type, size, charset)
+        self.sha256 = sha256
+        self.head = head
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        self.file.close()
+        # Still here if the upload was never stored (it is moved or removed when it is)
+        if os.path.exists(self.file.name):
+            os.remove(self.file.name)
+
+class BlobUploadHandler(FileUploadHandler):
+    """
+    Streams each uploaded file to disk a chunk at a time, hashing it on the way, so a large upload is
+    never held in memory and doesn't need reading again to find its blob. The temporary file is made in
+    the blob folder, so storing it is a rename rather than a copy.
+    """
+    chunk_size = UPLOAD_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        folder = os.path.join(settings.MEDIA_ROOT, BLOB_FOLDER, 'tmp')
+        os.makedirs(folder, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=folder, suffix='.upload', delete=False)
+        self.digest = hashlib.sha256()
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.head) < SNIFF_LENGTH:
+            self.head += raw_data[:SNIFF_LENGTH - len(self.head)]
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        return HashedUploadedFile(
+            self.file, self.file_name, self.content_type, file_size, self.charset, self.digest.hexdigest(), self.head
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+
+def _hash_upload(uploaded_file):
+    """ Hashes an upload that didn't come through BlobUploadHandler, and writes it to a temporary file in the blob folder """
+    folder = os.path.join(settings.MEDIA_ROOT, BLOB_FOLDER, 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    digest, head = hashlib.sha256(), b''
+    with tempfile.NamedTemporaryFile(dir=folder, suffix='.upload', delete=False) as f:
+        for chunk in uploaded_file.chunks(UPLOAD_CHUNK_SIZE):
+            if len(head) < SNIFF_LENGTH:
+                head += chunk[:SNIFF_LENGTH - len(head)]
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest(), head, f.name
+
+def store_upload(uploaded_file):
+    """
+    Adds an upload to the blob store and returns (blob, MIME type). Contents that are already stored
+    get another reference instead of a second copy. The blob's file is moved into place before the
+    row is committed, so a blob row always has its file.
+    """
+    if isinstance(uploaded_file, HashedUploadedFile):
+        sha256, head, temporary_path = uploaded_file.sha256, uploaded_file.head, uploaded_file.temporary_file_path()
+        uploaded_file.file.close()  # Flushed, and closed so it can be moved on Windows
+    else:
+        sha256, head, temporary_path = _hash_upload(uploaded_file)
+    content_type = detect_content_type(uploaded_file.name, head)
+
+    name = blob_name(sha256)
+    with transaction.atomic():
+        blob, created = AttachmentBlob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'file': name, 'size': os.path.getsize(temporary_path), 'reference_count': 1}
+        )
+        if created:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary_path, path)
+        else:
+            AttachmentBlob.objects.filter(pk=blob.pk).update(reference_count=F('reference_count') + 1)
+            os.remove(temporary_path)
+    return blob, content_type
+
+def release_blob(blob_id):
+    """ Drops one reference to a blob, deleting it and its file once nothing uses it """
+    with transaction.atomic():
+        AttachmentBlob.objects.filter(pk=blob_id).update(reference_count=F('reference_count') - 1)
+        blob = AttachmentBlob.objects.select_for_update().filter(pk=blob_id, reference_count__lte=0).first()
+        if blob is None:
+            return
+        sha256, path = blob.sha256, os.path.join(settings.MEDIA_ROOT, blob.file.name)
+        blob.delete()
+    # Only removed once the delete has committed (in case it rolls back), and not if the same contents were uploaded again since
+    transaction.on_commit(lambda: _remove_blob_file(sha256, path))
+
+def _remove_blob_file(sha256, path):
+    if not AttachmentBlob.objects.filter(sha256=sha256).exists() and os.path.exists(path):
+        os.remove(path)
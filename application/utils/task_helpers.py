@@ -0,0 +1,215 @@
+import csv
+import io
+
+from django.db.models import Q, When, Case, BooleanField, DateField, Exists, OuterRef, Count, Max
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from ..models import Task, TaskConflict
+from .datatables_helpers import keyset_filter, lookup_value, make_cursor, read_cursor, order_expressions
+
+# Filters for each of the task list routes
+TASK_LIST_FILTERS = {
+    'open_task_list': Q(task_status__in=[1, 2]),
+    'completed_task_list': Q(task_status=3),
+    'unassigned_tasks': Q(task_status=1),
+}
+
+# Default ordering for task lists - priority first, then date
+TASK_LIST_ORDERING = ['-project__priority', '-priority', 'planned_start_date']
+
+# Columns the task list DataTable can sort and search on.
+# 'keyset' columns are never empty, so they can be paged with a cursor instead of an offset.
+TASK_LIST_COLUMNS = {
+    'project': {'field': 'project__project_name', 'keyset': True},
+    'task_name': {'field': 'task_name', 'keyset': True},
+    'status': {'field': 'task_status', 'choices': Task.STATUS_CHOICES, 'keyset': True},
+    'priority': {'field': 'priority', 'choices': Task.PRIORITY_CHOICES, 'keyset': True},
+    'owner': {'field': 'assigned_to__name', 'keyset': False},
+    'start_date': {'field': 'annotated_start_date', 'keyset': False, 'searchable': False},
+    'end_date': {'field': 'annotated_end_date', 'keyset': False, 'searchable': False},
+}
+
+# Columns of the task list CSV export, with their headings
+TASK_EXPORT_COLUMNS = ['Project Name', 'Task Name', 'Status', 'Priority', 'Owner', 'Start Date', 'End Date']
+EXPORT_CHUNK_SIZE = 2000
+
+def annotate_task_flags(tasks):
+    """
+    Annotates tasks with can_be_completed and conflict_flag, along with the display dates.
+    """
+    return tasks.annotate(
+        annotated_start_date=Coalesce('actual_start_date', 'planned_start_date', output_field=DateField()),
+        annotated_end_date=Coalesce('actual_end_date', 'planned_end_date', output_field=DateField()),
+        can_be_completed=Case(
+            When(prereq_task__task_status=3, then=True),  # Completed prerequisite task
+            When(prereq_task__isnull=True, then=True),    # No prerequisite task
+            default=False,
+            output_field=BooleanField()
+        ),
+        # Conflicts are looked up in the TaskConflict index, either as the dependent task or the prerequisite
+        conflict_flag=Case(
+            When(Exists(TaskConflict.objects.filter(task_id=OuterRef('pk'))), then=True),
+            When(Exists(TaskConflict.objects.filter(prereq_task_id=OuterRef('pk'))), then=True),
+            default=False,
+            output_field=BooleanField()
+        )
+    )
+
+def task_url_template(project_id):
+    """
+    Returns a format string for the task detail URLs of a project, so a URL can be made for every
+    task in a list with one reverse() call. The task detail URL is reversed with a sentinel task ID
+    of 0, which is then swapped for the placeholder.
+    """
+    head, sentinel, tail = reverse('task_detail', kwargs={'project_id': project_id, 'task_id': 0}).rpartition('0')
+    return head + '{}' + tail
+
+def task_list_queryset(route_name=None, project_id=None):
+    """ Returns the annotated tasks for one of the task list routes, or for a single project """
+    if route_name in TASK_LIST_FILTERS:
+        tasks = Task.objects.filter(TASK_LIST_FILTERS[route_name])
+    elif project_id is not None:
+        tasks = Task.objects.filter(project_id=project_id)
+    else:
+        tasks = Task.objects.all()
+    return annotate_task_flags(tasks)
+
+def _column_search(column, value):
+    """ Builds the filter for a search value on one column, matching choice labels for choice columns """
+    if column.get('searchable', True) is False:
+        return None
+    if 'choices' in column:
+        keys = [key for key, label in column['choices'] if value.lower() in label.lower()]
+        return Q(**{f"{column['field']}__in": keys})
+    return Q(**{f"{column['field']}__icontains": value})
+
+def filter_task_list(tasks, params):
+    """ Applies the DataTables global search and per-column searches """
+    if params['search']:
+        condition = Q()
+        for column in TASK_LIST_COLUMNS.values():
+            column_condition = _column_search(column, params['search'])
+            if column_condition is not None:
+                condition |= column_condition
+        tasks = tasks.filter(condition)
+
+    for column in params['columns']:
+        if column['search'] and column['data'] in TASK_LIST_COLUMNS:
+            column_condition = _column_search(TASK_LIST_COLUMNS[column['data']], column['search'])
+            if column_condition is not None:
+                tasks = tasks.filter(column_condition)
+    return tasks
+
+def order_task_list(tasks, params):
+    """
+    Orders the tasks by the DataTables request's sort columns, or the default task list ordering.
+    Returns (tasks, the (field, descending) ordering used, whether it can be paged with a keyset).
+    """
+    ordering = [
+        (TASK_LIST_COLUMNS[name]['field'], descending)
+        for name, descending in params['order'] if name in TASK_LIST_COLUMNS
+    ]
+    keyset_possible = bool(ordering) and all(
+        TASK_LIST_COLUMNS[name]['keyset'] for name, _ in params['order'] if name in TASK_LIST_COLUMNS
+    )
+    if ordering:
+        ordering.append(('id', False))  # Unique tie breaker so every row has a fixed position
+        tasks = tasks.order_by(*order_expressions(ordering))
+    else:
+        tasks = tasks.order_by(*TASK_LIST_ORDERING, 'id')
+    return tasks.select_related('project', 'assigned_to'), ordering, keyset_possible
+
+def task_list_page(tasks, params):
+    """
+    Filters, orders and pages the tasks for a DataTables request.
+    Returns (filtered count, page of tasks, cursor for the next page or None).
+    When the client sends back the cursor from the previous page, and every sorted column
+    is never empty, the page is found with a keyset (WHERE ... > last row) rather than OFFSET.
+    """
+    tasks = filter_task_list(tasks, params)
+    records_filtered = tasks.count()
+    tasks, ordering, keyset_possible = order_task_list(tasks, params)
+
+    start, length = params['start'], params['length']
+
+    # The cursor is only valid for the same search and ordering, starting at the same row
+    state = [start, params['search'], [[c['data'], c['search']] for c in params['columns']], [list(o) for o in ordering]]
+    values = read_cursor(params['cursor'], state) if keyset_possible else None
+    if values is not None:
+        page = list(tasks.filter(keyset_filter(ordering, values))[:length])
+    else:
+        page = list(tasks[start:start + length])
+
+    next_cursor = None
+    if keyset_possible and page and start + length < records_filtered:
+        next_state = [start + length] + state[1:]
+        next_cursor = make_cursor(next_state, [lookup_value(page[-1], field) for field, _ in ordering])
+
+    return records_filtered, page, next_cursor
+
+def task_list_row(task):
+    """ Serialises a task for the task list DataTable """
+    project_id = task.project_id
+    return {
+        'id': task.id,
+        'project': task.project.project_name,
+        'project_url': reverse('project_detail', kwargs={'project_id': project_id}),
+        'task_name': task.task_name,
+        'url': reverse('task_detail', kwargs={'project_id': project_id, 'task_id': task.id}),
+        'status': task.get_task_status_display(),
+        'task_status': task.task_status,
+        'priority': task.get_priority_display(),
+        'owner': task.assigned_to.name if task.assigned_to else None,
+        'owner_url': reverse('asset_detail', kwargs={'pk': task.assigned_to_id}) if task.assigned_to_id else None,
+        'start_date': task.annotated_start_date.strftime('%d/%m/%Y') if task.annotated_start_date else '',
+        'end_date': task.annotated_end_date.strftime('%d/%m/%Y') if task.annotated_end_date else '',
+        'conflict_flag': task.conflict_flag,
+        'can_be_completed': task.can_be_completed,
+        'edit_url': reverse('task_edit', kwargs={'project_id': project_id, 'task_id': task.id}),
+        'complete_url': reverse('task_complete', kwargs={'project_id': project_id, 'task_id': task.id}),
+    }
+
+def _export_cell(value):
+    """ Stops spreadsheets reading text that starts like a formula as one """
+    return "'" + value if value[:1] in ('=', '+', '-', '@') else value
+
+def stream_task_list_csv(tasks, params):
+    """
+    Yields the task list as CSV, one line at a time - every task matching the DataTables request's searches,
+    in its order, rather than just the page on screen. Tasks are read from the database in chunks.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row):
+        writer.writerow(row)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(TASK_EXPORT_COLUMNS)
+    tasks, ordering, keyset_possible = order_task_list(filter_task_list(tasks, params), params)
+    for task in tasks.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield line([
+            _export_cell(task.project.project_name),
+            _export_cell(task.task_name),
+            task.get_task_status_display(),
+            task.get_priority_display(),
+            _export_cell(task.assigned_to.name) if task.assigned_to else 'Unassigned',
+            task.annotated_start_date.strftime('%d/%m/%Y') if task.annotated_start_date else '',
+            task.annotated_end_date.strftime('%d/%m/%Y') if task.annotated_end_date else '',
+        ])
+
+def project_tasks_stamp(project_id):
+    """
+    Returns (last modified datetime, live task count) for a project's tasks in one query.
+    Every save moves the last modified time on, and deleting or restoring a task changes the count,
+    so the stamp changes whenever one of the project's tasks is written.
+    """
+    stamp = Task.all_objects.filter(project_id=project_id).aggregate(
+        last_modified=Max('last_updated_datetime'),
+        live=Count('id', filter=Q(deleted__isnull=True)),
+    )
+    return stamp['last_modified'], stamp['live']
@@ -0,0 +1,78 @@
+"""
+Reads the text out of uploaded files. This runs in the extraction worker processes, so it must not
+import Django or the models - the results are saved by attachment_helpers.py in the web process.
+"""
+import hashlib
+import os
+
+import docx2txt  # Library for handling .docx files
+import extract_msg  # Library for handling .msg files
+from pdfminer.high_level import extract_text
+
+PREVIEW_LENGTH = 500  # Characters of text shown in the attachment preview
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(file_path):
+    """ The SHA-256 of a file's contents, read a chunk at a time """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_msg_file(file_path):
+    msg = extract_msg.Message(file_path)
+    try:
+        return {
+            'file_type': 'email',
+            'text': msg.body or '',
+            'sender': msg.sender or '',
+            'recipients': msg.to or '',
+            'subject': msg.subject or '',
+            'has_attachments': len(msg.attachments) > 0,
+        }
+    finally:
+        msg.close()
+
+def extract_docx_file(file_path):
+    return {'file_type': 'docx', 'text': docx2txt.process(file_path) or ''}
+
+def extract_pdf_file(file_path):
+    text = extract_text(file_path)
+    # pdfminer ends every page with a form feed, so the page count comes without parsing the file again
+    return {'file_type': 'pdf', 'text': text.replace('\x0c', '\n').strip(), 'page_count': text.count('\x0c')}
+
+def extract_txt_file(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return {'file_type': 'txt', 'text': f.read()}
+
+EXTRACTORS = {
+    '.msg': (extract_msg_file, 'Could not parse email'),
+    '.docx': (extract_docx_file, 'Could not parse document'),
+    '.pdf': (extract_pdf_file, 'Could not parse PDF'),
+    '.txt': (extract_txt_file, 'Could not read text file'),
+}
+
+def is_supported(file_name):
+    return os.path.splitext(file_name.lower())[1] in EXTRACTORS
+
+def extract_file(file_path, file_name=None):
+    """
+    Pulls the text and metadata out of a file, choosing how to read it from file_name's extension
+    (blobs are stored without one). Returns a dict of AttachmentText fields - a file that is missing,
+    not supported or can't be read comes back with its status and error set rather than raising.
+    """
+    if not os.path.exists(file_path):
+        return {'status': 5, 'error': 'File not found'}  # File Missing
+    extension = os.path.splitext((file_name or file_path).lower())[1]
+    if extension not in EXTRACTORS:
+        return {'status': 4, 'error': 'This file type is not supported for preview.'}  # Not Supported
+
+    extractor, failure = EXTRACTORS[extension]
+    try:
+        result = extractor(file_path)
+    except Exception as e:
+        return {'status': 3, 'error': f'{failure}: {e}'}  # Failed
+    result['status'] = 2  # Extracted
+    result['preview'] = result['text'][:PREVIEW_LENGTH]
+    return result
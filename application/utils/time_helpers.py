@@ -0,0 +1,37 @@
+from django.db.models import Avg, Count, Sum
+
+# The DurationField on Task holding the time a task actually took
+ACTUAL_TIME_FIELD = 'actual_time_to_complete'
+
+def to_hours(duration):
+    """ Converts a timedelta (or None, which is what an empty Sum/Avg gives back) to hours as a float """
+    return duration.total_seconds() / 3600 if duration else 0.0
+
+def time_aggregates(field=ACTUAL_TIME_FIELD):
+    """
+    The Sum/Avg expressions for a DurationField, for use in aggregate() or a grouped annotate().
+    Both are worked out by the database (SQLite and SQL Server store durations as an integer number
+    of microseconds), so no Task instances need to be loaded to add up the time.
+    Avg only includes tasks with a time recorded.
+    """
+    return {
+        'task_count': Count('pk'),
+        'total_time': Sum(field),
+        'average_time': Avg(field),
+    }
+
+def _in_hours(row):
+    return {
+        'task_count': row['task_count'],
+        'total_hours': to_hours(row['total_time']),
+        'average_hours': to_hours(row['average_time']),
+    }
+
+def time_totals(tasks, field=ACTUAL_TIME_FIELD):
+    """ Returns {'task_count', 'total_hours', 'average_hours'} for a queryset of tasks in one query """
+    return _in_hours(tasks.aggregate(**time_aggregates(field)))
+
+def time_totals_by(tasks, group_field, field=ACTUAL_TIME_FIELD):
+    """ Returns {group value: time_totals} for a queryset of tasks grouped on group_field, in one query """
+    rows = tasks.values(group_field).annotate(**time_aggregates(field)).order_by()
+    return {row[group_field]: _in_hours(row) for row in rows}
@@ -0,0 +1,71 @@
+from django.db.models import Count, Q
+
+from ..models import Project, Task
+from .time_helpers import time_totals_by
+
+# Project statuses that count as open - everything except Closed (Status 7)
+OPEN_PROJECT_STATUSES = [1, 3, 4, 5, 6]
+
+def _percentage(part, total):
+    return (part / total * 100) if total > 0 else 0
+
+def asset_workload_now(assets):
+    """
+    Returns the "Now" stats for each asset - open projects owned and open/closed tasks assigned -
+    using one grouped query on Task and one on Project, however many assets there are.
+    """
+    task_rows = Task.objects.values('assigned_to_id').annotate(
+        open_tasks=Count('id', filter=Q(task_status=2)),  # Only Assigned tasks
+        closed_tasks=Count('id', filter=Q(task_status=3)),  # Completed tasks
+    ).order_by()
+    task_counts = {row['assigned_to_id']: row for row in task_rows}
+
+    project_counts = dict(
+        Project.objects.filter(project_status__in=OPEN_PROJECT_STATUSES, project_owner__isnull=False)
+        .values('project_owner_id').annotate(projects=Count('id')).order_by()
+        .values_list('project_owner_id', 'projects')
+    )
+
+    # The global totals include every group, so they are worked out once from the rows already fetched
+    total_open_tasks = sum(row['open_tasks'] for row in task_counts.values())
+    total_closed_tasks = sum(row['closed_tasks'] for row in task_counts.values())
+
+    asset_stats = []
+    for asset in assets:
+        counts = task_counts.get(asset.pk, {'open_tasks': 0, 'closed_tasks': 0})
+        asset_stats.append({
+            'asset': asset,
+            'projects_owned': project_counts.get(asset.pk, 0),
+            'open_tasks_assigned': counts['open_tasks'],
+            'percentage_of_open_tasks': _percentage(counts['open_tasks'], total_open_tasks),
+            'closed_tasks_assigned': counts['closed_tasks'],
+            'percentage_of_closed_tasks': _percentage(counts['closed_tasks'], total_closed_tasks),
+        })
+    return asset_stats
+
+def asset_workload_for_period(assets, start_date, end_date):
+    """
+    Returns the tasks completed and time spent by each asset between two dates
+    using one grouped query on Task, however many assets there are.
+    """
+    completed = time_totals_by(
+        Task.objects.filter(task_status=3, actual_end_date__range=(start_date, end_date)),  # Completed
+        'assigned_to_id'
+    )
+
+    # Includes tasks completed by assets not in the list (and unassigned ones), as before
+    total_tasks_in_period = sum(row['task_count'] for row in completed.values())
+
+    asset_stats = []
+    for asset in assets:
+        row = completed.get(asset.pk, {'task_count': 0, 'total_hours': 0.0})
+        num_completed_tasks = row['task_count']
+        asset_stats.append({
+            'asset': asset,
+            'tasks_completed': num_completed_tasks,
+            'total_time_spent_hours': row['total_hours'],
+            # Tasks without a recorded time still count towards the average, as they always have
+            'avg_time_per_task_hours': row['total_hours'] / num_completed_tasks if num_completed_tasks > 0 else 0,
+            'percentage_of_tasks': _percentage(num_completed_tasks, total_tasks_in_period),
+        })
+    return asset_stats
@@ -1,19 +1,23 @@
 from datetime import timedelta, date
+from asgiref.sync import sync_to_async
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.auth.decorators import login_required, permission_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q, F, Count, When, Case, BooleanField, DateField, Subquery, OuterRef
-from django.db.models.functions import Coalesce
-from django.http import HttpResponse, JsonResponse, FileResponse
+from django.db.models import Q, Count
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_date
 from django.core.serializers import serialize
-from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.shortcuts import render,get_object_or_404, redirect
 from django.views.generic import ListView, DetailView,CreateView, UpdateView, View, TemplateView
 from django.urls import reverse_lazy,reverse
 from django.utils import timezone
-from django.utils.html import escape
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag, urlencode
 
 from calendar import monthrange
 
@@ -23,18 +27,34 @@ from .models import Project, Task, Stakeholder, Risk, Issue, Assumption, Depende
 from .forms import ProjectForm, ProjectUpdateForm, CreateTaskForm, StakeholderForm, RiskForm, IssueForm, AssumptionForm, DependencyForm, EditTaskForm, TaskCompleteForm, ProjectCloseForm, AttachmentForm
 
 import json
+import mimetypes
 import os
-import extract_msg  # Library for handling .msg files
-import docx2txt  # Library for handling .docx files
-
-from pdfminer.high_level import extract_text
-
 from django.utils.timezone import now
-from django.core.files.storage import FileSystemStorage
 
 from django.conf import settings  # Import settings to access MEDIA_ROOT
 
-from .utils.project_helpers import calculate_rag_status
+from .middleware import performance_stats
+from .mixins import ProjectScopedMixin
+from .utils.calendar_helpers import parse_calendar_window, aproject_events_stamp, project_events_etag, aget_project_events_payload, build_task_events
+from .utils.schedule_helpers import project_schedule, propagate_date_shift
+from .utils.gantt_helpers import gantt_data, parse_gantt_version, stream_portfolio_gantt
+from .utils.project_helpers import annotate_display_dates
+from .utils.rollup_helpers import attach_rollups
+from .utils.dashboard_helpers import get_dashboard_stats
+from .utils.datatables_helpers import parse_datatables_request
+from .utils.time_helpers import time_aggregates, time_totals, to_hours
+from .utils.capacity_helpers import CAPACITY_LOOKAHEAD_DAYS, asset_capacity, capacity_matrix, summarise_capacity, weekly_capacity
+from .utils.assignment_helpers import DEFAULT_RECOMMENDATIONS, assign_unassigned_tasks, recommend_assignees
+from .utils.skill_helpers import aget_skill_index, arank_by_workload, get_skill_index
+from .utils.attachment_helpers import alatest_extraction, is_stale, queue_extraction
+from .utils.async_helpers import aget_object_or_404, alogin_required, asession_set
+from .utils.download_helpers import file_download
+from .utils.storage_helpers import BlobUploadHandler, store_upload
+from .utils.comment_helpers import COMMENTABLE_MODELS, COMMENTS_PAGE_SIZE, attach_comment_summaries, comment_page, comments_for_object
+from .utils.search_helpers import DOCUMENT_TYPES, SEARCH_PAGE_SIZE, search
+from .utils.membership_helpers import completion_percentage, live_assets, member_stats, skills_with_assets, teams_with_members, with_memberships
+from .utils.workload_helpers import asset_workload_now, asset_workload_for_period
+from .utils.task_helpers import project_tasks_stamp, stream_task_list_csv, task_list_queryset, task_list_page, task_list_row, TASK_LIST_ORDERING
 
 # Helper Functions
 
@@ -42,37 +62,50 @@ from .utils.project_helpers import calculate_rag_status
 # Home page view
 @login_required
 def home(request):
-    # Project counts for open and closed using integer IDs for statuses
-    projects_open = Project.objects.exclude(project_status=7).count()  # Open Projects (All projects except 'Closed' [7])
-    projects_onhold = Project.objects.filter(project_status=4).count()  # Projects with Status ID 4: 'On Hold'
-    projects_closed = Project.objects.filter(project_status=7).count()  # Projects with Status ID 7: 'Closed'
-    projects_total = Project.objects.count() # All Projects 
-
-    # Task counts for open, completed, and total tasks
-    tasks_total = Task.objects.count()
-    tasks_open = Task.objects.exclude(task_status=3).count()  # All tasks except 'Completed'
-    tasks_completed = Task.objects.filter(task_status=3).count()  # Status ID 3: 'Completed'
-    # Only count tasks that are 'Unassigned' and not completed
-    tasks_unassigned = Task.objects.filter(task_status=1).exclude(project__project_status=7).exclude(task_status=3).count()
-
-    # Asset and skill counts
-    assets_total = Asset.objects.count()
-    skills_total = Skill.objects.count()
-
-    context = {
-        'projects_total': projects_total,
-        'projects_open': projects_open,
-        'projects_onhold': projects_onhold,
-        'projects_closed': projects_closed,
-        'tasks_total': tasks_total,
-        'tasks_open': tasks_open,
-        'tasks_completed': tasks_completed,
-        'tasks_unassigned': tasks_unassigned,
-        'assets_total': assets_total,
-        'skills_total': skills_total,
-    }
+    # Project, task, asset and skill counts (cached, see dashboard_helpers)
+    context = get_dashboard_stats()
     return render(request, 'home.html', context)
 
+@login_required
+def dashboard_stats(request):
+    """Returns the home page figures as JSON so the dashboard can refresh them without reloading."""
+    return JsonResponse(get_dashboard_stats())
+
+@login_required
+@user_passes_test(lambda user: user.is_staff)
+def performance_summary(request):
+    """Returns the rolling query count and timing summary recorded by QueryBudgetMiddleware."""
+    return JsonResponse({'views': performance_stats.summary()})
+
+# Search
+def _run_search(request):
+    """ Searches for the request's `q`, limited to any `type`s given, returning the `page` asked for (20 results a page) """
+    query = request.GET.get('q', '').strip()
+    doc_types = [doc_type for doc_type in request.GET.getlist('type') if doc_type in DOCUMENT_TYPES]
+    try:
+        page = max(int(request.GET.get('page') or 1), 1)
+    except ValueError:
+        page = 1
+    found = search(query, doc_types, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+    found.update({'query': query, 'doc_types': doc_types, 'page': page})
+    return found
+
+@login_required
+def search_page(request):
+    found = _run_search(request)
+    # Every document type with its number of matches (and whether there are more than were counted), for switching between them
+    found['type_facets'] = [(doc_type, found['facets'].get(doc_type, 0), doc_type in found['capped']) for doc_type in DOCUMENT_TYPES]
+    found['total_capped'] = any(doc_type in found['capped'] for doc_type in (found['doc_types'] or DOCUMENT_TYPES))
+    return render(request, 'search.html', found)
+
+@login_required
+def search_data(request):
+    """ Returns a page of search results, with the matches of each document type, as JSON """
+    found = _run_search(request)
+    for result in found['results']:
+        result['snippet'] = str(result['snippet'])
+    return JsonResponse(found)
+
 # Project Views
 class ProjectCreateView(PermissionRequiredMixin,CreateView):
     permission_required = 'application.add_project'  # Only allow users with 'add_project' permission
@@ -87,35 +120,18 @@ class ProjectCreateView(PermissionRequiredMixin,CreateView):
         # Redirect to a different view or URL
         return redirect(reverse_lazy('all_projects'))  # Redirect to the project list view
 
-class ProjectUpdateView(PermissionRequiredMixin, UpdateView):
+class ProjectUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Project
     form_class = ProjectUpdateForm
     template_name = 'project_edit.html'  # Edit form template
     context_object_name = 'project'
     permission_required = 'application.change_project'  # Only allow users with 'change_project' permission
+    closed_message = "This project is closed and cannot be edited."
+    permission_denied_message = "You do not have permission to edit this project."
+    redirect_url_name = 'project_detail'
 
-    def get_object(self):
-        # Retrieve the project object using project_id instead of pk
-        project_id = self.kwargs.get('project_id')    
-        return get_object_or_404(Project, id=project_id)
-
-    def handle_no_permission(self):
-        # Retrieve the project ID from kwargs
-        project_id = self.kwargs.get('project_id')
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to edit this project.")
-        # Redirect to the project detail view
-        return redirect(reverse('project_detail', kwargs={'project_id': project_id}))  # Redirect to the project detail view
-
-    def dispatch(self, request, *args, **kwargs):
-        # Check if the project is closed
-        project = self.get_object()
-        if project.project_status == 7:  # Status ID 7 represents "Closed"
-            messages.error(request, "This project is closed and cannot be edited.")
-            return redirect(reverse_lazy('all_projects'))
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    def get_closed_url(self):
+        return reverse('all_projects')
 
     def form_valid(self, form):
         form.save()
@@ -128,19 +144,12 @@ class OnHoldProjectListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         # Filter projects with status 'On Hold' (4)
-        return Project.objects.filter(project_status=4).order_by('-last_updated_datetime')
+        projects = Project.objects.select_related('project_owner', 'rollup')
+        return projects.filter(project_status=4).order_by('-last_updated_datetime')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        projects = list(context['projects'])
-
-        for project in projects:
-            tasks = Task.objects.filter(project=project)
-            project.completed_tasks = tasks.filter(task_status=3).count()
-            project.incomplete_tasks = tasks.exclude(task_status=3).count()
-            project.rag_status = calculate_rag_status(project)
-
-        context['projects'] = projects
+        context['projects'] = attach_rollups(context['projects'])
         context['title'] = 'On Hold Projects'
         return context
 
@@ -153,15 +162,8 @@ class ProjectListView(LoginRequiredMixin, ListView):
         # Determine the type of projects based on the URL route name
         route_name = self.request.resolver_match.url_name
 
-        # Use annotate to create computed fields for sorting and displaying, rename them to avoid conflicts
-        projects = Project.objects.annotate(
-            annotated_start_date=Coalesce('actual_start_date', 'planned_start_date', output_field=DateField()),
-            annotated_end_date=Coalesce('actual_end_date', 'revised_target_end_date', 'original_target_end_date', output_field=DateField()),
-            total_tasks=Count('task'),
-            completed_tasks=Count('task', filter=Q(task__task_status=3))
-        ).annotate(
-            incomplete_tasks=F('total_tasks') - F('completed_tasks')
-        )
+        # Use annotate to create computed fields for sorting, rename them to avoid conflicts
+        projects = annotate_display_dates(Project.objects.select_related('project_owner', 'rollup'))
 
         # Filtering based on route
         if route_name == 'open_project_list':
@@ -174,9 +176,8 @@ class ProjectListView(LoginRequiredMixin, ListView):
             # Default to all projects
             projects = projects.filter(deleted=None).order_by('-priority', '-annotated_start_date')
 
-        # Adding additional attributes like RAG status
-        for project in projects:
-            project.rag_status = calculate_rag_status(project)
+        # Task figures come from the project rollups, with the RAG status worked out from them against today
+        projects = attach_rollups(projects)
 
         return projects
 
@@ -193,38 +194,30 @@ class ProjectListView(LoginRequiredMixin, ListView):
 
         return context
  
-class ProjectDetailView(LoginRequiredMixin, DetailView):
+class ProjectDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Project
     template_name = 'project_detail.html'  # Read-only detail view template
     context_object_name = 'project'
 
-    def get_object(self):
-        # Retrieve the project object using project_id instead of pk
-        project_id = self.kwargs.get('project_id')
-        return get_object_or_404(Project, id=project_id)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         project = self.object  # Get the project instance
 
-        # Check if all tasks for this project are completed
-        all_tasks = project.task_set.all()
-        completed_tasks_count = all_tasks.filter(task_status=3).count()  # Assuming status ID 3 means 'Completed'
-        total_tasks_count = all_tasks.count()
+        # Task figures and the RAG status come from the project rollup rather than counting the tasks again
+        attach_rollups([project])
+        completed_tasks_count = project.completed_tasks
+        total_tasks_count = project.total_tasks
 
         # Adjust logic to consider projects without tasks as "all tasks completed"
         all_tasks_completed = total_tasks_count == 0 or completed_tasks_count == total_tasks_count
 
-        # Use the helper function to determine the RAG status
-        rag_status = calculate_rag_status(project)
-
-        # Calculate percentage of tasks completed
-        percent_completed = round((completed_tasks_count / total_tasks_count) * 100, 2) if total_tasks_count > 0 else 100
+        rag_status = project.rag_status
+        percent_completed = project.percent_completed
 
         # Add context values for visualization
         context.update({
             'all_tasks_completed': all_tasks_completed,
-            'comments': Comment.objects.filter(content_type__model='project', object_id=project.pk),
+            'comments': comments_for_object(project),
             'display_start_date': project.display_start_date,
             'display_end_date': project.display_end_date,
             'total_tasks_count': total_tasks_count,
@@ -235,44 +228,29 @@ class ProjectDetailView(LoginRequiredMixin, DetailView):
 
         return context
 
-class ProjectCloseView(PermissionRequiredMixin, UpdateView):
+class ProjectCloseView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Project
     form_class = ProjectCloseForm
     template_name = 'project_close.html'
     permission_required = 'application.change_project'  # Only allow users with 'change_project' permission
+    closed_message = "This project is already closed."
+    permission_denied_message = "You do not have permission to close this project."
+    redirect_url_name = 'project_detail'
 
-    def get_object(self, queryset=None):
-        # Retrieve the project object using project_id instead of pk
-        project_id = self.kwargs.get('project_id')
-        return get_object_or_404(Project, id=project_id)
-
-    def handle_no_permission(self):
-        # Retrieve the project ID from kwargs
-        project_id = self.kwargs.get('project_id')
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to close this project.")
-        # Redirect to the project detail view
-        return redirect(reverse('project_detail', kwargs={'project_id': project_id}))  # Redirect to the project detail view
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = self.get_object()
-
+    def blocked_response(self):
         # Check if the project is already closed
-        if project.project_status == 7:  # Status ID 7 represents "Closed"
-            messages.error(request, "This project is already closed.")
-            return redirect('project_detail', project_id=project.id)
+        response = super().blocked_response()
+        if response is not None:
+            return response
 
         # Check if there are any incomplete tasks for this project
-        incomplete_tasks = project.task_set.filter(task_status__in=[1, 2])  # 1 = Unassigned, 2 = Assigned
+        incomplete_tasks = self.project.task_set.filter(task_status__in=[1, 2])  # 1 = Unassigned, 2 = Assigned
 
         if incomplete_tasks.exists():
             # Redirect back to project detail page with an error message if there are incomplete tasks
-            messages.error(request, "Project cannot be closed until all tasks are completed.")
-            return redirect('project_detail', project_id=project.id)
-
-        # Proceed with the regular dispatch if all tasks are completed
-        return super().dispatch(request, *args, **kwargs)
+            messages.error(self.request, "Project cannot be closed until all tasks are completed.")
+            return redirect('project_detail', project_id=self.project.id)
+        return None
 
     def form_valid(self, form):
         # Update project status to closed
@@ -285,30 +263,18 @@ class ProjectCloseView(PermissionRequiredMixin, UpdateView):
         return reverse('project_detail', kwargs={'project_id': self.object.pk})
 
 # Task Views
-class TaskCreateView(PermissionRequiredMixin, CreateView):
+class TaskCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Task
     form_class = CreateTaskForm
     template_name = 'project_task_create.html'
     permission_required = 'application.add_task'
-
-    def handle_no_permission(self):
-        messages.error(self.request, "You do not have permission to create a new task.")
-        return redirect('project_taskview', project_id=self.kwargs['project_id'])
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new tasks cannot be added.")
-            return redirect('project_taskview', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    closed_message = "This project is closed and new tasks cannot be added."
+    permission_denied_message = "You do not have permission to create a new task."
+    redirect_url_name = 'project_taskview'
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
+        kwargs['project'] = self.project
         return kwargs
 
     def get_form(self, *args, **kwargs):
@@ -335,15 +301,14 @@ class TaskCreateView(PermissionRequiredMixin, CreateView):
         return initial
 
     def form_valid(self, form):
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         return super().form_valid(form)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        project = self.project
 
         # Pass project start and end dates to the context directly
-        context['project'] = project
         context['project_start_date'] = project.display_start_date
         context['project_end_date'] = project.display_end_date
 
@@ -352,53 +317,43 @@ class TaskCreateView(PermissionRequiredMixin, CreateView):
     def get_success_url(self):
         return reverse('project_taskview', kwargs={'project_id': self.kwargs['project_id']})
 
-class TaskUpdateView(PermissionRequiredMixin, UpdateView):
+class TaskUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Task
     form_class = EditTaskForm
     template_name = 'project_task_edit.html'
     permission_required = 'application.change_task'
+    object_url_kwarg = 'task_id'
+    object_select_related = ('assigned_to',)
+    closed_message = "This project is closed and its tasks cannot be edited."
+    permission_denied_message = "You do not have permission to edit this task."
 
-    def handle_no_permission(self):
-        messages.error(self.request, "You do not have permission to edit this task.")
-        return redirect('task_detail', project_id=self.kwargs['project_id'], task_id=self.kwargs['task_id'])
+    def get_permission_denied_url(self):
+        return reverse('task_detail', kwargs={'project_id': self.kwargs['project_id'], 'task_id': self.kwargs['task_id']})
 
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        task_id = self.kwargs.get('task_id')
-        return get_object_or_404(Task, id=task_id, project_id=project_id)
+    def get_closed_url(self):
+        return self.get_permission_denied_url()
 
-    def dispatch(self, request, *args, **kwargs):
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        task = self.get_object()
-
-        if project.project_status == 7:  # Closed
-            messages.error(request, "This project is closed and its tasks cannot be edited.")
-            return redirect('task_detail', project_id=project.id, task_id=task.id)
-
-        if task.task_status == 3:  # Completed
-            messages.error(request, "This task is completed and cannot be edited.")
-            return redirect('task_detail', project_id=project.id, task_id=task.id)
-
-        if request.method == 'GET':
-            selected_skills = task.skills_required.values_list('pk', flat=True)
-            if selected_skills:
-                assets = Asset.objects.all()
-                for skill_id in selected_skills:
-                    assets = assets.filter(skills__pk=skill_id)
-                filtered_assets_ids = list(assets.values_list('asset_id', flat=True).distinct())
-                request.session['filtered_assets'] = filtered_assets_ids
-            else:
-                request.session['filtered_assets'] = []
+    def blocked_response(self):
+        response = super().blocked_response()
+        if response is None and self.scoped_object.task_status == 3:  # Completed
+            messages.error(self.request, "This task is completed and cannot be edited.")
+            response = redirect(self.get_permission_denied_url())
+        return response
 
-        return super().dispatch(request, *args, **kwargs)
+    def get(self, request, *args, **kwargs):
+        selected_skills = list(self.scoped_object.skills_required.values_list('pk', flat=True))
+        if selected_skills:
+            request.session['filtered_assets'] = get_skill_index().having_all(selected_skills)
+        else:
+            request.session['filtered_assets'] = []
+        return super().get(request, *args, **kwargs)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
+        kwargs['project'] = self.project
 
         filtered_assets = self.request.session.get('filtered_assets', None)
-        task = self.get_object()
-        current_asset = task.assigned_to
+        current_asset = self.object.assigned_to
 
         if filtered_assets:
             assets_queryset = Asset.objects.filter(asset_id__in=filtered_assets)
@@ -415,19 +370,18 @@ class TaskUpdateView(PermissionRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Determine the relevant end date to use for the project
-        project_end_date = project.actual_end_date or project.revised_target_end_date or project.original_target_end_date
+        project = self.project
 
         # Add project information to the context
-        context['project'] = project
         context['project_start_date'] = project.display_start_date  # Use display dates to make it more accurate
         context['project_end_date'] = project.display_end_date
 
-        # Adding dependency information for highlighting conflicts
-        task = self.get_object()
-        parent_tasks = Task.objects.filter(prereq_task=task)
+        # The whole prerequisite chain in one query - the direct dependents are used for highlighting conflicts
+        task = self.object
+        chain = list(Task.objects.filter(pk=task.pk).dependency_chain())
+        context['blocked_by'] = [chain_task for chain_task in chain if chain_task.chain_depth < 0]
+        context['blocking'] = [chain_task for chain_task in chain if chain_task.chain_depth > 0]
+        parent_tasks = [chain_task for chain_task in chain if chain_task.chain_depth == 1]
 
         # Create a simpler JSON structure manually
         parent_tasks_data = [
@@ -436,16 +390,26 @@ class TaskUpdateView(PermissionRequiredMixin, UpdateView):
                 'display_start_date': dep_task.display_start_date.strftime('%Y-%m-%d'),
                 'display_end_date': dep_task.display_end_date.strftime('%Y-%m-%d'),
                 'id': dep_task.id,
-                'project_id': dep_task.project.id,
+                'project_id': dep_task.project_id,
             }
             for dep_task in parent_tasks
         ]
         context['parent_tasks_json'] = json.dumps(parent_tasks_data)
 
+        # Earliest/latest dates and slack from the project's schedule
+        schedule, path = project_schedule(project.pk)
+        context['schedule'] = schedule.get(task.pk)
+        context['critical_path_length'] = len(path)
+
         return context
 
     def form_valid(self, form):
         response = super().form_valid(form)
+        # Push back any downstream tasks that would now start before this one ends
+        if 'planned_end_date' in form.changed_data or 'actual_end_date' in form.changed_data:
+            moved = propagate_date_shift(self.object)
+            if moved:
+                messages.info(self.request, f"{len(moved)} dependent task(s) were rescheduled to start after this task ends.")
         if 'filtered_assets' in self.request.session:
             del self.request.session['filtered_assets']
         return response
@@ -461,51 +425,10 @@ class TaskListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         route_name = self.request.resolver_match.url_name
 
-        # Determine the appropriate queryset based on the route name
-        if route_name == 'open_task_list':
-            tasks = Task.objects.filter(task_status__in=[1, 2])
-        elif route_name == 'completed_task_list':
-            tasks = Task.objects.filter(task_status=3)
-        elif route_name == 'unassigned_tasks':
-            tasks = Task.objects.filter(task_status=1)
-        elif 'project_id' in self.kwargs:
-            project_id = self.kwargs.get('project_id')
-            tasks = Task.objects.filter(project_id=project_id)
-        else:
-            tasks = Task.objects.all()
-
-        # Annotate each task to check if there is a conflict in terms of dependency or prerequisites
-        tasks = tasks.annotate(
-            can_be_completed=Case(
-                When(prereq_task__task_status=3, then=True),  # Completed prerequisite task
-                When(prereq_task__isnull=True, then=True),    # No prerequisite task
-                default=False,
-                output_field=BooleanField()
-            ),
-            conflict_flag=Case(
-                # Conflict if prerequisite task ends after current task's planned start date
-                When(
-                    prereq_task__isnull=False,
-                    prereq_task__planned_end_date__isnull=False,
-                    planned_start_date__lt=F('prereq_task__planned_end_date'),
-                    then=True
-                ),
-                # Conflict if dependent task starts before current task ends
-                When(
-                    pk__in=Task.objects.filter(prereq_task__isnull=False)
-                    .values_list('prereq_task_id', flat=True),
-                    planned_end_date__isnull=False,
-                    planned_end_date__gt=Subquery(
-                        Task.objects.filter(prereq_task=OuterRef('pk')).values('planned_start_date')[:1]
-                    ),
-                    then=True
-                ),
-                default=False,
-                output_field=BooleanField()
-            )
-        )
+        # Determine the appropriate queryset based on the route name, annotated with can_be_completed and conflict_flag
+        tasks = task_list_queryset(route_name, self.kwargs.get('project_id'))
 
-        return tasks.order_by('-project__priority', '-priority', 'planned_start_date')
+        return tasks.order_by(*TASK_LIST_ORDERING)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -525,71 +448,104 @@ class TaskListView(LoginRequiredMixin, ListView):
         else:
             context['title'] = "All Tasks"
 
+        # The table rows are loaded page by page from task_list_data
+        if 'project_id' in self.kwargs:
+            query = urlencode({'project_id': self.kwargs['project_id']})
+        else:
+            query = urlencode({'list': route_name})
+        context['task_data_url'] = f"{reverse('task_list_data')}?{query}"
+        context['task_export_url'] = f"{reverse('task_list_export')}?{query}"
+
         return context
 
-class TaskDetailView(LoginRequiredMixin, DetailView):
+def _requested_task_list(request):
+    """ The tasks for the task list a data or export request names, or None if its project id is invalid """
+    project_id = request.GET.get('project_id')
+    if project_id is not None and not project_id.isdigit():
+        return None
+    return task_list_queryset(request.GET.get('list'), int(project_id) if project_id else None)
+
+@login_required
+def task_list_data(request):
+    """Server-side processing endpoint for the task list DataTable (paging, ordering and searching)."""
+    tasks = _requested_task_list(request)
+    if tasks is None:
+        return JsonResponse({'error': 'Invalid project'}, status=400)
+    params = parse_datatables_request(request.GET)
+    records_filtered, page, next_cursor = task_list_page(tasks, params)
+
+    return JsonResponse({
+        'draw': params['draw'],
+        'recordsTotal': tasks.count(),
+        'recordsFiltered': records_filtered,
+        'data': [task_list_row(task) for task in page],
+        'cursor': next_cursor,
+    })
+
+@login_required
+def task_list_export(request):
+    """Streams every task matching the task list table's searches and ordering as CSV, not just the page shown."""
+    tasks = _requested_task_list(request)
+    if tasks is None:
+        return JsonResponse({'error': 'Invalid project'}, status=400)
+    response = StreamingHttpResponse(stream_task_list_csv(tasks, parse_datatables_request(request.GET)), content_type='text/csv')
+    response['Content-Disposition'] = content_disposition_header(True, 'tasks.csv')
+    return response
+
+class TaskDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Task
     template_name = 'project_task_detail.html'
     context_object_name = 'task'
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        task_id = self.kwargs.get('task_id')
-        return get_object_or_404(Task, id=task_id, project_id=project_id)
+    object_url_kwarg = 'task_id'
+    object_select_related = ('assigned_to', 'prereq_task')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Retrieve the project instance to include in the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Get the ContentType instance for the Task model
-        task_content_type = ContentType.objects.get_for_model(Task)
 
-        # Filter comments by the content_type and object_id (task id)
-        comments = Comment.objects.filter(content_type=task_content_type, object_id=self.object.pk)
+        # The comments on this object with their users, in one query
+        comments = comments_for_object(self.object)
 
-        # Add project and comments to the context
-        context['project'] = project
+        # Everything this task is blocked by and blocking, all the way along the chain, in one query
+        chain = list(Task.objects.filter(pk=self.object.pk).dependency_chain())
+
+        # Add comments to the context
         context['comments'] = comments
+        context['blocked_by'] = [task for task in chain if task.chain_depth < 0]
+        context['blocking'] = [task for task in chain if task.chain_depth > 0]
         return context
 
-class TaskCompleteView(PermissionRequiredMixin, UpdateView):
+class TaskCompleteView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Task
     form_class = TaskCompleteForm
     template_name = 'project_task_complete.html'
     permission_required = 'application.change_task'
+    object_url_kwarg = 'task_id'
+    object_select_related = ('prereq_task',)
+    closed_message = "This project is closed and tasks cannot be completed."
+    permission_denied_message = "You do not have permission to complete this task."
+    redirect_url_name = 'project_taskview'
 
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project and task objects
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        task = get_object_or_404(Task, id=self.kwargs['task_id'], project_id=project.id)
+    def get_closed_url(self):
+        return reverse('task_detail', kwargs={'project_id': self.kwargs['project_id'], 'task_id': self.kwargs['task_id']})
+
+    def blocked_response(self):
+        task = self.scoped_object
 
         # Check if the task is already completed
         if task.task_status == 3:  # Status ID 3 is 'Completed'
-            messages.error(request, "This task has already been completed.")
-            return redirect('task_detail', project_id=project.id, task_id=task.id)
+            messages.error(self.request, "This task has already been completed.")
+            return redirect(self.get_closed_url())
 
         # Check if the project is closed
-        if project.project_status == 7:  # Status ID 7 is 'Closed'
-            messages.error(request, "This project is closed and tasks cannot be completed.")
-            return redirect('task_detail', project_id=project.id, task_id=task.id)
+        response = super().blocked_response()
+        if response is not None:
+            return response
 
         # Check if the task has dependencies that are not complete
         if task.prereq_task and task.prereq_task.task_status != 3:  # Status ID 3 is 'Completed'
-            messages.error(request, "This task has dependencies that are not yet completed.")
-            return redirect('task_detail', project_id=project.id, task_id=task.id)
-
-        # Proceed with the regular dispatch if all conditions are met
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        task_id = self.kwargs.get('task_id')
-        return get_object_or_404(Task, id=task_id, project_id=project_id)
-
-    def handle_no_permission(self):
-        messages.error(self.request, "You do not have permission to complete this task.")
-        return redirect('project_taskview', project_id=self.kwargs['project_id'])
+            messages.error(self.request, "This task has dependencies that are not yet completed.")
+            return redirect(self.get_closed_url())
+        return None
 
     def form_valid(self, form):
         task = form.save(commit=False)
@@ -597,20 +553,13 @@ class TaskCompleteView(PermissionRequiredMixin, UpdateView):
         task.save()
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Fetch the project and add it to the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        context['project'] = project
-        return context
-
     def get_success_url(self):
         return reverse('task_detail', kwargs={'project_id': self.kwargs['project_id'], 'task_id': self.kwargs['task_id']})
 
 
 # Views for listing Risks, Assumptions, Issues, and Dependencies
 
-class RiskListView(LoginRequiredMixin, ListView):
+class RiskListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Risk
     template_name = 'project_risks_list.html'
     context_object_name = 'risks'  # Updated context name to refer to the risks list
@@ -618,15 +567,15 @@ class RiskListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Get tasks related to the project using project_id
         project_id = self.kwargs.get('project_id')
-        return Risk.objects.filter(project_id=project_id)
+        return Risk.objects.filter(project_id=project_id).select_related('created_by')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add the project and its associated risks to the context
-        context['project'] = get_object_or_404(Project, id=self.kwargs.get('project_id'))
+        # The project is added by ProjectScopedMixin
+        context['risks'] = attach_comment_summaries(context['risks'])  # Comment counts and newest comments for every row in two queries
         return context
     
-class AssumptionListView(LoginRequiredMixin, ListView):
+class AssumptionListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Assumption
     template_name = 'project_assumptions_list.html'
     context_object_name = 'assumptions'  # Updated context name to refer to the assumption list
@@ -634,15 +583,15 @@ class AssumptionListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Get tasks related to the project using project_id
         project_id = self.kwargs.get('project_id')
-        return Assumption.objects.filter(project_id=project_id)
+        return Assumption.objects.filter(project_id=project_id).select_related('created_by')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add the project and its associated risks to the context
-        context['project'] = get_object_or_404(Project, id=self.kwargs.get('project_id'))
+        # The project is added by ProjectScopedMixin
+        context['assumptions'] = attach_comment_summaries(context['assumptions'])  # Comment counts and newest comments for every row in two queries
         return context
 
-class IssueListView(LoginRequiredMixin, ListView):
+class IssueListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Issue
     template_name = 'project_issues_list.html'
     context_object_name = 'issues'  # Updated context name to refer to the issues list
@@ -650,15 +599,15 @@ class IssueListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Get tasks related to the project using project_id
         project_id = self.kwargs.get('project_id')
-        return Issue.objects.filter(project_id=project_id)
+        return Issue.objects.filter(project_id=project_id).select_related('created_by')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add the project and its associated risks to the context
-        context['project'] = get_object_or_404(Project, id=self.kwargs.get('project_id'))
+        # The project is added by ProjectScopedMixin
+        context['issues'] = attach_comment_summaries(context['issues'])  # Comment counts and newest comments for every row in two queries
         return context
 
-class DependencyListView(LoginRequiredMixin, ListView):
+class DependencyListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Dependency
     template_name = 'project_dependencies_list.html'
     context_object_name = 'dependencies'  # Updated context name to refer to the dependencies list
@@ -666,15 +615,15 @@ class DependencyListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Get tasks related to the project using project_id
         project_id = self.kwargs.get('project_id')
-        return Dependency.objects.filter(project_id=project_id)
+        return Dependency.objects.filter(project_id=project_id).select_related('created_by')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Add the project and its associated risks to the context
-        context['project'] = get_object_or_404(Project, id=self.kwargs.get('project_id'))
+        # The project is added by ProjectScopedMixin
+        context['dependencies'] = attach_comment_summaries(context['dependencies'])  # Comment counts and newest comments for every row in two queries
         return context
     
-class StakeholderListView(LoginRequiredMixin, ListView):
+class StakeholderListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Stakeholder
     template_name = 'project_stakeholders_list.html'
     context_object_name = 'stakeholders'
@@ -682,23 +631,18 @@ class StakeholderListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Get stakeholders related to the project using project_id
         project_id = self.kwargs.get('project_id')
-        return Stakeholder.objects.filter(project_id=project_id)
+        return Stakeholder.objects.filter(project_id=project_id).select_related('created_by')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project_id = self.kwargs.get('project_id')
-        
-        # Fetch the project object using the project_id
-        project = get_object_or_404(Project, id=project_id)
-        
-        # Get all stakeholders related to the project
-        stakeholders = Stakeholder.objects.filter(project_id=project.id)
+
+        # Stakeholders related to the project, from get_queryset
+        stakeholders = self.object_list
 
         # Collect emails from stakeholders who have a non-empty email field
         stakeholder_emails = [stakeholder.email for stakeholder in stakeholders if stakeholder.email]
 
-        # Add project, stakeholders, and email list to the context
-        context['project'] = project
+        # Add stakeholders and the email list to the context
         context['stakeholders'] = stakeholders
         context['stakeholder_emails'] = stakeholder_emails  # Pass the list of emails
         return context
@@ -706,232 +650,113 @@ class StakeholderListView(LoginRequiredMixin, ListView):
 
 # Create views for adding new entries
 
-class RiskCreateView(PermissionRequiredMixin, CreateView):
+class RiskCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Risk
     form_class = RiskForm
     template_name = 'project_risk_add.html'
     permission_required = 'application.add_risk'  # Only allow users with 'add_risk' permission
-
-    def handle_no_permission(self):
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to create a risk.")
-        # Redirect to the project risk list view
-        return redirect('risk_list', project_id=self.kwargs['project_id'])
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new risks cannot be added.")
-            return redirect('risk_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    closed_message = "This project is closed and new risks cannot be added."
+    permission_denied_message = "You do not have permission to create a risk."
+    redirect_url_name = 'risk_list'
 
     def form_valid(self, form):
         # Assign the project instance to the risk instance before saving
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         form.instance.created_by = self.request.user  # Set the user who created this entry
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         # Redirect back to the project risk list view upon successful form submission
         return reverse_lazy('risk_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class AssumptionCreateView(PermissionRequiredMixin, CreateView):
+class AssumptionCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Assumption
     form_class = AssumptionForm
     template_name = 'project_assumption_add.html'
     permission_required = 'application.add_assumption'  # Only allow users with 'add_assumption' permission
-
-    def handle_no_permission(self):
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to create an assumption.")
-        # Redirect to the project risk list view
-        return redirect('assumption_list', project_id=self.kwargs['project_id'])
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new assumptions cannot be added.")
-            return redirect('assumption_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    closed_message = "This project is closed and new assumptions cannot be added."
+    permission_denied_message = "You do not have permission to create an assumption."
+    redirect_url_name = 'assumption_list'
 
     def form_valid(self, form):
         # Assign the project instance to the assumption instance before saving
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         form.instance.created_by = self.request.user  # Set the user who created this entry
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         # Redirect back to the project assumption list view upon successful form submission
         return reverse_lazy('assumption_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class IssueCreateView(PermissionRequiredMixin, CreateView):
+class IssueCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Issue
     form_class = IssueForm
     template_name = 'project_issue_add.html'
     permission_required = 'application.add_issue'  # Only allow users with 'add_issue' permission
+    closed_message = "This project is closed and new issues cannot be added."
+    permission_denied_message = "You do not have permission to create an issue."
+    redirect_url_name = 'issue_list'
     
-    def handle_no_permission(self):
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to create an issue.")
-        # Redirect to the project risk list view
-        return redirect('issue_list', project_id=self.kwargs['project_id'])
-    
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new issues cannot be added.")
-            return redirect('issue_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         form.instance.created_by = self.request.user
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('issue_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class DependencyCreateView(PermissionRequiredMixin, CreateView):
+class DependencyCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Dependency
     form_class = DependencyForm
     template_name = 'project_dependency_add.html'
     permission_required = 'application.add_dependency'  # Only allow users with 'add_dependency' permission
-
-    def handle_no_permission(self):
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to create a dependency.")
-        # Redirect to the project risk list view
-        return redirect('dependency_list', project_id=self.kwargs['project_id'])
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new dependencies cannot be added.")
-            return redirect('dependency_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    closed_message = "This project is closed and new dependencies cannot be added."
+    permission_denied_message = "You do not have permission to create a dependency."
+    redirect_url_name = 'dependency_list'
 
     def form_valid(self, form):
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         form.instance.created_by = self.request.user
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('dependency_list', kwargs={'project_id': self.kwargs['project_id']})
     
-class StakeholderCreateView(PermissionRequiredMixin, CreateView):
+class StakeholderCreateView(ProjectScopedMixin, PermissionRequiredMixin, CreateView):
     model = Stakeholder
     form_class = StakeholderForm
     template_name = 'project_stakeholder_add.html'
     permission_required = 'application.add_stakeholder'  # Only allow users with 'add_stakeholder' permission
-
-    def handle_no_permission(self):
-        # Add a custom error message
-        messages.error(self.request, "You do not have permission to create a stakeholder.")
-        # Redirect to the project risk list view
-        return redirect('stakeholder_list', project_id=self.kwargs['project_id'])
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and new stakeholders cannot be added.")
-            return redirect('stakeholder_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
+    closed_message = "This project is closed and new stakeholders cannot be added."
+    permission_denied_message = "You do not have permission to create a stakeholder."
+    redirect_url_name = 'stakeholder_list'
 
     def form_valid(self, form):
-        form.instance.project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        form.instance.project = self.project
         form.instance.created_by = self.request.user
         return super().form_valid(form)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('stakeholder_list', kwargs={'project_id': self.kwargs['project_id']})
 
 
 # Update views for editing existing entries
 
-class RiskUpdateView(PermissionRequiredMixin, UpdateView):
+class RiskUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Risk
     form_class = RiskForm
     template_name = 'project_risk_add.html'
     context_object_name = 'risk'
     permission_required = 'application.change_risk'  # Only allow users with 'change_risk' permission
+    object_url_kwarg = 'risk_id'
+    closed_message = "This project is closed and risks cannot be edited."
+    permission_denied_message = "You do not have permission to edit this risk."
+    redirect_url_name = 'risk_list'
+    login_if_anonymous = True
 
-    def handle_no_permission(self):
-        if not self.request.user.is_authenticated:
-            # Let PermissionRequiredMixin handle the redirection to login
-            return super().handle_no_permission()
-        else:
-            # User is authenticated but lacks permission
-            project_id = self.kwargs.get('project_id')
-            messages.error(self.request, "You do not have permission to edit this risk.")
-            return redirect('risk_list', project_id=project_id)
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and risks cannot be edited.")
-            return redirect('risk_detail', project_id=project.id, risk_id=self.kwargs['risk_id'])
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
-    
-    def get_object(self):
-        # Use project_id and risk_id to get the risk object
-        project_id = self.kwargs.get('project_id')
-        risk_id = self.kwargs.get('risk_id')
-        return get_object_or_404(Risk, id=risk_id, project_id=project_id)
+    def get_closed_url(self):
+        return reverse('risk_detail', kwargs={'project_id': self.kwargs['project_id'], 'risk_id': self.kwargs['risk_id']})
 
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
@@ -939,48 +764,23 @@ class RiskUpdateView(PermissionRequiredMixin, UpdateView):
         messages.success(self.request, "Risk has been successfully updated.")
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse('risk_detail', kwargs={'project_id': self.kwargs['project_id'], 'risk_id': self.object.pk})
 
-class AssumptionUpdateView(PermissionRequiredMixin, UpdateView):
+class AssumptionUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Assumption
     form_class = AssumptionForm
     template_name = 'project_assumption_add.html'  # Reusing the existing template
     context_object_name = 'assumption'
     permission_required = 'application.change_assumption'  # Only allow users with 'change_assumption' permission
+    object_url_kwarg = 'assumption_id'
+    closed_message = "This project is closed and assumptions cannot be edited."
+    permission_denied_message = "You do not have permission to edit this assumption."
+    redirect_url_name = 'assumption_list'
+    login_if_anonymous = True
 
-    def handle_no_permission(self):
-        if not self.request.user.is_authenticated:
-            # Let PermissionRequiredMixin handle the redirection to login
-            return super().handle_no_permission()
-        else:
-            # User is authenticated but lacks permission
-            project_id = self.kwargs.get('project_id')
-            messages.error(self.request, "You do not have permission to edit this assumption.")
-            return redirect('assumption_list', project_id=project_id)
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and assumptions cannot be edited.")
-            return redirect('assumption_detail', project_id=project.id, assumption_id=self.kwargs['assumption_id'])
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self):
-        # Use project_id and risk_id to get the risk object
-        project_id = self.kwargs.get('project_id')
-        assumption_id = self.kwargs.get('assumption_id')
-        return get_object_or_404(Assumption, id=assumption_id, project_id=project_id)
+    def get_closed_url(self):
+        return reverse('assumption_detail', kwargs={'project_id': self.kwargs['project_id'], 'assumption_id': self.kwargs['assumption_id']})
 
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
@@ -988,48 +788,23 @@ class AssumptionUpdateView(PermissionRequiredMixin, UpdateView):
         messages.success(self.request, "Assumption has been successfully updated.")
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('assumption_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class IssueUpdateView(PermissionRequiredMixin, UpdateView):
+class IssueUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Issue
     form_class = IssueForm
     template_name = 'project_issue_add.html'
     context_object_name = 'issue'
     permission_required = 'application.change_issue'  # Only allow users with 'change_issue' permission
+    object_url_kwarg = 'issue_id'
+    closed_message = "This project is closed and issues cannot be edited."
+    permission_denied_message = "You do not have permission to edit this issue."
+    redirect_url_name = 'issue_list'
+    login_if_anonymous = True
 
-    def handle_no_permission(self):
-        if not self.request.user.is_authenticated:
-            # Let PermissionRequiredMixin handle the redirection to login
-            return super().handle_no_permission()
-        else:
-            # User is authenticated but lacks permission
-            project_id = self.kwargs.get('project_id')
-            messages.error(self.request, "You do not have permission to edit this issue.")
-            return redirect('issue_list', project_id=project_id)
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and issues cannot be edited.")
-            return redirect('issue_detail', project_id=project.id, issue_id=self.kwargs['issue_id'])
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self):
-        # Use project_id and risk_id to get the risk object
-        project_id = self.kwargs.get('project_id')
-        issue_id = self.kwargs.get('issue_id')
-        return get_object_or_404(Issue, id=issue_id, project_id=project_id)
+    def get_closed_url(self):
+        return reverse('issue_detail', kwargs={'project_id': self.kwargs['project_id'], 'issue_id': self.kwargs['issue_id']})
 
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
@@ -1037,11 +812,6 @@ class IssueUpdateView(PermissionRequiredMixin, UpdateView):
         messages.success(self.request, "Issue has been successfully updated.")
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
         response = super().form_valid(form)
@@ -1051,40 +821,20 @@ class IssueUpdateView(PermissionRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse_lazy('issue_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class DependencyUpdateView(PermissionRequiredMixin, UpdateView):
+class DependencyUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Dependency
     form_class = DependencyForm
     template_name = 'project_dependency_add.html'
     context_object_name = 'dependency'
     permission_required = 'application.change_dependency'  # Only allow users with 'change_dependency' permission
+    object_url_kwarg = 'dependency_id'
+    closed_message = "This project is closed and dependencies cannot be edited."
+    permission_denied_message = "You do not have permission to edit this dependency."
+    redirect_url_name = 'dependency_list'
+    login_if_anonymous = True
 
-    def handle_no_permission(self):
-        if not self.request.user.is_authenticated:
-            # Let PermissionRequiredMixin handle the redirection to login
-            return super().handle_no_permission()
-        else:
-            # User is authenticated but lacks permission
-            project_id = self.kwargs.get('project_id')
-            messages.error(self.request, "You do not have permission to edit this dependency.")
-            return redirect('dependency_list', project_id=project_id)
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and dependencies cannot be edited.")
-            return redirect('dependency_detail', project_id=project.id, dependency_id=self.kwargs['dependency_id'])
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self):
-        # Use project_id and risk_id to get the risk object
-        project_id = self.kwargs.get('project_id')
-        dependency_id = self.kwargs.get('dependency_id')
-        return get_object_or_404(Dependency, id=dependency_id, project_id=project_id)
+    def get_closed_url(self):
+        return reverse('dependency_detail', kwargs={'project_id': self.kwargs['project_id'], 'dependency_id': self.kwargs['dependency_id']})
 
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
@@ -1092,48 +842,20 @@ class DependencyUpdateView(PermissionRequiredMixin, UpdateView):
         messages.success(self.request, "Dependency has been successfully updated.")
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('dependency_list', kwargs={'project_id': self.kwargs['project_id']})
 
-class StakeholderUpdateView(PermissionRequiredMixin, UpdateView):
+class StakeholderUpdateView(ProjectScopedMixin, PermissionRequiredMixin, UpdateView):
     model = Stakeholder
     form_class = StakeholderForm
     template_name = 'project_stakeholder_add.html'
     context_object_name = 'stakeholder'
     permission_required = 'application.change_stakeholder'  # Only allow users with 'change_stakeholder' permission
-
-    def handle_no_permission(self):
-        if not self.request.user.is_authenticated:
-            # Let PermissionRequiredMixin handle the redirection to login
-            return super().handle_no_permission()
-        else:
-            # User is authenticated but lacks permission
-            project_id = self.kwargs.get('project_id')
-            messages.error(self.request, "You do not have permission to edit this stakeholder.")
-            return redirect('stakeholder_list', project_id=project_id)
-
-    def dispatch(self, request, *args, **kwargs):
-        # Get the project object
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-
-        # Check if the project is closed
-        if project.project_status == 7:
-            messages.error(request, "This project is closed and stakeholders cannot be edited.")
-            return redirect('stakeholder_list', project_id=project.id)
-
-        # Proceed with the regular dispatch if the project is not closed
-        return super().dispatch(request, *args, **kwargs)
-    
-    def get_object(self):
-        # Use project_id and risk_id to get the risk object
-        project_id = self.kwargs.get('project_id')
-        stakeholder_id = self.kwargs.get('stakeholder_id')
-        return get_object_or_404(Stakeholder, id=stakeholder_id, project_id=project_id)
+    object_url_kwarg = 'stakeholder_id'
+    closed_message = "This project is closed and stakeholders cannot be edited."
+    permission_denied_message = "You do not have permission to edit this stakeholder."
+    redirect_url_name = 'stakeholder_list'
+    login_if_anonymous = True
 
     def form_valid(self, form):
         # Save the form and perform any additional logic if necessary
@@ -1141,119 +863,66 @@ class StakeholderUpdateView(PermissionRequiredMixin, UpdateView):
         messages.success(self.request, "Stakeholder has been successfully updated.")
         return response
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
-        return context
-
     def get_success_url(self):
         return reverse_lazy('stakeholder_list', kwargs={'project_id': self.kwargs['project_id']})
 
 
 # Detail Views
 
-class RiskDetailView(LoginRequiredMixin, DetailView):
+class RiskDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Risk
     template_name = 'project_risk_detail.html'
     context_object_name = 'risk'
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        risk_id = self.kwargs.get('risk_id')
-        return get_object_or_404(Risk, id=risk_id, project_id=project_id)
+    object_url_kwarg = 'risk_id'
+    object_select_related = ('created_by',)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Retrieve the project instance to include in the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Get the ContentType instance for the Task model
-        task_content_type = ContentType.objects.get_for_model(Risk)
-
-        # Filter comments by the content_type and object_id (task id)
-        comments = Comment.objects.filter(content_type=task_content_type, object_id=self.object.pk)
 
-        # Add project and comments to the context
-        context['project'] = project
-        context['comments'] = comments
+        # The comments on this object with their users, in one query
+        context['comments'] = comments_for_object(self.object)
         return context
 
-class AssumptionDetailView(LoginRequiredMixin, DetailView):
+class AssumptionDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Assumption
     template_name = 'project_assumption_detail.html'
     context_object_name = 'assumption'
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        assumption_id = self.kwargs.get('assumption_id')
-        return get_object_or_404(Assumption, id=assumption_id, project_id=project_id)
+    object_url_kwarg = 'assumption_id'
+    object_select_related = ('created_by',)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Retrieve the project instance to include in the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Get the ContentType instance for the Task model
-        task_content_type = ContentType.objects.get_for_model(Assumption)
-
-        # Filter comments by the content_type and object_id (task id)
-        comments = Comment.objects.filter(content_type=task_content_type, object_id=self.object.pk)
 
-        # Add project and comments to the context
-        context['project'] = project
-        context['comments'] = comments
+        # The comments on this object with their users, in one query
+        context['comments'] = comments_for_object(self.object)
         return context
 
-class IssueDetailView(LoginRequiredMixin, DetailView):
+class IssueDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Issue
     template_name = 'project_issue_detail.html'
     context_object_name = 'issue'
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        issue_id = self.kwargs.get('issue_id')
-        return get_object_or_404(Issue, id=issue_id, project_id=project_id)
+    object_url_kwarg = 'issue_id'
+    object_select_related = ('created_by',)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Retrieve the project instance to include in the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Get the ContentType instance for the Task model
-        task_content_type = ContentType.objects.get_for_model(Issue)
-
-        # Filter comments by the content_type and object_id (task id)
-        comments = Comment.objects.filter(content_type=task_content_type, object_id=self.object.pk)
 
-        # Add project and comments to the context
-        context['project'] = project
-        context['comments'] = comments
+        # The comments on this object with their users, in one query
+        context['comments'] = comments_for_object(self.object)
         return context
 
-class DependencyDetailView(LoginRequiredMixin, DetailView):
+class DependencyDetailView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Dependency
     template_name = 'project_dependency_detail.html'
     context_object_name = 'dependency'
-
-    def get_object(self):
-        project_id = self.kwargs.get('project_id')
-        dependency_id = self.kwargs.get('dependency_id')
-        return get_object_or_404(Dependency, id=dependency_id, project_id=project_id)
+    object_url_kwarg = 'dependency_id'
+    object_select_related = ('created_by',)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Retrieve the project instance to include in the context
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        
-        # Get the ContentType instance for the Task model
-        task_content_type = ContentType.objects.get_for_model(Dependency)
-
-        # Filter comments by the content_type and object_id (task id)
-        comments = Comment.objects.filter(content_type=task_content_type, object_id=self.object.pk)
 
-        # Add project and comments to the context
-        context['project'] = project
-        context['comments'] = comments
+        # The comments on this object with their users, in one query
+        context['comments'] = comments_for_object(self.object)
         return context
 
 @login_required    
@@ -1261,112 +930,54 @@ def project_calendar(request):
     """Renders the calendar page with project events."""
     return render(request, 'project_calendar.html')
 
-def project_events(request):
-    """Returns a JSON response with project events for FullCalendar."""
-    projects = Project.objects.all().order_by('planned_start_date')
-    events = []
-    for project in projects:
-        start_date = project.actual_start_date if project.actual_start_date else project.planned_start_date
-        end_date = project.actual_end_date if project.actual_end_date else project.revised_target_end_date or project.original_target_end_date
-
-        # Skip projects that don't have a start or end date
-        if start_date and end_date:
-            # Determine the background colour
-            background_colour = get_cycled_colour(project.pk)
-            
-            # Add 'Closed' to closed projects and mute the colour for better visibility
-            if project.project_status == 7:
-                project_name = project.project_name + ' (Closed)'
-                background_colour = mute_colour(background_colour)
-            else:
-                project_name = project.project_name
-
-            # Set the text colour based on the background colour
-            text_colour = get_text_colour_based_on_background(background_colour)
-            
-            events.append({
-                'title': project_name,
-                'start': start_date.strftime('%Y-%m-%d'),
-                'end': (end_date + timedelta(days=1)).strftime('%Y-%m-%d'),  # Add one day to include end date
-                'url': reverse('project_detail', args=[project.pk]),  # Link to project detail page
-                'color': background_colour,  # Background colour for the event
-                'textColor': text_colour,  # Text colour based on the background
-                'allDay': True,
-            })
-    return JsonResponse(events, safe=False)
-
-def get_cycled_colour(id):
-    """Generate a color based on the project ID."""
-    # Predefined list of colors to cycle through using site colours
-    colours = ['#2780e3', '#3fb618', '#9954bb', '#ff7518','#ff0039']
-    return colours[id % len(colours)]  # Cycle through the list based on the id
-
-def mute_colour(hex_colour, factor=0.5):
-    """Lightens the given hex color by blending it with white to make it more subtle.
-    
-    The factor determines how much of the white to blend in.
-    Default factor of 0.5 makes the color half as intense.
-    """
-    # Remove '#' if it exists
-    hex_colour = hex_colour.lstrip('#')
-
-    # Convert hex to RGB
-    r = int(hex_colour[0:2], 16)
-    g = int(hex_colour[2:4], 16)
-    b = int(hex_colour[4:6], 16)
+@cache_control(private=True, no_cache=True)  # Browsers keep the events but always check them with the ETag
+async def project_events(request):
+    """Returns a JSON response with project events for FullCalendar, limited to the requested start/end window.
+    Repeat requests are answered from the cache, or with a 304 when the calendar already has the events.
+    The conditional GET is handled here rather than by @condition, whose ETag function can't await the stamp query."""
+    start, end = parse_calendar_window(request.GET)
+    stamp = await aproject_events_stamp()
+    etag = quote_etag(project_events_etag(stamp, start, end))
+    last_modified = int(stamp[0].timestamp()) if stamp[0] else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        payload = await aget_project_events_payload(stamp, start, end)
+        response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+def _task_events_stamp(request, project_id):
+    if not hasattr(request, '_task_events_stamp'):
+        request._task_events_stamp = project_tasks_stamp(project_id)
+    return request._task_events_stamp
+
+def _task_events_etag(request, project_id):
+    start, end = parse_calendar_window(request.GET)
+    return project_events_etag(_task_events_stamp(request, project_id), start, end)
+
+def _task_events_last_modified(request, project_id):
+    return _task_events_stamp(request, project_id)[0]
 
-    # Blend with white, which is represented as (255, 255, 255)
-    r = int(r + (255 - r) * factor)
-    g = int(g + (255 - g) * factor)
-    b = int(b + (255 - b) * factor)
-
-    # Ensure values stay within RGB limits (0-255)
-    r = max(0, min(255, r))
-    g = max(0, min(255, g))
-    b = max(0, min(255, b))
-
-    # Convert back to hex
-    muted_hex = f'#{r:02x}{g:02x}{b:02x}'
-
-    return muted_hex
-
-def get_text_colour_based_on_background(hex_colour):
-    """Returns the ideal text color (black or white) based on the brightness of the given hex color."""
-    # Remove the hash if it exists
-    hex_colour = hex_colour.lstrip('#')
-
-    # Convert hex to RGB
-    r = int(hex_colour[0:2], 16)
-    g = int(hex_colour[2:4], 16)
-    b = int(hex_colour[4:6], 16)
-
-    # Calculate the luminance using a weighted average
-    # These weights are based on the human eye's sensitivity to each colour channel
-    luminance = (0.299 * r + 0.587 * g + 0.114 * b)
-
-    # If the luminance is high, use black text; otherwise, use white text
-    return '#000000' if luminance > 146 else '#FFFFFF' # This was originally 186 - changed to 146 as it seemed better to me
-
-def extract_pdf_text(file_path):
-    try:
-        text = extract_text(file_path)
-        return text
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return ""
-
-class ProjectTaskCalendarView(LoginRequiredMixin, DetailView):
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_task_events_etag, last_modified_func=_task_events_last_modified)
+def project_task_events(request, project_id):
+    """Returns the task calendar events for one project, limited to the requested start/end window.
+    A refetch of a window whose tasks have not changed gets a 304."""
+    get_object_or_404(Project, id=project_id)
+    start, end = parse_calendar_window(request.GET)
+    return JsonResponse(build_task_events(project_id, start, end), safe=False)
+
+class ProjectTaskCalendarView(ProjectScopedMixin, LoginRequiredMixin, DetailView):
     model = Project
     template_name = 'project_task_calendar.html'
 
-    def get_object(self):
-        # Retrieve the project object using project_id instead of pk
-        project_id = self.kwargs.get('project_id')
-        return get_object_or_404(Project, id=project_id)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project = self.get_object()
+        project = self.project
 
         # Determine project start date (Actual Start Date preferred, otherwise Planned Start Date)
         project_start_date = project.actual_start_date or project.planned_start_date
@@ -1378,61 +989,10 @@ class ProjectTaskCalendarView(LoginRequiredMixin, DetailView):
             project.original_target_end_date
         )
 
-        # Filter tasks for the current project
-        tasks = Task.objects.filter(project=project)
-
-        # Prepare task data for FullCalendar
-        task_events = []
-        colors = {
-            1: '#373a3c',  # Low (Grey)
-            2: '#3fb618',  # Medium (Green)
-            3: '#ff7518',  # High (Yellow)
-            4: '#f0ad4e',  # Critical (Orange)
-            5: '#ff0039',  # Urgent (Red)
-        }
-
-        for task in tasks:
-            # Determine start and end dates for each task
-            start_date = task.actual_start_date or task.planned_start_date
-            end_date = task.actual_end_date or task.planned_end_date
-
-            # Set color and title for completed tasks
-            if task.task_status == 3:  # Assuming status ID 3 means 'Completed'
-                background_colour = '#808080'  # Grey
-                task_title = f'{task.task_name} (Completed)'  # Add '(Completed)' to the task name
-            else:
-                # Use the priority color or fallback to grey
-                background_colour = colors.get(task.priority)
-                task_title = task.task_name
-
-            # Get ideal text color based on the background color
-            text_color = get_text_colour_based_on_background(background_colour)
-
-            if start_date and end_date:
-                task_events.append({
-                    'title': task_title,
-                    'start': str(start_date),
-                    'end': str(end_date + timedelta(days=1)),  # FullCalendar uses exclusive end dates
-                    'backgroundColor': background_colour,
-                    'borderColor': background_colour,
-                    'textColor': text_color,
-                    'url': reverse('task_detail', kwargs={'project_id': project.pk, 'task_id': task.pk}),
-                })
-
-            # Add a separate event for the due date if it exists, but only if the task is not completed
-            if task.due_date and task.task_status != 3:
-                task_events.append({
-                    'title': f'{task.task_name} (Due)',
-                    'start': str(task.due_date),
-                    'end': str(task.due_date),
-                    'backgroundColor': '#000000',  # Tomato color for due date
-                    'borderColor': '#FF6347',
-                    'textColor': '#FFFFFF',  # Black text for due dates
-                    'url': reverse('task_detail', kwargs={'project_id': project.pk, 'task_id': task.pk}),
-                })
+        # Task events are loaded by the calendar for the dates it is showing, from project_task_events
+        context['task_events_url'] = reverse('project_task_events', kwargs={'project_id': project.pk})
 
         # Add calculated project start and end dates to the context
-        context['task_events'] = task_events
         context['project_start_date'] = project_start_date
         context['project_end_date'] = project_end_date
         return context
@@ -1458,8 +1018,39 @@ def add_comment(request, content_type, object_id):
 
         # Redirect back to the detail view of the commented object
         return redirect(related_object.get_absolute_url())  # Ensure `get_absolute_url` is defined in models
+
+@login_required
+def object_comments(request, content_type, object_id):
+    """
+    Returns a page of the newest comments on an object as JSON. Pass the `next` value back as
+    `before` to get the page of older comments after it.
+    """
+    if content_type not in COMMENTABLE_MODELS:
+        raise Http404('Comments are not kept for this type of object')
+    related_object = get_object_or_404(COMMENTABLE_MODELS[content_type], pk=object_id)
+    before = request.GET.get('before')
+    if before is not None and not before.isdigit():
+        return JsonResponse({'error': 'Invalid comment id'}, status=400)
+    try:
+        limit = max(min(int(request.GET.get('limit') or COMMENTS_PAGE_SIZE), 100), 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    comments, has_more = comment_page(related_object, int(before) if before else None, limit)
+    return JsonResponse({
+        'comments': [
+            {
+                'id': comment.pk,
+                'user': str(comment.user),
+                'comment_text': comment.comment_text,
+                'created_datetime': comment.created_datetime.isoformat(),
+            }
+            for comment in comments
+        ],
+        'next': comments[-1].pk if has_more else None,
+    })
     
-class AttachmentListView(LoginRequiredMixin, ListView):
+class AttachmentListView(ProjectScopedMixin, LoginRequiredMixin, ListView):
     model = Attachment
     template_name = 'project_attachments_list.html'
     context_object_name = 'attachments'
@@ -1470,139 +1061,112 @@ class AttachmentListView(LoginRequiredMixin, ListView):
         return Attachment.objects.filter(project_id=project_id)
 
     def get_context_data(self, **kwargs):
-        # Add the project instance to the context
         context = super().get_context_data(**kwargs)
-        context['project'] = get_object_or_404(Project, id=self.kwargs['project_id'])
         context['form'] = AttachmentForm()  # Include the form to handle new uploads
         return context
 
-class AttachmentCreateView(LoginRequiredMixin, CreateView):
+@method_decorator(csrf_exempt, name='dispatch')
+class AttachmentCreateView(ProjectScopedMixin, LoginRequiredMixin, CreateView):
     model = Attachment
     form_class = AttachmentForm
     http_method_names = ['post']  # Only allow POST since Dropzone uploads files automatically
 
+    def dispatch(self, request, *args, **kwargs):
+        # The upload handler has to be swapped before anything reads the request body - including the
+        # CSRF check, which is why it is exempted above and run here instead
+        request.upload_handlers = [BlobUploadHandler(request)]
+        return self._protected_dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def _protected_dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
+        project = self.project
         file = request.FILES.get('file')
         description = request.POST.get('description', 'No description provided')
 
         if file:
-            # Corrected storage path to avoid double 'media/'
-            folder_path = os.path.join(settings.MEDIA_ROOT, str(project.id))
-            fs = FileSystemStorage(location=folder_path, base_url=f'{settings.MEDIA_URL}{project.id}/')
-            filename = fs.save(file.name, file)
-            file_url = fs.url(filename)
+            # Stored once by its SHA-256, however many times the same file is uploaded
+            blob, content_type = store_upload(file)
 
             # Create the Attachment instance and save it
             attachment = Attachment(
                 project=project,
                 uploaded_by=request.user,
-                file=os.path.join(str(project.id), filename),  # Save relative path from MEDIA_ROOT
+                file=blob.file.name,  # Relative path from MEDIA_ROOT
+                blob=blob,
+                content_type=content_type,
                 description=description,
                 filename=file.name  # Save the filename properly here
             )
             attachment.save()
 
+            # The text for previews is extracted in the background once the upload is saved
+            queue_extraction(attachment)
+
+            file_url = reverse('download_attachment', kwargs={'project_id': project.id, 'attachment_id': attachment.id})
             return JsonResponse({'message': 'File uploaded successfully!', 'file_url': file_url, 'description': description}, status=200)
         else:
             return JsonResponse({'error': 'No file provided'}, status=400)
 
 class AttachmentDownloadView(LoginRequiredMixin, View):
-    def get(self, request, *args, **kwargs):
-        attachment = get_object_or_404(Attachment, id=self.kwargs['attachment_id'], project_id=self.kwargs['project_id'])
-        file_path = os.path.join(settings.MEDIA_ROOT, attachment.file.name)
-
-        if os.path.exists(file_path):
-            response = FileResponse(open(file_path, 'rb'), content_type='application/octet-stream')
-
-            # Set the header to `inline` to allow the browser to try to open the file
-            response['Content-Disposition'] = f'inline; filename="{os.path.basename(file_path)}"'
-
-            return response
-        else:
-            messages.error(request, "The requested file does not exist.")
-            return redirect('project_attachments', project_id=self.kwargs['project_id'])
-
-class AttachmentPreviewView(LoginRequiredMixin, View):
+    """ Sends an attachment with its detected type (if safe to open inline), a strong ETag and support for byte ranges (resumed downloads, PDF viewers) """
     def get(self, request, *args, **kwargs):
         attachment = get_object_or_404(
-            Attachment,
-            id=self.kwargs['attachment_id'],
-            project_id=self.kwargs['project_id']
+            Attachment.objects.select_related('blob'), id=self.kwargs['attachment_id'], project_id=self.kwargs['project_id']
         )
         file_path = os.path.join(settings.MEDIA_ROOT, attachment.file.name)
 
         if os.path.exists(file_path):
-            extension = os.path.splitext(attachment.file.name.lower())[1]
-
-            handlers = {
-                '.msg': self.handle_msg_file,
-                '.docx': self.handle_docx_file,
-                '.pdf': self.handle_pdf_file,
-                '.txt': self.handle_txt_file,
-            }
-
-            handler = handlers.get(extension)
-            if handler:
-                return handler(file_path)
+            if attachment.blob:
+                etag = attachment.blob.sha256
             else:
-                return JsonResponse({'error': 'This file type is not supported for preview.'}, status=200)
+                # Uploaded before the blob store - the file is never rewritten, so its size and time identify it
+                stat = os.stat(file_path)
+                etag = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+            content_type = attachment.content_type or mimetypes.guess_type(attachment.filename)[0] or 'application/octet-stream'
+            return file_download(request, file_path, etag, int(attachment.uploaded_at.timestamp()), content_type, attachment.filename)
         else:
-            return JsonResponse({'error': 'File not found'}, status=404)
-
-    def handle_msg_file(self, file_path):
-        try:
-            msg = extract_msg.Message(file_path)
-            preview_data = {
-                'type': 'email',
-                'from': msg.sender,
-                'to': msg.to,
-                'subject': msg.subject,
-                'has_attachments': len(msg.attachments) > 0,
-                'body': msg.body[:500]  # First 500 characters of the body text
-            }
-            return JsonResponse(preview_data, status=200)
-        except Exception as e:
-            return JsonResponse({'error': f'Could not parse email: {str(e)}'}, status=200)
-
-    def handle_docx_file(self, file_path):
-        try:
-            text = docx2txt.process(file_path)
-            preview_data = {
-                'type': 'docx',
-                'body': text[:500]  # First 500 characters of the document text
-            }
-            return JsonResponse(preview_data, status=200)
-        except Exception as e:
-            return JsonResponse({'error': f'Could not parse document: {str(e)}'}, status=200)
-
-    def handle_pdf_file(self, file_path):
-        try:
-            text = extract_pdf_text(file_path)
-            preview_data = {
-                'type': 'pdf',
-                'body': text[:500]  # First 500 characters of the PDF text
-            }
-            return JsonResponse(preview_data, status=200)
-        except Exception as e:
-            return JsonResponse({'error': f'Could not parse PDF: {str(e)}'}, status=200)
-
-    def handle_txt_file(self, file_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            preview_data = {
-                'type': 'txt',
-                'body': text[:500]  # First 500 characters of the text file
-            }
-            return JsonResponse(preview_data, status=200)
-        except Exception as e:
-            return JsonResponse({'error': f'Could not read text file: {str(e)}'}, status=200)
+            messages.error(request, "The requested file does not exist.")
+            return redirect('attachment_list', project_id=self.kwargs['project_id'])
 
-    def generate_pdf_thumbnail(self, attachment):
-        # Existing code to generate PDF thumbnail
-        # Ensure this method is also within the class and properly indented
-        pass  # Replace with your actual implementation
+@method_decorator(alogin_required, name='dispatch')
+class AttachmentPreviewView(View):
+    """
+    Returns the preview of an attachment's text. The text is extracted once per upload by the worker pool
+    (see attachment_helpers.py), so this is a single lookup rather than parsing the file on every request.
+    """
+    async def get(self, request, *args, **kwargs):
+        extraction = await alatest_extraction(self.kwargs['project_id'], self.kwargs['attachment_id'])
+        if extraction is None or is_stale(extraction):
+            # Uploaded before previews were extracted, or its extraction was lost, so it is queued now
+            attachment = await aget_object_or_404(
+                Attachment,
+                id=self.kwargs['attachment_id'],
+                project_id=self.kwargs['project_id']
+            )
+            # Hashing the file (and parsing it, without a worker pool) blocks, so it runs on a thread
+            extraction = await sync_to_async(queue_extraction)(attachment)
+
+        if extraction.status == 1:  # Pending
+            return JsonResponse({'status': 'pending', 'error': 'The preview is still being prepared.'}, status=202)
+        if extraction.status == 5:  # File Missing
+            return JsonResponse({'error': extraction.error}, status=404)
+        if extraction.status != 2:  # Failed or Not Supported
+            return JsonResponse({'error': extraction.error}, status=200)
+
+        preview_data = {'type': extraction.file_type, 'body': extraction.preview}
+        if extraction.file_type == 'email':
+            preview_data.update({
+                'from': extraction.sender,
+                'to': extraction.recipients,
+                'subject': extraction.subject,
+                'has_attachments': extraction.has_attachments,
+            })
+        elif extraction.file_type == 'pdf':
+            preview_data['page_count'] = extraction.page_count
+        return JsonResponse(preview_data, status=200)
 
 class AssetListView(LoginRequiredMixin, ListView):
     model = Asset
@@ -1668,75 +1232,15 @@ class AssetListView(LoginRequiredMixin, ListView):
         # Fetching all assets
         assets = Asset.objects.all()
 
-        # Collecting stats for each asset based on the view type
-        asset_stats = []
-        for asset in assets:
-            if is_now_view:
-                # "Now" view: Show current open projects and open tasks
-                open_projects_owned = Project.objects.filter(
-                    project_owner=asset,
-                    project_status__in=[1, 3, 4, 5, 6]  # Exclude Closed (Status 7)
-                )
-                open_tasks_assigned = Task.objects.filter(
-                    assigned_to=asset,
-                    task_status=2  # Only Assigned tasks
-                ).count()
-                closed_tasks_assigned = Task.objects.filter(
-                    assigned_to=asset,
-                    task_status=3  # Completed tasks
-                ).count()
-
-                # Calculate percentage of open tasks assigned to the asset
-                total_open_tasks = Task.objects.filter(task_status=2).count()  # Only Assigned tasks
-                percentage_of_open_tasks = (open_tasks_assigned / total_open_tasks * 100) if total_open_tasks > 0 else 0
-
-                # Calculate percentage of closed tasks assigned to the asset
-                total_closed_tasks = Task.objects.filter(task_status=3).count()
-                percentage_of_closed_tasks = (closed_tasks_assigned / total_closed_tasks * 100) if total_closed_tasks > 0 else 0
-
-                asset_stats.append({
-                    'asset': asset,
-                    'projects_owned': open_projects_owned.count(),
-                    'open_tasks_assigned': open_tasks_assigned,
-                    'percentage_of_open_tasks': percentage_of_open_tasks,
-                    'closed_tasks_assigned': closed_tasks_assigned,
-                    'percentage_of_closed_tasks': percentage_of_closed_tasks,
-                })
-
-            else:
-                # Time-based view: Show stats for a specific period
-                completed_tasks = Task.objects.filter(
-                    assigned_to=asset,
-                    task_status=3,  # Completed
-                    actual_end_date__range=(start_date, end_date)
-                )
-                num_completed_tasks = completed_tasks.count()
-
-                # Aggregating total time spent on completed tasks in the date range
-                total_time_spent = sum(
-                    [task.actual_time_to_complete for task in completed_tasks if task.actual_time_to_complete],
-                    timedelta()
-                )
-                avg_time_per_task = (
-                    total_time_spent / num_completed_tasks if num_completed_tasks > 0 else timedelta()
-                )
-                avg_time_per_task_hours = avg_time_per_task.total_seconds() / 3600 if num_completed_tasks > 0 else 0
-
-                # Calculate percentage of tasks completed by asset in the date range
-                total_tasks_in_period = Task.objects.filter(
-                    task_status=3,
-                    actual_end_date__range=(start_date, end_date)
-                ).count()
-                percentage_of_tasks = (num_completed_tasks / total_tasks_in_period * 100) if total_tasks_in_period > 0 else 0
-
-                # Adding stats to list
-                asset_stats.append({
-                    'asset': asset,
-                    'tasks_completed': num_completed_tasks,
-                    'total_time_spent_hours': total_time_spent.total_seconds() / 3600 if total_time_spent else 0,
-                    'avg_time_per_task_hours': avg_time_per_task_hours,
-                    'percentage_of_tasks': percentage_of_tasks,
-                })
+        # Collecting stats for every asset based on the view type, using grouped queries rather than queries per asset
+        if is_now_view:
+            asset_stats = asset_workload_now(assets)
+        else:
+            asset_stats = asset_workload_for_period(assets, start_date, end_date)
+            # Planned load against the hours each asset works in the period
+            capacity = asset_capacity(assets, start_date, end_date)
+            for stat in asset_stats:
+                stat['capacity'] = capacity[stat['asset'].pk]
 
         # Add asset stats to the context
         context['asset_stats'] = asset_stats
@@ -1755,15 +1259,13 @@ class AssetDetailView(LoginRequiredMixin, DetailView):
         asset = self.get_object()
 
         # Gathering additional context information
-        projects_owned_queryset = Project.objects.filter(project_owner=asset).order_by('-priority')
-        projects_owned_count = projects_owned_queryset.count()  # Count of projects owned
+        # Task figures and RAG status for each project come from the project rollups
+        projects_owned = attach_rollups(Project.objects.filter(project_owner=asset).order_by('-priority'))
+        projects_owned_count = len(projects_owned)  # Count of projects owned
 
         # Separate open and closed projects owned by the asset
-        projects_owned_open = projects_owned_queryset.exclude(project_status=7)  # Status 7 is 'Closed'
-        projects_owned_closed = projects_owned_queryset.filter(project_status=7)
-
-        projects_owned_open_count = projects_owned_open.count()
-        projects_owned_closed_count = projects_owned_closed.count()
+        projects_owned_closed_count = sum(1 for project in projects_owned if project.project_status == 7)  # Status 7 is 'Closed'
+        projects_owned_open_count = projects_owned_count - projects_owned_closed_count
 
         # Gathering assigned tasks and sorting them as per the desired order
         assigned_tasks = Task.objects.filter(assigned_to=asset).order_by(
@@ -1771,23 +1273,22 @@ class AssetDetailView(LoginRequiredMixin, DetailView):
             '-priority',           # Task priority (descending)
             'planned_start_date'   # Planned start date (ascending)
         )
-        all_tasks_count = assigned_tasks.count()  # Count of tasks assigned to the asset
-        completed_tasks = assigned_tasks.filter(task_status=3).count()
-        incomplete_tasks = assigned_tasks.exclude(task_status=3).count()
-
-        # Calculate total time spent and average time per task
-        total_time_spent = sum(
-            [task.actual_time_to_complete for task in assigned_tasks if task.actual_time_to_complete],
-            timedelta()
+        # Counts and time spent come from one aggregate query, with the durations added up by the database
+        task_totals = assigned_tasks.aggregate(
+            completed_tasks=Count('pk', filter=Q(task_status=3)),
+            **time_aggregates()
         )
-        total_time_spent_hours = total_time_spent.total_seconds() / 3600 if total_time_spent else 0
+        all_tasks_count = task_totals['task_count']  # Count of tasks assigned to the asset
+        completed_tasks = task_totals['completed_tasks']
+        incomplete_tasks = all_tasks_count - completed_tasks
+        total_time_spent_hours = to_hours(task_totals['total_time'])
 
         average_time_per_task = (
             total_time_spent_hours / completed_tasks if completed_tasks > 0 else 0
         )
 
         # Adding the collected data to the context
-        context['projects_owned'] = projects_owned_queryset  # Pass the sorted queryset for the table
+        context['projects_owned'] = projects_owned  # Pass the sorted projects for the table
         context['projects_owned_count'] = projects_owned_count  # Pass the count for stats
         context['projects_owned_open_count'] = projects_owned_open_count
         context['projects_owned_closed_count'] = projects_owned_closed_count
@@ -1798,6 +1299,12 @@ class AssetDetailView(LoginRequiredMixin, DetailView):
         context['total_time_spent_hours'] = round(total_time_spent_hours, 2)
         context['average_time_per_task'] = round(average_time_per_task, 2)
 
+        # Planned load against the asset's work days and hours for the next few weeks
+        today = timezone.now().date()
+        dates, capacity, allocated = capacity_matrix([asset], today, today + timedelta(days=CAPACITY_LOOKAHEAD_DAYS - 1))
+        context['capacity'] = summarise_capacity(dates, capacity, allocated)[asset.pk]
+        context['weekly_capacity'] = weekly_capacity(dates, capacity[asset.pk], allocated[asset.pk])
+
         return context
 
 class SkillListView(LoginRequiredMixin, ListView):
@@ -1807,26 +1314,16 @@ class SkillListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        skills = Skill.objects.all()
-        skill_assets = []
-
-        # Check for skills without assigned assets
-        skills_without_assets_flag = False
-
-        for skill in skills:
-            assets_with_skill = Asset.objects.filter(skills=skill)
-            skill_assets.append({
-                'skill': skill,
-                'assets': assets_with_skill,
-            })
 
-            # If no assets have this skill, set the flag to True
-            if not assets_with_skill.exists():
-                skills_without_assets_flag = True
+        # Every skill with its assets and asset count, in two queries
+        skill_assets = [
+            {'skill': skill, 'assets': skill.members, 'asset_count': skill.asset_count}
+            for skill in skills_with_assets()
+        ]
 
         # Pass the collected data to the template context
         context['skill_assets'] = skill_assets
-        context['skills_without_assets'] = skills_without_assets_flag  # Flag for the warning message
+        context['skills_without_assets'] = any(not item['asset_count'] for item in skill_assets)  # Flag for the warning message
 
         return context
 
@@ -1837,23 +1334,18 @@ class SkillDetailView(LoginRequiredMixin, DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        skill = self.get_object()
+        skill = self.object
 
-        # Get tasks that include this skill
-        tasks_with_skill = Task.objects.filter(skills_required=skill)
+        # Get tasks that include this skill, with the project and assignee the table shows
+        tasks_with_skill = Task.objects.filter(skills_required=skill).select_related('project', 'assigned_to')
 
-        # Number of tasks using this skill
-        tasks_with_skill_count = tasks_with_skill.count()
+        # Number of tasks using this skill and the total time spent on them, added up by the database
+        skill_time = time_totals(tasks_with_skill)
+        tasks_with_skill_count = skill_time['task_count']
+        total_time_spent_hours = skill_time['total_hours']
 
-        # Get assets that have this skill
-        assets_with_skill = Asset.objects.filter(skills=skill)
-
-        # Calculate the total time spent on all tasks that require this skill
-        total_time_spent = sum(
-            [task.actual_time_to_complete for task in tasks_with_skill if task.actual_time_to_complete],
-            timedelta()
-        )
-        total_time_spent_hours = total_time_spent.total_seconds() / 3600 if total_time_spent else 0
+        # Get assets that have this skill, with their teams
+        assets_with_skill = with_memberships(live_assets().filter(skills=skill))
 
         # Calculate average time spent on tasks that use this skill
         average_time_per_task = (
@@ -1869,35 +1361,95 @@ class SkillDetailView(LoginRequiredMixin, DetailView):
 
         return context
 
-@login_required
-def filter_assets_by_skills(request):
+@alogin_required
+async def filter_assets_by_skills(request):
+    """
+    Returns the assets that have ALL the selected skills (or, with match=any, at least one of them,
+    most matching first). With rank=workload the assets with the fewest assigned tasks come first.
+    Matching is done against the in-memory skill index rather than a join per skill.
+    """
     if request.method == 'GET':
         skill_ids = request.GET.getlist('skills[]')
 
         # If skill_ids is empty, return no assets and clear 'filtered_assets' in session
         if not skill_ids:
-            request.session['filtered_assets'] = []
+            await asession_set(request, 'filtered_assets', [])
             return JsonResponse({'assets': []})
 
-        # Filter assets that contain ALL the selected skills
-        assets = Asset.objects.all()
-        for skill_id in skill_ids:
-            assets = assets.filter(skills__pk=skill_id)
+        if not all(skill_id.isdigit() for skill_id in skill_ids):
+            return JsonResponse({'error': 'Invalid skill id'}, status=400)
+        skill_ids = [int(skill_id) for skill_id in skill_ids]
 
-        # Eliminate duplicates and prepare response data
-        assets_list = [{'asset_id': asset.asset_id, 'name': asset.name} for asset in assets.distinct()]
+        index = await aget_skill_index()
+        if request.GET.get('match') == 'any':
+            overlap = dict(index.having_any(skill_ids))
+            asset_ids = list(overlap)
+        else:
+            overlap = None
+            asset_ids = index.having_all(skill_ids)
+
+        open_tasks = None
+        if request.GET.get('rank') == 'workload':
+            asset_ids, open_tasks = await arank_by_workload(asset_ids)
+
+        assets_list = []
+        for asset_id in asset_ids:
+            asset = {'asset_id': asset_id, 'name': index.names[asset_id]}
+            if overlap is not None:
+                asset['matched_skills'] = overlap[asset_id]
+            if open_tasks is not None:
+                asset['open_tasks'] = open_tasks.get(asset_id, 0)
+            assets_list.append(asset)
 
         # Save the asset_ids to the session
-        request.session['filtered_assets'] = [asset.asset_id for asset in assets.distinct()]
+        await asession_set(request, 'filtered_assets', asset_ids)
 
         return JsonResponse({'assets': assets_list})
 
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
-def get_prereq_task_dates(request):
+@login_required
+def assignee_recommendations(request):
+    """
+    Returns the best assets for a task, scored on skill coverage, free time in the planned window and
+    current assigned tasks. Takes the selected skills[], start_date, end_date and estimate (hours).
+    """
+    skill_ids = request.GET.getlist('skills[]')
+    if not all(skill_id.isdigit() for skill_id in skill_ids):
+        return JsonResponse({'error': 'Invalid skill id'}, status=400)
+    try:
+        start_date = parse_date(request.GET.get('start_date', ''))
+        end_date = parse_date(request.GET.get('end_date', ''))
+        hours = float(request.GET.get('estimate') or 0)
+        k = min(int(request.GET.get('k') or DEFAULT_RECOMMENDATIONS), 50)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+
+    recommendations = recommend_assignees([int(skill_id) for skill_id in skill_ids], start_date, end_date, hours, k)
+    return JsonResponse({'assets': recommendations})
+
+@login_required
+@permission_required('application.change_task', raise_exception=True)
+@require_POST
+def project_auto_assign(request, project_id):
+    """ Assigns every unassigned task on the project to the best available asset """
+    project = get_object_or_404(Project, id=project_id)
+    if project.project_status == 7:  # Closed
+        messages.error(request, "This project is closed and its tasks cannot be assigned.")
+        return redirect('project_taskview', project_id=project.id)
+
+    plan = assign_unassigned_tasks([project.id])
+    assigned = sum(1 for task_id, asset_id in plan if asset_id is not None)
+    if plan:
+        messages.success(request, f"{assigned} of {len(plan)} unassigned task(s) have been assigned.")
+    else:
+        messages.info(request, "There are no unassigned tasks on this project.")
+    return redirect('project_taskview', project_id=project.id)
+
+async def get_prereq_task_dates(request):
     task_id = request.GET.get('task_id')
     if task_id:
-        task = get_object_or_404(Task, id=task_id)
+        task = await aget_object_or_404(Task, id=task_id)
         
         if task.task_status == 3:  # Assuming 'Completed'
             response_data = {
@@ -1914,53 +1466,34 @@ def get_prereq_task_dates(request):
     
     return JsonResponse({'error': 'Task not found'}, status=404)
 
-class ProjectGanttChartView(LoginRequiredMixin, TemplateView):
+class ProjectGanttChartView(ProjectScopedMixin, LoginRequiredMixin, TemplateView):
     template_name = 'project_gantt_chart.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        project = get_object_or_404(Project, id=self.kwargs['project_id'])
-        tasks = Task.objects.filter(project=project)
-
-        # Map priorities to existing CSS classes in jsgantt.css
-        priority_css_classes = {
-            1: 'gtaskblue',   # Low Priority
-            2: 'gtaskgreen',  # Medium Priority
-            3: 'gtaskyellow', # High Priority
-            4: 'gtaskred',    # Critical Priority
-            5: 'gtaskpurple', # Urgent Priority
-        }
-
-        # Prepare task data including dependencies and resources for the Gantt chart
-        task_data = []
-        for task in tasks:
-            start_date = task.actual_start_date or task.planned_start_date
-            end_date = task.actual_end_date or task.planned_end_date
-
-            # Get the assigned asset if available
-            assigned_asset_name = task.assigned_to.name if task.assigned_to else ""
-            assigned_asset_id = task.assigned_to.asset_id if task.assigned_to else None
-
-            if start_date and end_date:
-                css_class = priority_css_classes.get(task.priority, 'gtaskblue')  # Default to 'gtaskblue' if priority not found
-                task_data.append({
-                    'id': task.id,
-                    'name': escape(task.task_name),
-                    'start': str(start_date),
-                    'end': str(end_date),
-                    'dependencies': str(task.prereq_task.id) if task.prereq_task else "",
-                    'progress': 100 if task.task_status == 3 else 0,
-                    'priority': task.priority,
-                    'css_class': css_class,
-                    'url': reverse('task_detail', kwargs={'project_id': project.pk, 'task_id': task.pk}),
-                    'resource': assigned_asset_name,  # Add the asset name to the task data
-                    'resource_id': assigned_asset_id,  # Add the asset id to the task data
-                })
-
-        context['project'] = project
-        context['task_data'] = json.dumps(task_data)
+
+        # The chart loads its tasks from project_gantt_data, then asks for changes every so often
+        context['gantt_data_url'] = reverse('project_gantt_data', kwargs={'project_id': self.project.pk})
         return context
 
+@login_required
+def project_gantt_data(request, project_id):
+    """Returns the Gantt chart tasks for a project. With ?since=<version> only the tasks changed since that version,
+    the ids of soft deleted ones and the ids of every task still on the chart are returned, so the chart can
+    refresh without reloading everything."""
+    get_object_or_404(Project, id=project_id)
+    since = parse_gantt_version(request.GET.get('since'))
+    return JsonResponse(gantt_data(project_id, since))
+
+@login_required
+def portfolio_gantt_data(request):
+    """Streams the Gantt chart tasks for several projects (?projects=1&projects=2), one line of JSON per project.
+    Without any projects, all projects that are not closed are included."""
+    project_ids = [value for value in request.GET.getlist('projects') if value.isdigit()]
+    if not project_ids:
+        project_ids = Project.objects.exclude(project_status=7).values_list('id', flat=True)  # Exclude Closed (Status 7)
+    return StreamingHttpResponse(stream_portfolio_gantt(list(project_ids)), content_type='application/x-ndjson')
+
 
 class TeamDetailView(LoginRequiredMixin, DetailView):
     model = Team
@@ -1973,32 +1506,19 @@ class TeamDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        team = self.get_object()
+        team = self.object
         
-        # Get all members (assets) of this team
-        team_members = Asset.objects.filter(teams=team)
+        # Get all members (assets) of this team, with their project and task counts and skills
+        team_members = list(member_stats(Asset.objects.filter(teams=team)))
         
-        # Calculate statistics for each team member
+        # Calculate task completion percentage for each team member
         for member in team_members:
-            # Count projects owned by the member
-            member.projects_owned_count = member.project_set.count()
-            
-            # Count tasks assigned to the member
-            member.tasks_count = member.task_set.count()
-            
-            # Count completed tasks
-            member.completed_tasks_count = member.task_set.filter(task_status=3).count()
-            
-            # Calculate task completion percentage
-            if member.tasks_count > 0:
-                member.completion_percentage = (member.completed_tasks_count / member.tasks_count) * 100
-            else:
-                member.completion_percentage = 0
+            member.completion_percentage = completion_percentage(member.completed_tasks_count, member.tasks_count)
         
         context['team_members'] = team_members
-        context['member_count'] = team_members.count()
+        context['member_count'] = len(team_members)
         
-        # Team-wide statistics
+        # Team-wide statistics, from the prefetched skills
         context['total_skills'] = set()
         for member in team_members:
             context['total_skills'].update(member.skills.all())
@@ -2015,27 +1535,15 @@ class TeamListView(LoginRequiredMixin, ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        teams = Team.objects.all()
-        team_members = []
-        
-        # Check for teams without members
-        teams_without_members_flag = False
         
-        for team in teams:
-            # Get all members (assets) of this team
-            members = Asset.objects.filter(teams=team)
-            team_members.append({
-                'team': team,
-                'members': members,
-                'member_count': members.count()
-            })
-            
-            # If no members in this team, set the flag
-            if not members.exists():
-                teams_without_members_flag = True
+        # Every team with its members and member count, in two queries
+        team_members = [
+            {'team': team, 'members': team.members, 'member_count': team.member_count}
+            for team in teams_with_members()
+        ]
         
         # Pass the collected data to the template context
         context['team_members'] = team_members
-        context['teams_without_members'] = teams_without_members_flag  # Flag for warning message
+        context['teams_without_members'] = any(not item['member_count'] for item in team_members)  # Flag for warning message
         
         return context
\ No newline at end of file
@@ -80,8 +80,24 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'application.middleware.QueryBudgetMiddleware',
 ]
 
+# Query budgets for the performance middleware - a warning is logged when a view runs more queries than this
+PERFORMANCE_MONITORING = True
+PERFORMANCE_DEFAULT_QUERY_BUDGET = 50
+PERFORMANCE_QUERY_BUDGETS = {
+    'home': 15,
+    'dashboard_stats': 10,
+    'task_list_data': 15,
+    'asset_list': 15,
+    'asset_list_date_range': 15,
+}
+PERFORMANCE_SUMMARY_WINDOW = 100  # Number of recent requests per view kept for the rolling summary
+
+# Worker processes that extract attachment text for previews - 0 extracts it during the upload instead
+ATTACHMENT_EXTRACTION_WORKERS = 2
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [